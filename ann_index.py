@@ -0,0 +1,177 @@
+import math
+import numpy as np
+import faiss
+
+from model_config import (
+    FAISS_INDEX_TYPE,
+    FAISS_AUTO_IVF_PQ_AT,
+    FAISS_TRAIN_MIN_VECTORS,
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NLIST,
+    FAISS_IVF_NPROBE,
+    FAISS_PQ_M
+)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+TRAINED_INDEX_TYPES = ("ivf_flat", "ivf_pq")
+
+def choose_index_type(vector_count, configured=FAISS_INDEX_TYPE):
+    """Resolve the configured index type ("auto" picks by corpus size)"""
+    if configured != "auto":
+        if configured not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS_INDEX_TYPE '{configured}', expected one of {INDEX_TYPES} or 'auto'")
+        if configured in TRAINED_INDEX_TYPES and vector_count < FAISS_TRAIN_MIN_VECTORS:
+            return "flat"  # not enough vectors to train the quantizer yet
+        return configured
+    if vector_count < FAISS_TRAIN_MIN_VECTORS:
+        return "flat"
+    if vector_count < FAISS_AUTO_IVF_PQ_AT:
+        return "ivf_flat"
+    return "ivf_pq"
+
+def choose_nlist(vector_count):
+    if FAISS_IVF_NLIST:
+        return FAISS_IVF_NLIST
+    # ~4*sqrt(n) lists, capped so every list still gets ~39 training points
+    return int(max(16, min(4 * math.sqrt(vector_count), vector_count // 39, 65536)))
+
+def index_type_of(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def new_index(index_type, dimensions, vector_count=0):
+    """Create an empty (untrained) index of the given type, L2 metric throughout"""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimensions)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimensions, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        return index
+    quantizer = faiss.IndexFlatL2(dimensions)
+    nlist = choose_nlist(vector_count)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dimensions, nlist)
+    if index_type == "ivf_pq":
+        return faiss.IndexIVFPQ(quantizer, dimensions, nlist, FAISS_PQ_M, 8)
+    raise ValueError(f"Unknown index type '{index_type}'")
+
+def build_index(vectors, index_type, dimensions, ids=None):
+    """
+    Build, train (if needed) and fill an index from an (n, dimensions) array.
+
+    With `ids` the index is wrapped in an IndexIDMap2 and searches return those ids.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = new_index(index_type, dimensions, len(vectors))
+    if not index.is_trained:
+        max_train = index.nlist * 256
+        train = vectors
+        if len(vectors) > max_train:
+            rng = np.random.default_rng(0)
+            train = vectors[rng.choice(len(vectors), max_train, replace=False)]
+        index.train(train)
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(vectors)
+    apply_search_params(index)
+    return index
+
+def apply_search_params(index, nprobe=FAISS_IVF_NPROBE, ef_search=FAISS_HNSW_EF_SEARCH):
+    """Set query-time knobs (nprobe for IVF, efSearch for HNSW); no-op for flat"""
+    index_type = index_type_of(index)
+    params = faiss.ParameterSpace()
+    if index_type in TRAINED_INDEX_TYPES:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    elif index_type == "hnsw":
+        params.set_index_parameter(index, "efSearch", ef_search)
+    return index
+
+def unwrap_ids(index):
+    """Split an ID-mapped index into (inner index, ids in position order)"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index), faiss.vector_to_array(index.id_map)
+    return index, None
+
+def reconstruct_all(index):
+    """Return every stored vector in position order (lossy for ivf_pq)"""
+    index, _ = unwrap_ids(index)
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def needs_rebuild(index, vector_count=None):
+    """True when the index type (or IVF list count) no longer fits the corpus size"""
+    vector_count = index.ntotal if vector_count is None else vector_count
+    target = choose_index_type(vector_count)
+    current = index_type_of(index)
+    if target != current:
+        return True
+    if current in TRAINED_INDEX_TYPES:
+        nlist = faiss.try_extract_index_ivf(index).nlist
+        wanted = choose_nlist(vector_count)
+        return not (wanted / 2 <= nlist <= wanted * 2)
+    return False
+
+def rebuild_index(index, extra_vectors=None, extra_ids=None):
+    """
+    Rebuild `index` (plus any extra vectors) as the type chosen for the combined
+    size. ID-mapped indexes keep their ids.
+    """
+    vectors = reconstruct_all(index)
+    _, ids = unwrap_ids(index)
+    if extra_vectors is not None and len(extra_vectors):
+        vectors = np.concatenate([vectors, np.asarray(extra_vectors, dtype=np.float32)])
+        if ids is not None:
+            ids = np.concatenate([ids, np.asarray(extra_ids, dtype=np.int64)])
+    return build_index(vectors, choose_index_type(len(vectors)), index.d, ids=ids)
+
+def search_params(index, selector):
+    """
+    SearchParameters of the subclass the index expects, carrying `selector`
+    and the index's current nprobe/efSearch (IVF would otherwise fall back to
+    nprobe=1). Build one per search: ID-mapped indexes swap `sel` during a call.
+    """
+    inner, _ = unwrap_ids(index)
+    index_type = index_type_of(inner)
+    if index_type in TRAINED_INDEX_TYPES:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = faiss.extract_index_ivf(inner).nprobe
+    elif index_type == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = inner.hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    return params
+
+def remove_ids(index, ids):
+    """
+    Drop `ids` from an ID-mapped index. Done in place where the type supports
+    it; HNSW cannot remove, so it is rebuilt from its remaining vectors.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids) or index.ntotal == 0:
+        return index
+    if index_type_of(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+    vectors = reconstruct_all(index)
+    _, stored = unwrap_ids(index)
+    keep = ~np.isin(stored, ids)
+    return build_index(vectors[keep], "hnsw", index.d, ids=stored[keep])
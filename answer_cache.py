@@ -0,0 +1,99 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from lexical_index import code_terms
+
+class SemanticAnswerCache:
+    """
+    In-process cache of chat answers keyed by question embedding.
+
+    A question hits when its embedding has cosine similarity >= `threshold`
+    with a cached question asked against the same index version, and both
+    carry the same clause and item codes: "Clause 14.2" and "Clause 14.3"
+    embed almost identically but must not share an answer. Any other
+    version (documents added, replaced or deleted) empties the cache. Entries
+    expire after `max_age_seconds`; beyond `max_entries` the least recently
+    used are evicted.
+    """
+
+    def __init__(self, max_entries, max_age_seconds, threshold):
+        self.capacity = max_entries
+        self.max_age = max_age_seconds
+        self.threshold = threshold
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (question, unit vector, answer, pages, created, codes)
+        self._next_key = 0
+        self._matrix = None  # stacked vectors of _entries, rebuilt after changes
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def _set_version(self, version):
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+            self._matrix = None
+
+    def _purge_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry[4] > self.max_age]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, question, embedding, version):
+        """(answer, pages, similarity) of the closest cached question with the same codes, or None"""
+        vector = self._unit(embedding)
+        codes = tuple(sorted(code_terms(question)))
+        with self._lock:
+            self._set_version(version)
+            self._purge_expired(time.time())
+            if self._entries and self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key][1] for key in self._keys])
+            if not self._entries:
+                self.misses += 1
+                return None
+            similarities = self._matrix @ vector
+            same_codes = np.array([self._entries[key][5] == codes for key in self._keys])
+            similarities = np.where(same_codes, similarities, -np.inf)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            _, _, answer, pages, _, _ = self._entries[key]
+            return answer, pages, float(similarities[best])
+
+    def put(self, question, embedding, version, answer, pages):
+        with self._lock:
+            self._set_version(version)
+            self._entries[self._next_key] = (
+                question, self._unit(embedding), answer, list(pages), time.time(), tuple(sorted(code_terms(question)))
+            )
+            self._next_key += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "capacity": self.capacity,
+        }
@@ -1,12 +1,43 @@
+import time
+started_at = time.perf_counter()
 import streamlit as st
 from dotenv import load_dotenv
 import os
+import logging
 
 load_dotenv()
 
-from embedder import process_pdf, upload_chunks_to_faiss, is_pdf_already_uploaded, mark_pdf_as_uploaded, get_uploaded_pdfs_list, clear_uploaded_pdfs, clear_faiss_collection
-from excel_filler import fill_excel_with_rag
-from chat import rag_chat
+from model_config import LOG_LEVEL
+APP_LOGGERS = ("chat", "faiss_store", "ingest_worker")
+
+def configure_logging(level=LOG_LEVEL):
+    """
+    Show the app modules' logs (e.g. chat time to first token) on stderr at
+    `level`. Python's default only shows warnings; other libraries keep it.
+    Streamlit reruns this script, so a handler is only added once.
+    """
+    for name in APP_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+            logger.addHandler(handler)
+
+configure_logging()
+
+from startup import timed, record, start_warm_up, get_startup_report
+with timed("import embedder"):
+    from embedder import is_pdf_already_uploaded, get_pdf_hash, get_uploaded_pdfs_list
+from ingest_queue import get_ingest_queue
+from ingest_worker import ensure_worker_running
+from model_config import INGEST_POLL_SECONDS, INGEST_TASK_WAIT_SECONDS
+with timed("import excel_filler"):
+    from excel_filler import fill_excel_with_rag
+with timed("import chat"):
+    from chat import rag_chat_stream
+from local_models import get_local_embeddings, get_local_llm, get_llm_cache
+from faiss_store import get_faiss_vectorstore
 import pandas as pd
 import tempfile
 import shutil
@@ -314,6 +345,58 @@ st.markdown("""
     </script>
 """, unsafe_allow_html=True)
 
+def run_index_task(action, name=""):
+    """
+    Hand a delete or clear to the ingest worker, the only process that writes
+    the index, and wait for it. Returns the finished job, or None if it is
+    still pending (it then completes in the background).
+    """
+    job_id = get_ingest_queue().enqueue_task(action, name)
+    ensure_worker_running()
+    with st.spinner("Updating the index..."):
+        job = get_ingest_queue().wait(job_id, INGEST_TASK_WAIT_SECONDS, INGEST_POLL_SECONDS)
+    if job is None:
+        st.sidebar.info("The ingest worker is busy or starting; the change will be applied in the background.")
+    elif job["status"] == "failed":
+        st.sidebar.error(f"Index update failed: {job['error']}")
+    return job
+
+def render_ingest_progress(job_ids):
+    """Progress of this upload's ingest jobs; reruns the whole page once the last one finished"""
+    jobs = get_ingest_queue().get_jobs(job_ids)
+    for job_id in job_ids:
+        job = jobs[job_id]
+        name = job["pdf_filename"]
+        if job["status"] == "queued":
+            st.info(f"⏳ '{name}' is queued for indexing")
+        elif job["status"] == "running":
+            pages = f"page {job['pages_done']}/{job['pages_total']}" if job["pages_total"] else "starting"
+            st.progress(min(job["fraction"], 1.0), text=(
+                f"🔄 Indexing '{name}': {pages}, {job['chunks']} chunks ({job['pages_per_second']:.1f} pages/s)"
+            ))
+        elif job["status"] == "failed":
+            st.error(f"❌ Indexing '{name}' failed: {job['error']}")
+            if st.button("Retry", key=f"retry_ingest_{job_id}"):
+                get_ingest_queue().retry(job_id)
+                ensure_worker_running()
+                st.rerun()
+        elif job["kind"] == "skipped":
+            st.warning(f"📋 PDF '{name}' has already been processed and uploaded to database.")
+        else:
+            verb = "Replaced" if job["kind"] == "replace" else "Processed and uploaded"
+            st.success(
+                f"✅ {verb} '{name}': {job['pages_total']} pages, {job['chunks']} chunks in {job['elapsed']:.1f} s "
+                f"({job['pages_per_second']:.1f} pages/s, {job['chunks_per_second']:.1f} chunks/s)"
+            )
+    pending = any(job["status"] in ("queued", "running") for job in jobs.values())
+    if pending:
+        ensure_worker_running()
+    elif st.session_state.get("ingest_polling"):
+        # the last job just finished: run the page again to fill the Excel file
+        st.session_state.ingest_polling = False
+        st.rerun()
+    st.session_state.ingest_polling = pending
+
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
@@ -356,16 +439,40 @@ if st.sidebar.button("🔍 Test PDF Server"):
     """, unsafe_allow_html=True)
     st.sidebar.info("Check browser console for server status")
 
+with st.sidebar.expander("⏱️ Startup", expanded=False):
+    startup_timings, warm_up_status = get_startup_report()
+    st.caption(f"Models: {warm_up_status}")
+    for stage, seconds in startup_timings:
+        st.caption(f"{stage}: {seconds:.2f} s")
+
+with st.sidebar.expander("📥 Ingest queue", expanded=False):
+    ingest_stats = get_ingest_queue().stats()
+    st.caption(", ".join(f"{count} {status}" for status, count in ingest_stats["counts"].items()))
+    st.caption(
+        f"Throughput: {ingest_stats['pages_per_second']:.1f} pages/s, "
+        f"{ingest_stats['chunks_per_second']:.1f} chunks/s over finished jobs"
+    )
+    for job in get_ingest_queue().recent_jobs(5):
+        label = job["pdf_filename"] if job["action"] == "ingest" else f"{job['action']} {job['pdf_filename']}".strip()
+        st.caption(f"#{job['id']} {label}: {job['status']}, {job['chunks']} chunks in {job['elapsed']:.1f} s")
+
 st.sidebar.header("Uploaded PDFs")
 uploaded_pdfs_list = get_uploaded_pdfs_list()
 if uploaded_pdfs_list:
     st.sidebar.write("✅ **Already processed:**")
     for pdf in uploaded_pdfs_list:
-        st.sidebar.write(f"• {pdf}")
+        name_col, delete_col = st.sidebar.columns([5, 1])
+        name_col.write(f"• {pdf}")
+        if delete_col.button("🗑️", key=f"delete_pdf_{pdf}", help=f"Remove {pdf} from the index"):
+            job = run_index_task("delete", pdf)
+            if job and job["status"] == "done":
+                st.sidebar.success(f"Removed '{pdf}' ({job['chunks']} chunks)")
+                st.rerun()
     if st.sidebar.button("🗑️ Clear All Uploaded PDFs"):
-        clear_uploaded_pdfs()
-        st.sidebar.success("All uploaded PDFs cleared!")
-        st.rerun()
+        job = run_index_task("clear")
+        if job and job["status"] == "done":
+            st.sidebar.success("All uploaded PDFs cleared!")
+            st.rerun()
 else:
     st.sidebar.write("No PDFs uploaded yet")
 
@@ -410,23 +517,28 @@ if uploaded_pdfs and uploaded_excel:
             # Store PDF permanently for serving
             store_pdf_permanently(pdf_temp.name, uploaded_pdf.name)
     
-    # Process each PDF for embeddings
-    for i, (pdf_path, pdf_filename) in enumerate(zip(temp_pdf_paths, pdf_filenames)):
+    # Queue each new or changed PDF for the background ingest worker
+    ingest_job_ids = []
+    for pdf_path, pdf_filename in zip(temp_pdf_paths, pdf_filenames):
         if is_pdf_already_uploaded(pdf_path, pdf_filename):
             st.warning(f"📋 PDF '{pdf_filename}' has already been processed and uploaded to database.")
         else:
-            st.info(f"🔄 Processing PDF {i+1}/{len(pdf_filenames)}: '{pdf_filename}'...")
-            chunks, metadatas = process_pdf(pdf_path, pdf_filename)
-            upload_chunks_to_faiss(chunks, metadatas, pdf_filename)
-            mark_pdf_as_uploaded(pdf_path, pdf_filename)
-            st.success(f"✅ Successfully processed and uploaded '{pdf_filename}'")
+            ingest_job_ids.append(get_ingest_queue().enqueue(pdf_path, pdf_filename, get_pdf_hash(pdf_path)))
+    ingest_pending = any(
+        job["status"] in ("queued", "running") for job in get_ingest_queue().get_jobs(ingest_job_ids).values()
+    )
+    if ingest_job_ids:
+        # polls the queue on its own while jobs are pending; the rest of the page stays usable
+        st.fragment(render_ingest_progress, run_every=INGEST_POLL_SECONDS if ingest_pending else None)(ingest_job_ids)
 
     # Only fill Excel if it hasn't been filled yet or files changed
-    if not st.session_state.excel_filled or files_changed:
+    if ingest_pending:
+        st.info("📊 The Excel file will be filled once the PDFs are indexed.")
+    elif not st.session_state.excel_filled or files_changed:
         with st.expander("📊 View Filled Excel Data", expanded=False):
             st.info(f"📊 Filling Excel file using AI from {len(pdf_filenames)} PDF(s)...")
             # Use the first PDF filename as fallback, but the function will use actual document names from metadata
-            filled_excel_path = fill_excel_with_rag(excel_path, pdf_filenames[0] if pdf_filenames else "multiple_pdfs")
+            filled_excel_path = fill_excel_with_rag(excel_path, pdf_filenames[0] if pdf_filenames else "multiple_pdfs", pdf_filenames)
             filled_df = pd.read_excel(filled_excel_path)
             
             # Store ORIGINAL data in session state (without HTML processing)
@@ -466,35 +578,42 @@ if uploaded_pdfs and uploaded_excel:
         os.unlink(temp_path)
     os.unlink(excel_path)
 
+def render_user_message(user_msg):
+    st.markdown(f"""
+    <div style="display: flex; margin-bottom: 10px; justify-content: flex-end;">
+        <div style="background-color: #dcf8c6; padding: 15px; border-radius: 15px; max-width: 70%; margin-left: 30%;">
+            <strong>You:</strong> {user_msg}
+        </div>
+        <div style="margin-left: 15px; font-size: 24px;">👤</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_assistant_message(bot_msg, target=st):
+    target.markdown(f"""
+    <div style="display: flex; margin-bottom: 20px;">
+        <div style="margin-right: 15px; font-size: 24px;">🤖</div>
+        <div style="background-color: #f1f1f1; padding: 15px; border-radius: 15px; max-width: 70%;">
+            <strong>Assistant:</strong> {bot_msg}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_sources(sources, target=st):
+    if sources:
+        target.markdown(f"""
+        <div style="margin-left: 50px; margin-bottom: 15px;">
+            <small style="color: #666;">📄 Source page(s): {', '.join(map(str, sources))}</small>
+        </div>
+        """, unsafe_allow_html=True)
+
 chat_container = st.container(height=350)
 with chat_container:
     if st.session_state.chat_history:
         for i, (user_msg, bot_msg, sources) in enumerate(st.session_state.chat_history):
-            st.markdown(f"""
-            <div style="display: flex; margin-bottom: 10px; justify-content: flex-end;">
-                <div style="background-color: #dcf8c6; padding: 15px; border-radius: 15px; max-width: 70%; margin-left: 30%;">
-                    <strong>You:</strong> {user_msg}
-                </div>
-                <div style="margin-left: 15px; font-size: 24px;">👤</div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown(f"""
-            <div style="display: flex; margin-bottom: 20px;">
-                <div style="margin-right: 15px; font-size: 24px;">🤖</div>
-                <div style="background-color: #f1f1f1; padding: 15px; border-radius: 15px; max-width: 70%;">
-                    <strong>Assistant:</strong> {bot_msg}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            if sources:
-                st.markdown(f"""
-                <div style="margin-left: 50px; margin-bottom: 15px;">
-                    <small style="color: #666;">📄 Source page(s): {', '.join(map(str, sources))}</small>
-                </div>
-                """, unsafe_allow_html=True)
-    else:
+            render_user_message(user_msg)
+            render_assistant_message(bot_msg)
+            render_sources(sources)
+    elif not st.session_state.get("pending_message"):
         st.info("💡 Start a conversation by typing a message below!")
 
 st.markdown("---")
@@ -506,19 +625,62 @@ def process_message():
     user_input = st.session_state.current_input
     if user_input and not st.session_state.processing:
         if uploaded_pdfs_list or (uploaded_pdfs and uploaded_excel):
+            # Answered below, streamed into the chat container during this run
             st.session_state.processing = True
-            try:
-                answer, sources = rag_chat(user_input, st.session_state.chat_history)
-                st.session_state.chat_history.append((user_input, answer, sources))
-                st.session_state.current_input = ""
-            except Exception as e:
-                st.error(f"Error processing message: {e}")
-            finally:
-                st.session_state.processing = False
+            st.session_state.pending_message = user_input
+            st.session_state.current_input = ""
         else:
             st.warning("⚠️ Please upload and process documents first!")
 
 user_input = st.text_input("", key="current_input", placeholder="Ask about the tender document...", label_visibility="collapsed", disabled=st.session_state.processing, on_change=process_message)
 
-if st.session_state.processing:
-    st.info("🤔 Processing your message...") 
\ No newline at end of file
+if st.session_state.get("pending_message"):
+    user_input = st.session_state.pending_message
+    st.session_state.pending_message = None
+    answer, sources, stats = "", [], None
+    try:
+        with chat_container:
+            render_user_message(user_input)
+            answer_placeholder = st.empty()
+            sources_placeholder = st.empty()
+            answer_placeholder.info("🤔 Searching the documents...")
+            for event, value in rag_chat_stream(user_input, st.session_state.chat_history):
+                if event == "sources":
+                    sources = value
+                    render_sources(sources, sources_placeholder)
+                elif event == "token":
+                    answer += value
+                    render_assistant_message(answer + " ▌", answer_placeholder)
+                elif event == "done":
+                    answer, stats = value["answer"], value
+                    render_assistant_message(answer, answer_placeholder)
+        st.session_state.chat_history.append((user_input, answer, sources))
+        st.session_state.last_chat_timing = stats
+        if stats:
+            st.session_state.setdefault("chat_latency", {}).setdefault(stats["mode"], []).append(stats["total_ms"])
+    except Exception as e:
+        st.error(f"Error processing message: {e}")
+    finally:
+        st.session_state.processing = False
+    st.rerun()  # re-enable the input box and redraw the history with this turn
+
+if st.session_state.get("last_chat_timing"):
+    timing = st.session_state.last_chat_timing
+    averages = "; ".join(
+        f"{mode}: {sum(turns) / len(turns) / 1000:.1f} s average over {len(turns)} turn(s)"
+        for mode, turns in st.session_state.get("chat_latency", {}).items()
+    )
+    st.caption(
+        f"Last answer ({timing['mode']}): question rewrite {timing['condense_ms']:.0f} ms, "
+        f"retrieval {timing['retrieval_ms']:.0f} ms ({timing.get('retrieval_source') or 'none'}), first token after {timing['ttft_ms']:.0f} ms, "
+        f"complete after {timing['total_ms'] / 1000:.1f} s. {averages}"
+    ) 
+
+# The page is up: load the models in the background so the first question or fill does not wait for them
+record("first page render", time.perf_counter() - started_at)
+start_warm_up([
+    ("embedding model", get_local_embeddings),
+    ("vector store", get_faiss_vectorstore),
+    ("Gemma", get_local_llm),
+    ("LLM response cache", get_llm_cache),
+])
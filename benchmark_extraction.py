@@ -0,0 +1,26 @@
+import argparse
+import sys
+
+from pdf_extraction import EXTRACTION_WORKERS, measure_pages_per_second
+
+# Mirrors embedder.CHUNK_SIZE / CHUNK_OVERLAP without importing the model stack
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure PDF extraction pages/second for 1 vs N workers")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS)
+    args = parser.parse_args()
+
+    print(f"Benchmarking extraction of {args.pdf_path}")
+    baseline = None
+    for workers in sorted({1, args.workers}):
+        pages, chunks, seconds, rate = measure_pages_per_second(args.pdf_path, CHUNK_SIZE, CHUNK_OVERLAP, workers)
+        baseline = baseline or rate
+        speedup = rate / baseline if baseline else 0.0
+        print(f"   workers={workers:<3} pages={pages:<6} chunks={chunks:<6} time={seconds:8.2f}s  {rate:8.1f} pages/s  x{speedup:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
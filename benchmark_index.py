@@ -0,0 +1,62 @@
+import argparse
+import sys
+import time
+import numpy as np
+import faiss
+
+from ann_index import INDEX_TYPES, build_index, apply_search_params
+from model_config import EMBEDDING_DIMENSIONS, FAISS_IVF_NPROBE, FAISS_HNSW_EF_SEARCH
+
+def make_corpus(count, dimensions, clusters=256, seed=0):
+    """Clustered synthetic vectors; uniform noise would make every ANN index look bad"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centers[labels] + 0.35 * rng.normal(size=(count, dimensions)).astype(np.float32)
+
+def measure(index, queries, k):
+    """Return (ids, p50_ms, p99_ms) for single-query searches, as the app issues them"""
+    latencies = []
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids[i] = found[0]
+    return ids, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and query latency of each index type against flat")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nprobe", type=int, default=FAISS_IVF_NPROBE)
+    parser.add_argument("--ef-search", type=int, default=FAISS_HNSW_EF_SEARCH)
+    args = parser.parse_args()
+
+    dimensions = EMBEDDING_DIMENSIONS
+    for size in [int(s) for s in args.sizes.split(",")]:
+        corpus = make_corpus(size, dimensions)
+        queries = make_corpus(args.queries, dimensions, seed=1)
+        flat = build_index(corpus, "flat", dimensions)
+        _, truth = flat.search(queries, args.k)
+
+        print(f"\n{size:,} vectors, {args.queries} queries, k={args.k}")
+        print(f"   {'type':<9} {'build s':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for index_type in args.types.split(","):
+            started = time.perf_counter()
+            index = flat if index_type == "flat" else build_index(corpus, index_type, dimensions)
+            build_seconds = time.perf_counter() - started
+            apply_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+            found, p50, p99 = measure(index, queries, args.k)
+            print(f"   {index_type:<9} {build_seconds:8.1f} {recall_at_k(found, truth):7.3f} {p50:8.3f} {p99:8.3f}")
+    return 0
+
+if __name__ == "__main__":
+    faiss.omp_set_num_threads(1)  # per-query latency, not batch throughput
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmark_store_load import rss_mb
+from context_builder import build_prompt
+from model_config import GEMMA_MODEL_PATH, CPU_THREADS
+
+# (item, context, terms a correct extraction must mention)
+SPOT_CHECKS = [
+    ("DI pipe 300 mm",
+     "Item 4.2: Supply of ductile iron pipes, 300 mm nominal diameter, class K9, "
+     "cement mortar lined, conforming to IS 8329. Rate includes loading and transport.",
+     ["300", "K9", "8329"]),
+    ("Sluice valve 200 mm",
+     "Sluice valves of 200 mm diameter, PN 1.6 rating, double flanged, cast iron body "
+     "with bronze spindle, as per IS 14846. Quantity: 12 nos.",
+     ["200", "PN 1.6", "14846"]),
+    ("Bulk flow meter",
+     "Electromagnetic flow meter, 250 mm, IP68, accuracy +/- 0.5 %, with remote display "
+     "and GSM data logger. Warranty 5 years from commissioning.",
+     ["250", "IP68", "0.5"]),
+    ("Earthwork in excavation",
+     "Earthwork in excavation in all kinds of soil up to 3 m depth for laying pipelines, "
+     "including dewatering, shoring and disposal of surplus soil within 1 km lead.",
+     ["3 m", "dewatering", "1 km"]),
+    ("Performance security",
+     "The successful bidder shall furnish a performance security of 5 % of the contract "
+     "value as a bank guarantee valid for 60 days beyond the defect liability period.",
+     ["5 %", "bank guarantee", "60 days"]),
+]
+
+def run_mode(model_path, mode, threads, max_new_tokens):
+    """Load one mode in this process and measure it; returns a JSON-able dict"""
+    import torch
+    from transformers import AutoTokenizer
+    from inference_profile import configure_cpu_threads, load_causal_lm
+
+    threads = configure_cpu_threads(threads) if mode != "gpu" else None
+    before = rss_mb()
+    started = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = load_causal_lm(model_path, mode)
+    load_seconds = time.perf_counter() - started
+    model_rss = rss_mb() - before
+
+    answers = []
+    generated = 0
+    generation_seconds = 0.0
+    for item, context, _ in SPOT_CHECKS:
+        inputs = tokenizer(build_prompt(item, context), return_tensors="pt").to(model.device)
+        started = time.perf_counter()
+        with torch.no_grad():
+            output = model.generate(
+                **inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.eos_token_id
+            )
+        generation_seconds += time.perf_counter() - started
+        new_tokens = output[0, inputs.input_ids.shape[1]:]
+        generated += len(new_tokens)
+        answers.append(tokenizer.decode(new_tokens, skip_special_tokens=True))
+    return {
+        "mode": mode, "threads": threads, "load_seconds": load_seconds, "rss_mb": model_rss,
+        "peak_rss_mb": rss_mb(), "tokens_per_second": generated / max(generation_seconds, 1e-9),
+        "answers": answers,
+    }
+
+def spot_check(answers):
+    """Fraction of expected terms found in each answer (case-insensitive)"""
+    scores = []
+    for answer, (_, _, terms) in zip(answers, SPOT_CHECKS):
+        found = [term for term in terms if term.lower() in answer.lower()]
+        scores.append(len(found) / len(terms))
+    return scores
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokens/second, RSS and a quality spot-check per inference mode")
+    parser.add_argument("--model", default=GEMMA_MODEL_PATH)
+    parser.add_argument("--modes", default="cpu_fp32,cpu_bf16,cpu_int8")
+    parser.add_argument("--threads", type=int, default=CPU_THREADS, help="0 = torch default")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--run-mode", help=argparse.SUPPRESS)  # child process: measure one mode, print JSON
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.model, args.run_mode, args.threads, args.max_new_tokens)))
+        return 0
+
+    # Each mode runs in its own process so RSS is not inflated by the previously loaded model
+    results = []
+    for mode in args.modes.split(","):
+        completed = subprocess.run(
+            [sys.executable, __file__, "--model", args.model, "--threads", str(args.threads),
+             "--max-new-tokens", str(args.max_new_tokens), "--run-mode", mode],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"{mode}: failed\n{completed.stderr.strip()[-2000:]}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    if not results:
+        return 1
+
+    reference = results[0]
+    print(f"   {'mode':<9} {'threads':>7} {'load s':>7} {'model MB':>9} {'peak MB':>8} {'tok/s':>7} "
+          f"{'terms':>6} {'same as ' + reference['mode']:>16}")
+    for result in results:
+        terms = sum(spot_check(result["answers"])) / len(SPOT_CHECKS)
+        same = sum(a == b for a, b in zip(result["answers"], reference["answers"]))
+        print(f"   {result['mode']:<9} {str(result['threads'] or '-'):>7} {result['load_seconds']:7.1f} "
+              f"{result['rss_mb']:9.0f} {result['peak_rss_mb']:8.0f} {result['tokens_per_second']:7.1f} "
+              f"{terms:6.0%} {same:>13}/{len(SPOT_CHECKS)}")
+    for index, (item, _, _) in enumerate(SPOT_CHECKS):
+        print(f"\n{item}:")
+        for result in results:
+            print(f"   [{result['mode']}] {result['answers'][index].strip()[:200]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
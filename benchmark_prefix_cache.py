@@ -0,0 +1,73 @@
+import argparse
+import statistics
+import sys
+import time
+
+from context_builder import FILL_PROMPT_PREFIX, build_prompt
+from model_config import GEMMA_MODEL_PATH
+
+def sample_prompts(count, context_words):
+    words = "supply installation testing commissioning of ductile iron pipes class K9 flanged joints".split()
+    prompts = []
+    for i in range(count):
+        context = " ".join(words[(i + j) % len(words)] for j in range(context_words))
+        prompts.append(build_prompt(f"Item {i}: DI pipe 300 mm dia", context))
+    return prompts
+
+def time_first_token(generate, prompts, batch_size):
+    """Milliseconds to the first generated token per batch (max_new_tokens=1)"""
+    times = []
+    for start in range(0, len(prompts), batch_size):
+        started = time.perf_counter()
+        generate(prompts[start:start + batch_size])
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first token with and without the prefix KV cache")
+    parser.add_argument("--model", default=GEMMA_MODEL_PATH)
+    parser.add_argument("--prompts", type=int, default=16)
+    parser.add_argument("--context-words", type=int, default=300,
+                        help="row-specific context length; shorter contexts make the shared prefix matter more")
+    parser.add_argument("--batch-sizes", default="1,4")
+    args = parser.parse_args()
+
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    from prefix_cache import PrefixKVCache
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32)
+    model.eval()
+    settings = {"max_new_tokens": 1, "do_sample": False, "pad_token_id": tokenizer.eos_token_id}
+
+    started = time.perf_counter()
+    prefix_cache = PrefixKVCache(model, tokenizer, FILL_PROMPT_PREFIX, **settings)
+    build_ms = (time.perf_counter() - started) * 1000
+    prompts = sample_prompts(args.prompts, args.context_words)
+    prompt_tokens = statistics.mean(len(ids) for ids in tokenizer(prompts).input_ids)
+    print(f"Prefix: {len(prefix_cache.prefix_ids)} tokens, cached in {build_ms:.0f} ms; "
+          f"prompts average {prompt_tokens:.0f} tokens")
+
+    def full_prefill(batch):
+        inputs = tokenizer(batch, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            model.generate(**inputs, **settings)
+
+    def cached_prefix(batch):
+        if prefix_cache.generate(batch) is None:
+            raise RuntimeError("prompts do not tokenize to the cached prefix")
+
+    full_prefill(prompts[:1])  # warm-up
+    print(f"   {'batch':>5} {'full p50 ms':>12} {'cached p50 ms':>14} {'speedup':>8}")
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        full = statistics.median(time_first_token(full_prefill, prompts, batch_size))
+        cached = statistics.median(time_first_token(cached_prefix, prompts, batch_size))
+        print(f"   {batch_size:>5} {full:12.0f} {cached:14.0f} {full / cached:7.2f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
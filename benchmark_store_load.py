@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+import time
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux /proc, else peak RSS via resource)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    except ImportError:
+        return float("nan")
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start load time and RSS of the Faiss store")
+    parser.add_argument("index_dir", nargs="?", default="faiss_index")
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    import numpy as np
+    from faiss_segments import STORE_FORMAT, read_manifest, load_vectorstore
+    from model_config import EMBEDDING_DIMENSIONS
+
+    manifest = read_manifest(args.index_dir)
+    if manifest.get("format", 1) < STORE_FORMAT:
+        print("Store uses the old pickled format; open it in the app once to migrate it")
+        return 1
+    before = rss_mb()
+    started = time.perf_counter()
+    vectorstore = load_vectorstore(args.index_dir, None, EMBEDDING_DIMENSIONS, manifest)
+    load_seconds = time.perf_counter() - started
+    after_load = rss_mb()
+
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        vectorstore.similarity_search_by_vector(rng.normal(size=EMBEDDING_DIMENSIONS).tolist(), k=4)
+    query_ms = (time.perf_counter() - started) * 1000 / max(args.queries, 1)
+
+    print(f"Store: {args.index_dir} ({vectorstore.ntotal:,} vectors, base={manifest['base']}, "
+          f"{len(manifest['segments'])} segments)")
+    print(f"   load time:        {load_seconds:8.3f} s")
+    print(f"   RSS after load:   {after_load - before:8.1f} MB above interpreter")
+    print(f"   search + fetch:   {query_ms:8.2f} ms/query (k=4)")
+    print(f"   RSS after search: {rss_mb() - before:8.1f} MB above interpreter")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
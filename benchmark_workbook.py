@@ -0,0 +1,100 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import openpyxl
+import pandas as pd
+from openpyxl.cell import MergedCell
+from openpyxl.worksheet.cell_range import CellRange
+
+from workbook_io import ExcelTemplate
+
+def make_template(path, rows):
+    """BOQ-style sheet: every item row merges A:B, every 50th row is a merged section header"""
+    wb = openpyxl.Workbook(write_only=True)  # ws.merge_cells is quadratic in the number of ranges
+    ws = wb.create_sheet("BOQ")
+    ws.append(["S.No", "Document", "Page", "Item Description", "Details", "Remarks"])
+    merged = [CellRange("A1:B1")]
+    for i in range(rows):
+        row = i + 2
+        if i % 50 == 0:
+            ws.append([f"Section {i // 50 + 1}", None, None, f"Section {i // 50 + 1} items", None, None])
+            merged.append(CellRange(f"A{row}:C{row}"))
+        else:
+            ws.append([i, None, None, f"Supply and install item {i}, class {i % 7}", None, None])
+            merged.append(CellRange(f"A{row}:B{row}"))
+    ws.merged_cells.ranges.update(merged)
+    wb.save(path)
+
+def legacy_set_cell_value(ws, row, col, value):
+    """The previous excel_filler.safe_set_cell_value: scans every merged range per covered cell"""
+    cell = ws.cell(row=row, column=col)
+    if isinstance(cell, MergedCell):
+        for merged_range in ws.merged_cells.ranges:
+            if cell.coordinate in merged_range:
+                ws.cell(row=merged_range.min_row, column=merged_range.min_col).value = value
+                break
+    else:
+        cell.value = value
+
+def fill_rows(set_value, rows):
+    for idx in range(rows):
+        set_value(idx + 2, 2, "tender.pdf")
+        set_value(idx + 2, 3, "12, 13")
+        set_value(idx + 2, 5, "Detailed specification text for the item")
+
+def time_legacy(path, out_path, sample):
+    started = time.perf_counter()
+    wb = openpyxl.load_workbook(path)
+    ws = wb.active
+    rows = len(pd.read_excel(path)["Item Description"])
+    load_ms = (time.perf_counter() - started) * 1000
+
+    sample = min(sample, rows)
+    started = time.perf_counter()
+    fill_rows(lambda row, col, value: legacy_set_cell_value(ws, row, col, value), sample)
+    write_ms = (time.perf_counter() - started) * 1000 * rows / max(sample, 1)
+
+    started = time.perf_counter()
+    wb.save(out_path)
+    save_ms = (time.perf_counter() - started) * 1000
+    return load_ms, 0.0, write_ms, save_ms, sample < rows
+
+def time_adapter(path, out_path, streaming):
+    book = ExcelTemplate(path, streaming=streaming)
+    fill_rows(lambda row, col, value: book.set_value(row, col, value), len(book.queries))
+    book.save(out_path)
+    book.close()
+    timings = book.timings
+    return timings["load"], timings["merged_map"], timings["write"], timings["save"], False
+
+def main():
+    parser = argparse.ArgumentParser(description="Template load/write/save times: legacy vs ExcelTemplate")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--template", help="existing .xlsx to time instead of a generated one")
+    parser.add_argument("--legacy-sample", type=int, default=500,
+                        help="rows written with the legacy merged-cell scan; the rest is extrapolated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.template
+        if not path:
+            path = os.path.join(tmp, "template.xlsx")
+            make_template(path, args.rows)
+        print(f"Template: {path}")
+        print(f"   {'mode':<10} {'load ms':>9} {'merge map':>10} {'writes ms':>10} {'save ms':>9} {'total s':>8}")
+        for mode in ("legacy", "adapter", "streaming"):
+            out_path = os.path.join(tmp, f"{mode}_filled.xlsx")
+            if mode == "legacy":
+                result = time_legacy(path, out_path, args.legacy_sample)
+            else:
+                result = time_adapter(path, out_path, streaming=mode == "streaming")
+            load_ms, map_ms, write_ms, save_ms, extrapolated = result
+            total = (load_ms + map_ms + write_ms + save_ms) / 1000
+            note = " (writes extrapolated)" if extrapolated else ""
+            print(f"   {mode:<10} {load_ms:9.0f} {map_ms:10.0f} {write_ms:10.0f} {save_ms:9.0f} {total:8.1f}{note}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,41 +1,86 @@
 # file: rag_service.py
 
 import os
-from typing import List, Tuple
-from langchain.chains import ConversationalRetrievalChain
-from local_models import get_local_embeddings, get_local_llm
-from faiss_store import get_faiss_vectorstore
+import re
+import time
+import logging
+from typing import Iterator, List, Tuple
+from local_models import get_local_embeddings, get_local_llm, get_llm_cache, get_answer_cache, stream_generate
+from llm_cache import CachedLLM
+from faiss_store import get_faiss_vectorstore, get_faiss_version, hybrid_search
+from model_config import CHAT_CONDENSE
 
-# ───────── Embeddings & Store ────────
-embeddings = get_local_embeddings()
-if embeddings:
-    vectorstore = get_faiss_vectorstore()
+# A follow-up using one of these words (or very short) is condensed against the history before retrieval
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "there",
+    "above", "previous", "same", "former", "latter", "earlier", "else", "also", "more", "one", "ones"
+}
+CHAT_MIN_STANDALONE_WORDS = 4
+
+logger = logging.getLogger(__name__)
+
+def build_chain(vectorstore, llm):
+    # ───────── Retriever (k=2) ─────────
+    retriever = vectorstore.as_retriever(
+        search_kwargs={"k": 2}
+    )
     
-    if vectorstore:
-        # ───────── Retriever (k=2) ─────────
-        retriever = vectorstore.as_retriever(
-            search_kwargs={"k": 2}
-        )
-        
-        # ─────────── LLM & Chain ───────────
-        llm = get_local_llm()
-        if llm:
-            chain = ConversationalRetrievalChain.from_llm(
-                llm=llm,
-                retriever=retriever,
-                return_source_documents=True
-            )
-        else:
-            chain = None
-    else:
-        retriever = None
-        llm = None
-        chain = None
-else:
-    vectorstore = None
-    retriever = None
-    llm = None
-    chain = None
+    # ─────────── LLM & Chain ───────────
+    if not llm:
+        return retriever, None
+    response_cache = get_llm_cache()
+    if response_cache is not None:
+        # Repeated questions (and question condensing) are answered from disk
+        llm = CachedLLM(llm=llm, response_cache=response_cache)
+    from langchain.chains import ConversationalRetrievalChain
+    chain = ConversationalRetrievalChain.from_llm(
+        llm=llm,
+        retriever=retriever,
+        return_source_documents=True
+    )
+    return retriever, chain
+
+# ───────── Embeddings & Store ────────
+# Built on the first question (see get_chain), not at import: importing this
+# module used to load the embedder, the index and Gemma before the app rendered.
+embeddings = None
+vectorstore = None
+retriever = None
+llm = None
+chain = None
+
+def get_chain():
+    """Build the chain on first use; rebuild it only when the shared vector store handle was reloaded"""
+    global embeddings, vectorstore, retriever, llm, chain
+    embeddings = embeddings or get_local_embeddings()
+    current = get_faiss_vectorstore() if embeddings else None
+    if current is not None and (current is not vectorstore or chain is None):
+        vectorstore = current
+        llm = llm or get_local_llm()
+        retriever, chain = build_chain(vectorstore, llm)
+    return chain
+
+def get_source_pages(source_docs):
+    """Sorted page numbers covered by the source documents"""
+    pages = []
+    for doc in source_docs:
+        md = getattr(doc, "metadata", {}) or {}
+        if "page" in md:
+            pages.extend(range(md["page"], md.get("page_end", md["page"]) + 1))
+        elif isinstance(md.get("metadata"), dict) and "page" in md["metadata"]:
+            pages.append(md["metadata"]["page"])
+    return sorted(set(pages))
+
+def is_self_contained(query: str, history) -> bool:
+    """
+    Cheap check that a question can be retrieved and answered as asked,
+    without rewriting it against the chat history first: it is the first
+    turn, or it is long enough and refers to nothing said earlier.
+    """
+    if not history:
+        return True
+    words = re.findall(r"[a-z']+", query.lower())
+    return len(words) >= CHAT_MIN_STANDALONE_WORDS and not FOLLOW_UP_WORDS.intersection(words)
 
 def rag_chat(
     query: str,
@@ -48,31 +93,99 @@ def rag_chat(
       - answer (str)
       - sorted list of page numbers (List[int]) used as sources
     """
-    if not chain:
-        return "Error: RAG chain not initialized. Please check if models are loaded correctly.", []
-    
-    # keep only the last 5 turns
-    history = session_chat_history[-5:] if session_chat_history else []
+    pages = []
+    for event, value in rag_chat_stream(query, session_chat_history):
+        if event == "sources":
+            pages = value
+        elif event == "done":
+            return value["answer"], pages
 
-    try:
-        # run the chain
-        result = chain({
-            "question": query,
-            "chat_history": history
-        })
-
-        answer = result["answer"]
-        source_docs = result.get("source_documents", [])
+def rag_chat_stream(
+    query: str,
+    session_chat_history: List[Tuple[str, str]] = None
+) -> Iterator[Tuple[str, object]]:
+    """
+    Streaming variant of rag_chat. Yields (event, value) pairs:
+      - ("sources", pages) once retrieval has finished
+      - ("token", text) for each generated piece of the answer
+      - ("done", stats) at the end: answer, mode, condense_ms, retrieval_ms,
+        retrieval_source (lexical, hybrid or vector), ttft_ms and total_ms
+    Errors are yielded as the answer text, as rag_chat returns them.
 
-        # extract page numbers from metadata
-        pages = []
-        for doc in source_docs:
-            md = getattr(doc, "metadata", {}) or {}
-            if "page" in md:
-                pages.append(md["page"])
-            elif isinstance(md.get("metadata"), dict) and "page" in md["metadata"]:
-                pages.append(md["metadata"]["page"])
+    Follow-ups are condensed into a standalone question first (an extra LLM
+    call) only when CHAT_CONDENSE is "always" or the question is not
+    self-contained; otherwise retrieval and the answer run in a single pass.
+    Single-pass questions close enough to one already answered against the
+    current index version are served from the semantic answer cache.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    pieces = []
+    mode = "single pass"
+    condense_ms = retrieval_ms = 0.0
+    retrieval_source = None
+    try:
+        chain = get_chain()
+        if not chain:
+            pieces.append("Error: RAG chain not initialized. Please check if models are loaded correctly.")
+        else:
+            # the chain's own steps, with the final answer streamed instead of returned
+            # keep only the last 5 turns
+            history = session_chat_history[-5:] if session_chat_history else []
+            question = query
+            if history and (CHAT_CONDENSE == "always" or not is_self_contained(query, history)):
+                from langchain.chains.conversational_retrieval.base import _get_chat_history
+                chat_history = (chain.get_chat_history or _get_chat_history)(history)
+                question = chain.question_generator.run(question=query, chat_history=chat_history)
+                mode = "condensed"
+                condense_ms = (time.perf_counter() - started) * 1000
+            answer_cache = get_answer_cache() if mode == "single pass" else None
+            query_embedding = hit = None
+            if answer_cache is not None:
+                # the answer depends on the question alone, so it can be reused across turns and sessions
+                index_version = get_faiss_version()
+                query_embedding = embeddings.embed_query(query)
+                hit = answer_cache.get(query, query_embedding, index_version)
+            retrieval_started = time.perf_counter()
+            if hit is not None:
+                answer, pages, _ = hit
+                mode = "answer cache"
+                yield "sources", pages
+                first_token_at = time.perf_counter()
+                pieces.append(answer)
+                yield "token", answer
+            else:
+                docs, retrieval_source = hybrid_search(
+                    vectorstore, question, chain.retriever.search_kwargs.get("k", 4), embedding=query_embedding
+                )
+                retrieval_ms = (time.perf_counter() - retrieval_started) * 1000
+                pages = get_source_pages(docs)
+                yield "sources", pages
 
-        return answer, sorted(set(pages))
+                combine = chain.combine_docs_chain
+                inputs = combine._get_inputs(docs, question=question if chain.rephrase_question else query)
+                prompt = combine.llm_chain.prompt.format(**inputs)
+                response_cache = get_llm_cache()
+                cached = response_cache.get(prompt) if response_cache is not None else None
+                for piece in ([cached] if cached is not None else stream_generate(llm, prompt)):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    pieces.append(piece)
+                    yield "token", piece
+                if cached is None and response_cache is not None:
+                    response_cache.put(prompt, "".join(pieces))
+                if answer_cache is not None:
+                    answer_cache.put(query, query_embedding, index_version, "".join(pieces), pages)
     except Exception as e:
-        return f"Error processing query: {str(e)}", []
+        pieces.append(f"Error processing query: {str(e)}")
+    finished = time.perf_counter()
+    ttft_ms = ((first_token_at or finished) - started) * 1000
+    total_ms = (finished - started) * 1000
+    logger.info(
+        "rag_chat_stream (%s): condense %.0f ms, retrieval %.0f ms (%s), first token after %.0f ms, "
+        "answer after %.0f ms", mode, condense_ms, retrieval_ms, retrieval_source, ttft_ms, total_ms
+    )
+    yield "done", {
+        "answer": "".join(pieces), "mode": mode, "condense_ms": condense_ms, "retrieval_ms": retrieval_ms,
+        "retrieval_source": retrieval_source, "ttft_ms": ttft_ms, "total_ms": total_ms
+    }
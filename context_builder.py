@@ -0,0 +1,134 @@
+MIN_OVERLAP_CHARS = 32  # shorter suffix/prefix matches are treated as coincidence, not chunk overlap
+
+# Identical for every row, so its KV cache is computed once (see prefix_cache.py); row text goes after it
+FILL_PROMPT_PREFIX = """
+Given the context extracted from a tender PDF below, extract a consice description
+for the item named below only from the context, DO NOT explain the item.
+
+Return only the relevant technical and commercial information related to the item.
+Do not explain the item
+If no information relevant to the item is found say "No information found in context"
+
+"""
+
+def build_prompt(query, context):
+    return f"""{FILL_PROMPT_PREFIX}Item: "{query}"
+
+Context:
+{'-'*40}
+{context}
+{'-'*40}
+"""
+
+def count_tokens(tokenizer, texts):
+    """
+    Token count of each text, without special tokens. `tokenizer` is the
+    generating model's HF tokenizer; None falls back to the chunking encoder.
+    """
+    if not texts:
+        return []
+    if tokenizer is None:
+        from pdf_extraction import get_encoder
+        return [len(ids) for ids in get_encoder().encode_ordinary_batch(list(texts))]
+    return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+
+def truncate_tokens(tokenizer, text, max_tokens):
+    """The first `max_tokens` tokens of `text`"""
+    if tokenizer is None:
+        from pdf_extraction import get_encoder
+        ids = get_encoder().encode_ordinary(text)
+        return text if len(ids) <= max_tokens else get_encoder().decode(ids[:max_tokens])
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    if len(ids) <= max_tokens:
+        return text
+    return tokenizer.decode(ids[:max_tokens], skip_special_tokens=True)
+
+def overlap_length(left, right):
+    """Length of the longest suffix of `left` that is also a prefix of `right`"""
+    if len(right) < MIN_OVERLAP_CHARS:
+        return len(right) if left.endswith(right) else 0
+    probe = right[:MIN_OVERLAP_CHARS]
+    pos = left.find(probe, max(0, len(left) - len(right)))
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(probe, pos + 1)
+    return 0
+
+def _source(doc):
+    metadata = doc.metadata or {}
+    return metadata.get("document_name"), metadata.get("chunk_index"), metadata.get("page"), metadata.get("page_end")
+
+def merge_chunks(docs):
+    """
+    Merge retrieved chunks into passages: (text, rank, docs).
+
+    Chunks from the same document that are consecutive in it (by their
+    `chunk_index`) are joined with their shared overlap written once. Chunks
+    indexed before positions were recorded are joined only when their page
+    ranges touch and their texts really overlap. Passages keep the best
+    retrieval rank of their chunks; a passage whose text already appears inside
+    another is dropped, and the passage containing it takes its rank.
+    """
+    def position(idx):
+        name, chunk_index, page, _ = _source(docs[idx])
+        return str(name), chunk_index is None, chunk_index or 0, page or 0, idx
+
+    passages = []
+    previous = None
+    for idx in sorted(range(len(docs)), key=position):
+        doc = docs[idx]
+        name, chunk_index, page, page_end = _source(doc)
+        text = doc.page_content
+        if passages and previous[0] == name:
+            _, prev_index, prev_page, prev_end = previous
+            merged_text, rank, members = passages[-1]
+            if chunk_index is not None and prev_index is not None:
+                consecutive = chunk_index - prev_index in (0, 1)
+                overlap = overlap_length(merged_text, text) if consecutive else 0
+                # consecutive chunks continue each other; a newline only guards a missed overlap
+                joined = merged_text + (text[overlap:] if overlap else "\n" + text) if consecutive else None
+            else:
+                touching = page is not None and prev_end is not None and page <= prev_end + 1
+                overlap = overlap_length(merged_text, text) if touching else 0
+                joined = merged_text + text[overlap:] if overlap else None
+            if joined is not None:
+                passages[-1] = (joined, min(rank, idx), members + [doc])
+                previous = (name, chunk_index, page, page_end)
+                continue
+        passages.append((text, idx, [doc]))
+        previous = (name, chunk_index, page, page_end)
+
+    # Longest first, so a passage is checked against every passage that could contain it;
+    # the container takes over its rank and sources
+    unique = []
+    for text, rank, members in sorted(passages, key=lambda passage: (-len(passage[0]), passage[1])):
+        for i, (kept, kept_rank, kept_members) in enumerate(unique):
+            if text in kept:
+                unique[i] = (kept, min(rank, kept_rank), kept_members + members)
+                break
+        else:
+            unique.append((text, rank, members))
+    unique.sort(key=lambda passage: passage[1])
+    return unique
+
+def assemble_context(tokenizer, docs, budget):
+    """
+    Build a prompt context from retrieved chunks: overlaps merged, repeats
+    removed and trimmed to `budget` tokens (0 = no limit), best-ranked
+    passages first. Returns (context, docs that made it into the context).
+    """
+    passages = merge_chunks(docs)
+    lengths = count_tokens(tokenizer, [text for text, _, _ in passages])
+    parts = []
+    used_docs = []
+    remaining = budget
+    for (text, _, members), length in zip(passages, lengths):
+        if budget and remaining <= 0:
+            break
+        if budget and length > remaining:
+            text = truncate_tokens(tokenizer, text, remaining)
+        parts.append(text)
+        used_docs.extend(members)
+        remaining -= length
+    return "\n\n".join(parts), used_docs
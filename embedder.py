@@ -1,14 +1,14 @@
-import fitz
-import tiktoken
 import streamlit as st
 import os
 import hashlib
 import json
 from local_models import get_local_embeddings
+from pdf_extraction import iter_pdf_pages, chunk_pages
 
 EMBED_DIMENSIONS = 384  # all-MiniLM-L6-v2 dimensions
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+UPLOADED_PDFS_FILE = "uploaded_pdfs.json"
 
 def load_uploaded_pdfs():
     if os.path.exists(UPLOADED_PDFS_FILE):
@@ -38,38 +38,100 @@ def get_faiss_collection():
     
     return vectorstore
 
-def process_pdf(pdf_path, pdf_filename=None):
-    doc = fitz.open(pdf_path)
+def iter_pdf_chunks(pdf_path, pdf_filename=None, workers=None, on_progress=None):
+    """
+    Lazily yield (chunk_text, metadata) for a PDF.
+
+    Pages are extracted and tokenized across a process pool of `workers`
+    (default EXTRACTION_WORKERS); pass workers=1 to stay in-process. Chunks run
+    across page boundaries and record the pages they cover as page..page_end,
+    and their position in the document as chunk_index (chunk ids are assigned
+    after batches are reordered by length, so they do not follow the text).
+    """
+    pages = iter_pdf_pages(pdf_path, workers=workers, on_progress=on_progress)
+    chunks = chunk_pages(pages, CHUNK_SIZE, CHUNK_OVERLAP)
+    for chunk_index, (chunk_text, first_page, last_page) in enumerate(chunks):
+        meta = {"page": first_page, "page_end": last_page, "chunk_index": chunk_index}
+        if pdf_filename:
+            meta["document_name"] = pdf_filename
+        yield chunk_text, meta
+
+def process_pdf(pdf_path, pdf_filename=None, workers=None):
+    """Chunk a whole PDF into (chunks, metadatas) lists; see iter_pdf_chunks"""
     chunks = []
     metadatas = []
-    enc = tiktoken.get_encoding("cl100k_base")
     
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    for page_num in range(len(doc)):
-        progress = (page_num + 1) / len(doc)
-        progress_bar.progress(progress)
-        status_text.text(f"Processing page {page_num + 1}/{len(doc)} of {pdf_filename or 'PDF'}")
-        
-        page = doc[page_num]
-        text = page.get_text()
-        tokens = enc.encode(text)
-        i = 0
-        while i < len(tokens):
-            chunk_tokens = tokens[i:i+CHUNK_SIZE]
-            chunk_text = enc.decode(chunk_tokens)
-            chunks.append(chunk_text)
-            meta = {"page": page_num+1}
-            if pdf_filename:
-                meta["document_name"] = pdf_filename
-            metadatas.append(meta)
-            i += CHUNK_SIZE - CHUNK_OVERLAP
+    def on_progress(done_pages, total_pages):
+        progress_bar.progress(done_pages / total_pages)
+        status_text.text(f"Processing page {done_pages}/{total_pages} of {pdf_filename or 'PDF'}")
+    
+    for chunk_text, meta in iter_pdf_chunks(pdf_path, pdf_filename, workers, on_progress):
+        chunks.append(chunk_text)
+        metadatas.append(meta)
     
     progress_bar.empty()
     status_text.empty()
     return chunks, metadatas
 
+def ingest_pdf(pdf_path, pdf_filename=None, workers=None, pdf_hash=None, on_batch=None):
+    """
+    Stream a PDF into the Faiss index: extract -> chunk -> embed in batches -> add.
+
+    Peak memory is bounded by the embedding batch size, not by document size.
+    `on_batch(done_pages, total_pages, chunks_added)` is called after every batch.
+    """
+    from faiss_store import upload_chunk_stream
+    
+    progress = {"done": 0, "total": 0}
+    
+    def on_progress(done_pages, total_pages):
+        # Runs on the prefetch thread; the Streamlit widgets are updated per batch
+        progress["done"], progress["total"] = done_pages, total_pages
+    
+    def progress_fn(added):
+        if on_batch:
+            on_batch(progress["done"], progress["total"], added)
+        fraction = progress["done"] / progress["total"] if progress["total"] else 0.0
+        return fraction, f"Processed page {progress['done']}/{progress['total']} of {pdf_filename or 'PDF'}"
+    
+    chunk_stream = iter_pdf_chunks(pdf_path, pdf_filename, workers, on_progress)
+    return upload_chunk_stream(chunk_stream, pdf_filename, progress_fn=progress_fn,
+                               pdf_hash=pdf_hash or get_pdf_hash(pdf_path))
+
+def replace_document(pdf_path, pdf_filename, workers=None, on_batch=None):
+    """
+    Re-ingest a corrected version of an already indexed PDF.
+
+    The new chunks are added first and the old ones deleted only once that
+    succeeded, so the document never disappears from search. Other documents
+    are not re-embedded.
+    """
+    from faiss_store import get_document_chunk_ids, delete_faiss_chunks
+    
+    old_chunk_ids = get_document_chunk_ids(pdf_filename)
+    added = ingest_pdf(pdf_path, pdf_filename, workers, on_batch=on_batch)
+    if added:
+        delete_faiss_chunks(old_chunk_ids)
+        forget_uploaded_pdf(pdf_filename)
+        mark_pdf_as_uploaded(pdf_path, pdf_filename)
+    return added
+
+def delete_document(name_or_hash):
+    """Remove one PDF from the index by file name or hash; returns the number of chunks removed"""
+    from faiss_store import find_faiss_document, delete_document as delete_from_faiss
+    
+    document = find_faiss_document(name_or_hash)
+    removed = delete_from_faiss(name_or_hash)
+    forget_uploaded_pdf(document[1] if document else name_or_hash)
+    return removed
+
+def is_pdf_indexed(pdf_filename):
+    from faiss_store import find_faiss_document
+    return find_faiss_document(pdf_filename) is not None
+
 def is_pdf_already_uploaded(pdf_path, pdf_filename):
     uploaded_pdfs = load_uploaded_pdfs()
     pdf_hash = get_pdf_hash(pdf_path)
@@ -83,13 +145,21 @@ def mark_pdf_as_uploaded(pdf_path, pdf_filename):
     uploaded_pdfs.add(pdf_id)
     save_uploaded_pdfs(uploaded_pdfs)
 
+def forget_uploaded_pdf(name_or_hash):
+    uploaded_pdfs = load_uploaded_pdfs()
+    kept = {
+        pdf_id for pdf_id in uploaded_pdfs
+        if name_or_hash not in (pdf_id.rsplit('_', 1)[0], pdf_id.rsplit('_', 1)[-1])
+    }
+    save_uploaded_pdfs(kept)
+
 def upload_chunks_to_faiss(chunks, metadatas, pdf_filename=None):
     from faiss_store import upload_chunks_to_faiss as upload_to_faiss
     upload_to_faiss(chunks, metadatas, pdf_filename)
 
 def get_uploaded_pdfs_list():
     uploaded_pdfs = load_uploaded_pdfs()
-    return [pdf_id.split('_')[0] for pdf_id in uploaded_pdfs]
+    return [pdf_id.rsplit('_', 1)[0] for pdf_id in uploaded_pdfs]
 
 def clear_uploaded_pdfs():
     if os.path.exists(UPLOADED_PDFS_FILE):
@@ -0,0 +1,142 @@
+import os
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+EMBEDDING_CACHE_DIR = "embedding_cache"
+
+class EmbeddingCache:
+    """
+    Persistent chunk-embedding cache keyed by sha1(model name + chunk text).
+
+    Vectors live in a fixed-capacity float32 memmap, one row per slot. A SQLite
+    table maps each key to its slot and tracks last use, so once every slot is
+    taken the least recently used entries are overwritten.
+    """
+
+    def __init__(self, model_name, dimensions, max_entries, cache_dir=EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.capacity = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        vectors_path = os.path.join(cache_dir, f"vectors_{dimensions}.f32")
+        db_path = os.path.join(cache_dir, f"slots_{dimensions}.sqlite")
+
+        expected_size = max_entries * dimensions * 4
+        if os.path.exists(vectors_path) and os.path.getsize(vectors_path) != expected_size:
+            # Capacity changed: slot numbers no longer line up, start over
+            os.remove(vectors_path)
+            if os.path.exists(db_path):
+                os.remove(db_path)
+        mode = "r+" if os.path.exists(vectors_path) else "w+"
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode=mode, shape=(max_entries, dimensions))
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS slots ("
+            "slot INTEGER PRIMARY KEY, key BLOB UNIQUE, last_used REAL NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS slots_last_used ON slots(last_used)")
+        (slot_count,) = self.db.execute("SELECT COUNT(*) FROM slots").fetchone()
+        if slot_count < max_entries:
+            self.db.executemany(
+                "INSERT INTO slots (slot) VALUES (?)",
+                ((slot,) for slot in range(slot_count, max_entries))
+            )
+        self.db.commit()
+
+    def _key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """Return a list with a cached vector (np.ndarray) or None for every text"""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self.db.execute(
+                    f"SELECT key, slot FROM slots WHERE key IN ({placeholders})", batch
+                ).fetchall())
+            if found:
+                now = time.time()
+                self.db.executemany(
+                    "UPDATE slots SET last_used = ? WHERE slot = ?",
+                    ((now, slot) for slot in found.values())
+                )
+                self.db.commit()
+            results = [np.array(self.vectors[found[key]]) if key in found else None for key in keys]
+        hits = len([vector for vector in results if vector is not None])
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts, vectors):
+        """Store vectors for texts, evicting the least recently used slots when full"""
+        entries = dict(zip((self._key(text) for text in texts), vectors))
+        if not entries:
+            return
+        entries = list(entries.items())[-self.capacity:]
+        claim = uuid.uuid4().bytes
+        with self._lock:
+            now = time.time()
+            # Claim slots first (free slots have last_used=0 and sort first), and drop
+            # their old keys before overwriting vectors so no key can point at a vector
+            # that is not its own, even if the process dies mid-write.
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany(
+                "UPDATE slots SET key = NULL, last_used = 0 WHERE key = ?",
+                ((key,) for key, _ in entries)
+            )
+            slots = [row[0] for row in self.db.execute(
+                "SELECT slot FROM slots ORDER BY last_used LIMIT ?", (len(entries),)
+            ).fetchall()]
+            self.db.executemany(
+                "UPDATE slots SET key = ?, last_used = ? WHERE slot = ?",
+                ((claim + slot.to_bytes(4, "little"), now, slot) for slot in slots)
+            )
+            self.db.commit()
+
+            for slot, (_, vector) in zip(slots, entries):
+                self.vectors[slot] = vector
+            self.vectors.flush()
+
+            self.db.executemany(
+                "UPDATE slots SET key = ?, last_used = ? WHERE slot = ?",
+                ((key, now, slot) for slot, (key, _) in zip(slots, entries))
+            )
+            self.db.commit()
+
+    def embed_documents(self, embeddings, texts):
+        """Embed texts through `embeddings`, sending only cache misses to the model"""
+        vectors = self.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = np.asarray(embeddings.embed_documents(missing), dtype=np.float32)
+            self.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self.db.execute(
+                "SELECT COUNT(*) FROM slots WHERE key IS NOT NULL"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "capacity": self.capacity,
+        }
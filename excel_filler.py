@@ -1,20 +1,25 @@
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.llms import HuggingFacePipeline
-from langchain.schema import Document
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 import streamlit as st
-import pandas as pd
-import openpyxl
-from openpyxl.cell import MergedCell
 import os
-from local_models import get_local_embeddings, get_local_llm
-from faiss_store import get_faiss_vectorstore
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from local_models import get_local_llm, get_llm_cache, get_prefix_cache
+from workbook_io import ExcelTemplate
+from fill_checkpoint import FillCheckpoint, FILL_JOBS_DIR
+from context_builder import assemble_context, count_tokens, build_prompt, FILL_PROMPT_PREFIX
+from faiss_store import get_document_scoped_vectorstore, retrieve_for_queries, prefetch, get_faiss_version
+from model_config import (
+    LLM_BATCH_SIZE, FILL_CONCURRENCY, QUERY_EMBEDDING_BATCH_SIZE, CONTEXT_TOKEN_BUDGET,
+    GEMMA_MODEL_PATH, MAX_NEW_TOKENS, TEMPERATURE, LLM_DETERMINISTIC, LLM_INFERENCE_MODE
+)
 
-def get_faiss_vectorstore():
-    return get_faiss_vectorstore()
+RETRIEVAL_K = 4
 
-def get_rag_components():
-    vectorstore = get_faiss_vectorstore()
+def get_rag_components(document_names=None):
+    """LLM and the vector store restricted to `document_names` (every document when None)"""
+    vectorstore = get_document_scoped_vectorstore(document_names)
     if not vectorstore:
         return None, None
     
@@ -23,89 +28,318 @@ def get_rag_components():
         st.error("Failed to load LLM model")
         return None, None
     
-    retriever = vectorstore.as_retriever()
-    return llm, retriever
+    return llm, vectorstore
 
 @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
 def get_llm_response(llm, prompt):
     return llm.predict(prompt)
 
-def safe_set_cell_value(ws, row, col, value):
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(3))
+def run_pipeline_batch(pipe, prompts):
+    outputs = pipe(prompts, batch_size=len(prompts), return_full_text=False)
+    return [output[0]["generated_text"] if isinstance(output, list) else output["generated_text"] for output in outputs]
+
+def plan_generation_batches(llm, prompts, batch_size=LLM_BATCH_SIZE, lengths=None):
+    """
+    Split prompt indices into generation batches, bucketed by token length so
+    a batch pads to similar lengths. LLMs without an HF pipeline get batches of one.
+    """
+    pipe = getattr(llm, "pipeline", None)
+    if pipe is None or batch_size <= 1:
+        return [[idx] for idx in range(len(prompts))]
+    if lengths is None:
+        lengths = [len(ids) for ids in pipe.tokenizer(prompts)["input_ids"]]
+    order = sorted(range(len(prompts)), key=lambda idx: lengths[idx])
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def generate_batch(llm, prompts, prefix_cache=None):
+    """
+    Answer a batch of prompts together. Returns (answers, error).
+
+    With a prefix KV cache only the row-specific part of each prompt is
+    prefilled. Otherwise HuggingFacePipeline.generate would hand the pipeline a
+    list but leave its batch_size at 1, so the HF pipeline is called directly.
+    A batch that keeps failing is answered one prompt at a time and the error
+    is returned for the caller to report (this runs on worker threads, away
+    from Streamlit).
+    """
+    error = None
+    if prefix_cache is not None:
+        try:
+            answers = prefix_cache.generate(prompts)
+            if answers is not None:
+                return answers, None
+        except Exception as e:
+            error = e
+    pipe = getattr(llm, "pipeline", None)
+    if pipe is None or len(prompts) == 1:
+        return [get_llm_response(llm, prompt) for prompt in prompts], error
+    try:
+        return run_pipeline_batch(pipe, prompts), error
+    except Exception as e:
+        return [get_llm_response(llm, prompt) for prompt in prompts], e
+
+def safe_set_cell_value(book, row, col, value):
+    """Write a cell of an ExcelTemplate; merged cells resolve through its precomputed map"""
     try:
-        cell = ws.cell(row=row, column=col)
-        if isinstance(cell, MergedCell):
-            for merged_range in ws.merged_cells.ranges:
-                if cell.coordinate in merged_range:
-                    top_left_cell = ws.cell(row=merged_range.min_row, column=merged_range.min_col)
-                    top_left_cell.value = value
-                    break
-        else:
-            cell.value = value
+        book.set_value(row, col, value)
     except Exception as e:
         st.warning(f"Could not set value for cell ({row}, {col}): {e}")
 
-def fill_excel_with_rag(excel_path, pdf_filename):
-    llm, retriever = get_rag_components()
-    if not llm or not retriever:
+def get_row_sources(docs, pdf_filename):
+    """Document name and sorted page numbers the retrieved chunks came from"""
+    pages = set()
+    doc_names = set()
+    
+    for doc in docs:
+        if hasattr(doc, 'metadata') and doc.metadata:
+            if "page" in doc.metadata:
+                pages.update(range(doc.metadata["page"], doc.metadata.get("page_end", doc.metadata["page"]) + 1))
+            elif "metadata" in doc.metadata and "page" in doc.metadata["metadata"]:
+                pages.add(doc.metadata["metadata"]["page"])
+            
+            if "document_name" in doc.metadata:
+                doc_names.add(doc.metadata["document_name"])
+            elif "metadata" in doc.metadata and "document_name" in doc.metadata["metadata"]:
+                doc_names.add(doc.metadata["metadata"]["document_name"])
+    
+    pages = sorted(list(pages)) if pages else []
+    doc_name = list(doc_names)[0] if doc_names else pdf_filename
+    return doc_name, pages
+
+def get_fill_job_id(excel_path, document_names):
+    """
+    Identify a fill job by what decides its output: the template bytes, the
+    index version, the documents searched and the generation settings.
+    """
+    digest = hashlib.sha256()
+    with open(excel_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(json.dumps([
+        list(get_faiss_version()), sorted(document_names or []), RETRIEVAL_K, CONTEXT_TOKEN_BUDGET,
+        GEMMA_MODEL_PATH, LLM_INFERENCE_MODE, MAX_NEW_TOKENS, TEMPERATURE, LLM_DETERMINISTIC
+    ]).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+def iter_prepared_rows(vectorstore, queries, tokenizer=None, chunk_rows=QUERY_EMBEDDING_BATCH_SIZE, first_row=0,
+                       budget=CONTEXT_TOKEN_BUDGET, retrieval_stats=None):
+    """
+    Yield (first_row, docs_per_row, prompts, retrieval_ms_per_row, prompt_tokens)
+    for consecutive chunks of rows from `first_row` on. Each chunk is one bulk
+    retrieval. Contexts are assembled to `budget` tokens; prompt_tokens holds
+    each row's (raw, assembled) prompt token counts and docs_per_row only the
+    chunks that made it into the prompt. `retrieval_stats` collects hit sources.
+    """
+    for start in range(first_row, len(queries), chunk_rows):
+        chunk = queries[start:start + chunk_rows]
+        started = time.perf_counter()
+        retrieved = retrieve_for_queries(vectorstore, chunk, k=RETRIEVAL_K, stats=retrieval_stats)
+        docs_per_row = []
+        prompts = []
+        for query, docs in zip(chunk, retrieved):
+            context, used_docs = assemble_context(tokenizer, docs, budget)
+            docs_per_row.append(used_docs)
+            prompts.append(build_prompt(query, context))
+        retrieval_ms = (time.perf_counter() - started) * 1000 / len(chunk)
+        raw_tokens = count_tokens(tokenizer, [
+            build_prompt(query, "".join(doc.page_content for doc in docs)) for query, docs in zip(chunk, retrieved)
+        ])
+        prompt_tokens = list(zip(raw_tokens, count_tokens(tokenizer, prompts)))
+        yield start, docs_per_row, prompts, retrieval_ms, prompt_tokens
+
+def timed_generate_batch(llm, prompts, prefix_cache=None):
+    queued_at = time.perf_counter()
+    answers, error = generate_batch(llm, prompts, prefix_cache)
+    return answers, error, queued_at, time.perf_counter()
+
+def write_timings_sheet(book, queries, timings, prompt_tokens):
+    """Per-row timings go to their own sheet so the template's columns stay untouched"""
+    rows = [[
+        "Row", "Item Description", "Retrieval ms", "Queue ms", "Generation ms", "Batch Size",
+        "Prompt Tokens (raw)", "Prompt Tokens"
+    ]]
+    for idx, query in enumerate(queries):
+        timing = timings.get(idx)
+        if timing:
+            rows.append(
+                [idx + 2, query] + [round(value, 1) for value in timing[:3]] + [timing[3]]
+                + list(prompt_tokens.get(idx) or (None, None))
+            )
+    book.add_sheet("Row Timings", rows)
+
+def fill_excel_with_rag(excel_path, pdf_filename, document_names=None, concurrency=FILL_CONCURRENCY):
+    """
+    Fill the "Item Description" rows from the tender's own PDFs.
+
+    Retrieval is limited to `document_names` (default: just `pdf_filename`), so
+    chunks from unrelated tenders neither cost search time nor reach the prompt.
+
+    Rows are pipelined: a background thread retrieves and builds prompts for
+    upcoming rows while up to `concurrency` generation batches run on a worker
+    pool. Answers are written to the sheet in row order on this thread, and
+    per-row timings are saved to a "Row Timings" sheet.
+
+    The instruction every prompt starts with is prefilled once: its KV cache
+    is reused, so generation only prefills each row's item and context.
+
+    Prompts answered before (same prompt, model and generation settings) are
+    taken from the LLM response cache and never reach the model.
+
+    Retrieved chunks are merged where they overlap and trimmed to
+    CONTEXT_TOKEN_BUDGET tokens; raw and assembled prompt sizes are reported per row.
+
+    Every completed row is checkpointed to fill_jobs/<job id>.jsonl, so a rerun
+    of the same job (same template, index version, documents and generation
+    settings) resumes after the last completed row. With LLM_DETERMINISTIC the
+    result is the workbook an uninterrupted run produces; when sampling, the
+    regenerated rows are fresh samples (see FillCheckpoint).
+    """
+    document_names = document_names or [pdf_filename]
+    llm, vectorstore = get_rag_components(document_names)
+    if not llm or not vectorstore:
         st.error("Failed to initialize RAG components")
         return excel_path
     
-    wb = openpyxl.load_workbook(excel_path)
-    ws = wb.active
-    df = pd.read_excel(excel_path)
-    queries = df["Item Description"].astype(str).tolist()
+    # One parse of the template; large sheets switch to openpyxl's streaming modes
+    book = ExcelTemplate(excel_path)
+    queries = book.queries
+    
+    response_cache = get_llm_cache()
+    prefix_cache = get_prefix_cache(FILL_PROMPT_PREFIX)
+    
+    checkpoint = FillCheckpoint(os.path.join(FILL_JOBS_DIR, f"{get_fill_job_id(excel_path, document_names)}.jsonl"))
+    completed = checkpoint.load(len(queries))
     
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    for idx, query in enumerate(queries):
-        progress = (idx + 1) / len(queries)
-        progress_bar.progress(progress)
-        status_text.text(f"Processing item {idx + 1}/{len(queries)}: {query[:50]}...")
-        
-        docs = retriever.get_relevant_documents(query)
-        context_texts = [doc.page_content for doc in docs]
-        
-        pages = set()
-        doc_names = set()
-        
-        for doc in docs:
-            if hasattr(doc, 'metadata') and doc.metadata:
-                if "page" in doc.metadata:
-                    pages.add(doc.metadata["page"])
-                elif "metadata" in doc.metadata and "page" in doc.metadata["metadata"]:
-                    pages.add(doc.metadata["metadata"]["page"])
-                
-                if "document_name" in doc.metadata:
-                    doc_names.add(doc.metadata["document_name"])
-                elif "metadata" in doc.metadata and "document_name" in doc.metadata["metadata"]:
-                    doc_names.add(doc.metadata["metadata"]["document_name"])
-        
-        pages = sorted(list(pages)) if pages else []
-        doc_name = list(doc_names)[0] if doc_names else pdf_filename
-        
-        prompt = f"""
-Given the following context extracted from a tender PDF, extract a consice 
-description for the item only from the context below, DO NOT explain the item: "{query}".
-
-Return only the relevant technical and commercial information related to the item.
-Do not explain the item
-If no information relevant to the item is found say "No information found in context"
-
-Context:
-{'-'*40}
-{''.join(context_texts)}
-{'-'*40}
-"""
-        details = get_llm_response(llm, prompt)
-        
-        safe_set_cell_value(ws, idx+2, 2, doc_name)
-        safe_set_cell_value(ws, idx+2, 3, ", ".join(map(str, pages)))
-        safe_set_cell_value(ws, idx+2, 5, details)
+    docs_per_row = {}
+    prepared_at = {}
+    retrieval_ms = {}
+    results = {}
+    timings = {}
+    prompt_tokens = {}
+    for row in completed:
+        safe_set_cell_value(book, row["row"]+2, 2, row["doc_name"])
+        safe_set_cell_value(book, row["row"]+2, 3, ", ".join(map(str, row["pages"])))
+        safe_set_cell_value(book, row["row"]+2, 5, row["details"])
+        timings[row["row"]] = tuple(row["timing"])
+        prompt_tokens[row["row"]] = row.get("prompt_tokens")
+    resumed_rows = next_row = len(completed)
+    if resumed_rows:
+        st.info(f"Resuming fill job: {resumed_rows}/{len(queries)} items were already completed")
+        if not LLM_DETERMINISTIC:
+            st.caption("Sampling is on (LLM_DETERMINISTIC = False): the remaining items may be worded "
+                       "differently than in an uninterrupted run")
+    status_text.text(f"Searching documents for {len(queries) - resumed_rows} items...")
+    started = time.perf_counter()
     
-    progress_bar.empty()
-    status_text.empty()
+    def write_ready_rows():
+        # openpyxl is not thread-safe: only this thread touches the workbook
+        nonlocal next_row
+        written = []
+        while next_row in results:
+            details = results.pop(next_row)
+            doc_name, pages = get_row_sources(docs_per_row.pop(next_row), pdf_filename)
+            safe_set_cell_value(book, next_row+2, 2, doc_name)
+            safe_set_cell_value(book, next_row+2, 3, ", ".join(map(str, pages)))
+            safe_set_cell_value(book, next_row+2, 5, details)
+            written.append({
+                "row": next_row, "doc_name": doc_name, "pages": pages, "details": details,
+                "timing": list(timings[next_row]), "prompt_tokens": list(prompt_tokens[next_row])
+            })
+            next_row += 1
+        checkpoint.append(written)
+        if queries:
+            rows_per_minute = (next_row - resumed_rows) / max(time.perf_counter() - started, 1e-9) * 60
+            progress_bar.progress(next_row / len(queries))
+            status_text.text(f"Generated {next_row}/{len(queries)} items ({rows_per_minute:.1f} rows/min)")
+    
+    def collect(done_futures):
+        for future in done_futures:
+            indices, prompts = in_flight.pop(future)
+            answers, error, generation_started, generation_finished = future.result()
+            if error is not None:
+                st.warning(f"Generation fell back to a slower path for {len(indices)} rows: {error}")
+            if response_cache is not None:
+                response_cache.put_many(prompts, answers)
+            for idx, details in zip(indices, answers):
+                results[idx] = details
+                timings[idx] = (
+                    retrieval_ms[idx],
+                    (generation_started - prepared_at[idx]) * 1000,
+                    (generation_finished - generation_started) * 1000,
+                    len(indices)
+                )
+        write_ready_rows()
     
+    in_flight = {}
+    tokenizer = getattr(getattr(llm, "pipeline", None), "tokenizer", None)
+    retrieval_stats = {}
+    prepared_rows = iter_prepared_rows(vectorstore, queries, tokenizer, first_row=resumed_rows,
+                                       retrieval_stats=retrieval_stats)
+    with checkpoint, ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for first_row, chunk_docs, prompts, chunk_retrieval_ms, chunk_tokens in prefetch(prepared_rows, depth=1):
+            now = time.perf_counter()
+            for offset, docs in enumerate(chunk_docs):
+                docs_per_row[first_row + offset] = docs
+                prepared_at[first_row + offset] = now
+                retrieval_ms[first_row + offset] = chunk_retrieval_ms
+                prompt_tokens[first_row + offset] = chunk_tokens[offset]
+            
+            cached = response_cache.get_many(prompts) if response_cache is not None else [None] * len(prompts)
+            for offset, details in enumerate(cached):
+                if details is not None:
+                    results[first_row + offset] = details
+                    timings[first_row + offset] = (chunk_retrieval_ms, 0.0, 0.0, "cached")
+            write_ready_rows()
+            
+            missing = [offset for offset, details in enumerate(cached) if details is None]
+            missing_prompts = [prompts[offset] for offset in missing]
+            missing_lengths = [chunk_tokens[offset][1] for offset in missing]
+            for batch in plan_generation_batches(llm, missing_prompts, lengths=missing_lengths):
+                while len(in_flight) >= max(1, concurrency):
+                    done_futures, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done_futures)
+                batch_prompts = [missing_prompts[i] for i in batch]
+                future = executor.submit(timed_generate_batch, llm, batch_prompts, prefix_cache)
+                in_flight[future] = ([first_row + missing[i] for i in batch], batch_prompts)
+        while in_flight:
+            done_futures, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done_futures)
+    
+    write_timings_sheet(book, queries, timings, prompt_tokens)
     out_path = excel_path.replace(".xlsx", "_filled.xlsx")
-    wb.save(out_path)
-    return out_path 
\ No newline at end of file
+    book.save(out_path)
+    book.close()
+    checkpoint.remove()  # the job is complete; its output is the saved workbook
+    progress_bar.empty()
+    status_text.empty()
+    if timings:
+        average = lambda column: sum(timing[column] for timing in timings.values()) / len(timings)
+        cached_rows = len([timing for timing in timings.values() if timing[3] == "cached"])
+        st.caption(
+            f"Per row: retrieval {average(0):.0f} ms, queued {average(1):.0f} ms, "
+            f"generation {average(2):.0f} ms (batch latency); "
+            f"{(len(queries) - resumed_rows) / max(time.perf_counter() - started, 1e-9) * 60:.1f} rows/min overall, "
+            f"{cached_rows} rows from the response cache"
+        )
+    if retrieval_stats:
+        st.caption("Retrieval: " + ", ".join(
+            f"{count} {source} ({total / count:.1f} ms/query)" for source, (count, total) in retrieval_stats.items()
+        ))
+    counted = [tokens for tokens in prompt_tokens.values() if tokens]
+    if counted:
+        raw_average = sum(tokens[0] for tokens in counted) / len(counted)
+        assembled_average = sum(tokens[1] for tokens in counted) / len(counted)
+        st.caption(
+            f"Prompt tokens per row: {raw_average:.0f} raw, {assembled_average:.0f} after merging overlaps "
+            f"and the {CONTEXT_TOKEN_BUDGET}-token context budget"
+        )
+    st.caption(
+        f"Workbook{' (streaming)' if book.streaming else ''}: load {book.timings['load']:.0f} ms, "
+        f"merged-cell map {book.timings['merged_map']:.0f} ms, writes {book.timings['write']:.0f} ms, "
+        f"save {book.timings['save']:.0f} ms"
+    )
+    return out_path
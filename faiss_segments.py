@@ -0,0 +1,523 @@
+import os
+import json
+import uuid
+import pickle
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+import faiss
+from ann_index import (
+    apply_search_params, build_index, choose_index_type, index_type_of, needs_rebuild, rebuild_index,
+    remove_ids
+)
+from vector_store import SqliteDocstore, TenderVectorStore
+
+# On-disk layout of an index directory:
+#   manifest.json        source of truth: base index + committed delta segments
+#   docstore.sqlite      chunk text and metadata, keyed by integer chunk id
+#   base_000007.faiss    ID-mapped FAISS index of every compacted vector
+#   segment_000008.pkl   one ingest: pickled batches of (chunk ids, vectors)
+#   tombstones_000009.npy  ids of deleted chunks still present in the base/segments
+#   .lock                held (flock) by whichever process is changing the directory
+# Index files are written under a temporary name and renamed into place before
+# the manifest that references them, so a crash never leaves a half-written file
+# reachable from the manifest. Docstore rows are committed before their vectors
+# are published, so every searchable id has a row; their BM25 terms are added
+# only after the segment is published. Deletes publish a tombstone
+# file first and drop the rows after; compaction removes the vectors for good.
+# The app and the ingest worker share the directory, so every manifest and
+# docstore change runs under index_lock(), which also excludes other processes.
+
+MANIFEST_FILE = "manifest.json"
+DOCSTORE_FILE = "docstore.sqlite"
+STORE_FORMAT = 2
+LEGACY_BASE_DIR = "index"  # FAISS.save_local directory used before manifests existed
+COMPACT_AFTER_SEGMENTS = 8
+COMPACT_DELETED_FRACTION = 0.1  # compact once this share of stored vectors is tombstoned
+
+LOCK_FILE = ".lock"
+
+_manifest_lock = threading.RLock()
+_compaction_threads = {}
+_docstores = {}
+_held_locks = {}  # index dir -> [lock file, depth] while this process holds index_lock
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock_file(f):
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # gives up after ~10 s
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def index_lock(index_dir):
+    """
+    Exclusive write access to an index directory across threads and processes.
+    Reentrant within a thread; always taken before a docstore's own lock.
+    """
+    key = os.path.abspath(index_dir)
+    with _manifest_lock:
+        held = _held_locks.get(key)
+        if held is None:
+            os.makedirs(index_dir, exist_ok=True)
+            f = open(os.path.join(index_dir, LOCK_FILE), "a+b")
+            f.seek(0)
+            _lock_file(f)
+            held = _held_locks[key] = [f, 0]
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if not held[1]:
+                del _held_locks[key]
+                _unlock_file(held[0])
+                held[0].close()
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # directories cannot be opened on Windows; rename is still atomic
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def read_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    manifest = {"format": STORE_FORMAT, "version": 0, "next_id": 1, "base": None, "segments": [],
+                "segment_sizes": {}, "base_size": 0, "index_type": "flat", "tombstones": None,
+                "tombstone_count": 0}
+    if os.path.isdir(os.path.join(index_dir, LEGACY_BASE_DIR)):
+        manifest["format"] = 1
+        manifest["base"] = LEGACY_BASE_DIR
+        manifest["version"] = 1
+    return manifest
+
+def write_manifest(index_dir, manifest):
+    os.makedirs(index_dir, exist_ok=True)
+    manifest.setdefault("store_id", uuid.uuid4().hex)  # tells a recreated store apart from a reloaded one
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(index_dir)
+
+def manifest_key(manifest):
+    """Cheap content version: changes whenever data is added, replaced or cleared"""
+    return manifest.get("store_id"), manifest["version"]
+
+def vector_count(manifest):
+    """Live vectors: everything stored minus tombstoned ids"""
+    stored = manifest.get("base_size", 0) + sum(manifest.get("segment_sizes", {}).values())
+    return stored - manifest.get("tombstone_count", 0)
+
+def read_tombstones(index_dir, manifest):
+    if not manifest.get("tombstones"):
+        return np.zeros(0, dtype=np.int64)
+    return np.load(os.path.join(index_dir, manifest["tombstones"]))
+
+def _write_tombstones(index_dir, manifest, ids):
+    """Point `manifest` at a new tombstone file holding `ids`; returns the replaced file name"""
+    old_name = manifest.get("tombstones")
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    if not len(ids):
+        manifest["tombstones"], manifest["tombstone_count"] = None, 0
+        return old_name
+    name = _next_name(manifest, "tombstones") + ".npy"
+    tmp_path = os.path.join(index_dir, f"tombstones_{uuid.uuid4().hex}.npy.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, ids)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(index_dir, name))
+    _fsync_dir(index_dir)
+    manifest["tombstones"], manifest["tombstone_count"] = name, len(ids)
+    return old_name
+
+def delete_chunks(index_dir, ids):
+    """
+    Delete chunks by id without touching anything else: their ids are
+    tombstoned (hidden from search immediately) and their docstore rows dropped.
+    Returns the updated manifest.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids):
+        return read_manifest(index_dir)
+    with index_lock(index_dir):
+        manifest = read_manifest(index_dir)
+        tombstones = np.union1d(read_tombstones(index_dir, manifest), ids)
+        old_name = _write_tombstones(index_dir, manifest, tombstones)
+        manifest["version"] += 1
+        write_manifest(index_dir, manifest)
+        _remove_paths(index_dir, [old_name] if old_name else [])
+        get_docstore(index_dir).delete_chunks(ids)
+    return manifest
+
+def _name_id(name):
+    return int(name.split("_")[1].split(".")[0])
+
+def _next_name(manifest, prefix):
+    name = f"{prefix}_{manifest['next_id']:06d}"
+    manifest["next_id"] += 1
+    return name
+
+def get_docstore(index_dir):
+    """
+    One docstore connection per index directory and process, reopened once
+    the file was replaced by a clear (here or in another process). The stale
+    connection is left to the handles still using it rather than closed under them.
+    """
+    path = os.path.abspath(os.path.join(index_dir, DOCSTORE_FILE))
+    with _manifest_lock:
+        docstore = _docstores.get(path)
+        if docstore is None or not docstore.is_current():
+            os.makedirs(index_dir, exist_ok=True)
+            docstore = _docstores[path] = SqliteDocstore(path, write_lock=lambda: index_lock(index_dir))
+        return docstore
+
+def close_docstore(index_dir):
+    """Close the docstore before the directory is removed (open files block that on Windows)"""
+    path = os.path.abspath(os.path.join(index_dir, DOCSTORE_FILE))
+    with _manifest_lock:
+        docstore = _docstores.pop(path, None)
+    if docstore is not None:
+        docstore.close()
+
+def clear_index_dir(index_dir):
+    """
+    Remove every file of the store but the lock file, under the lock. Ingests
+    still running find their docstore replaced and fail instead of writing
+    into the removed one.
+    """
+    if not os.path.isdir(index_dir):
+        return
+    with index_lock(index_dir):
+        close_docstore(index_dir)
+        _remove_paths(index_dir, [name for name in os.listdir(index_dir) if name != LOCK_FILE])
+
+def read_base_index(path, mmap=True):
+    """Read a base index, memory-mapped and read-only unless it is about to be modified"""
+    if not mmap:
+        return apply_search_params(faiss.read_index(path))
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return apply_search_params(faiss.read_index(path, flags))
+
+class SegmentWriter:
+    """
+    Collects the vectors of one ingest into a delta segment and their text and
+    metadata into the docstore.
+
+    Batches are streamed to a temporary file as they arrive; commit() makes the
+    segment durable and visible, abort() discards it and its docstore rows.
+    """
+
+    def __init__(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.docstore = get_docstore(index_dir)
+        self.tmp_path = os.path.join(index_dir, f"segment_{uuid.uuid4().hex}.pkl.tmp")
+        self.file = open(self.tmp_path, "wb")
+        self.ids = []
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+    def _check_not_cleared(self):
+        if get_docstore(self.index_dir) is not self.docstore:
+            raise RuntimeError("The index was cleared while this document was being ingested")
+
+    def append(self, texts, metadatas, vectors):
+        """Store one batch and return the chunk ids assigned to it"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with index_lock(self.index_dir):
+            self._check_not_cleared()
+            # searchable by term only once commit() has published the vectors
+            ids = self.docstore.add_chunks(texts, metadatas, index_terms=False)
+        pickle.dump((np.asarray(ids, dtype=np.int64), vectors), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.ids.extend(ids)
+        return ids
+
+    def commit(self):
+        """Publish the segment; returns the updated manifest (unchanged if empty)"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        if self.count == 0:
+            os.remove(self.tmp_path)
+            return read_manifest(self.index_dir)
+        with index_lock(self.index_dir):
+            self._check_not_cleared()
+            manifest = read_manifest(self.index_dir)
+            name = _next_name(manifest, "segment") + ".pkl"
+            os.replace(self.tmp_path, os.path.join(self.index_dir, name))
+            _fsync_dir(self.index_dir)
+            manifest["segments"].append(name)
+            manifest.setdefault("segment_sizes", {})[name] = self.count
+            manifest["version"] += 1
+            write_manifest(self.index_dir, manifest)
+            # After the manifest: a lexical hit always has committed vectors. A crash
+            # in between only leaves these chunks to the vector search.
+            self.docstore.index_chunk_terms(self.ids)
+        return manifest
+
+    def abort(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        with index_lock(self.index_dir):
+            # after a clear the rows went with the old docstore
+            if self.ids and get_docstore(self.index_dir) is self.docstore:
+                self.docstore.delete_chunks(self.ids)
+
+def iter_segment(index_dir, name):
+    """Yield the (ids, vectors) batches stored in a segment"""
+    with open(os.path.join(index_dir, name), "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+def new_vectorstore(index_dir, embeddings, dimensions):
+    return TenderVectorStore(embeddings, get_docstore(index_dir), dimensions)
+
+def load_vectorstore(index_dir, embeddings, dimensions, manifest=None):
+    """Map the base index and replay every committed segment into the delta index"""
+    if manifest is None:
+        try:
+            return load_vectorstore(index_dir, embeddings, dimensions, read_manifest(index_dir))
+        except FileNotFoundError:
+            # A compaction swapped the base between reading the manifest and the files
+            return load_vectorstore(index_dir, embeddings, dimensions, read_manifest(index_dir))
+    if manifest.get("format", 1) < STORE_FORMAT:
+        manifest = migrate_legacy_store(index_dir, embeddings, dimensions)
+    base_index = None
+    if manifest["base"]:
+        base_index = read_base_index(os.path.join(index_dir, manifest["base"]))
+    vectorstore = TenderVectorStore(embeddings, get_docstore(index_dir), dimensions, base_index)
+    vectorstore.set_deleted(read_tombstones(index_dir, manifest))
+    for name in manifest["segments"]:
+        for ids, vectors in iter_segment(index_dir, name):
+            vectorstore.add_vectors(ids, vectors)
+    return vectorstore
+
+def refresh_vectorstore(index_dir, embeddings, dimensions, vectorstore=None, loaded_manifest=None):
+    """
+    Bring a loaded store up to date with the manifest on disk.
+
+    Returns (vectorstore, manifest). When only new segments were committed since
+    `loaded_manifest`, they are added to a copy of the delta index (the mapped
+    base is shared); otherwise everything is loaded from disk.
+    """
+    manifest = read_manifest(index_dir)
+    if vectorstore is not None and loaded_manifest is not None:
+        if manifest_key(manifest) == manifest_key(loaded_manifest):
+            return vectorstore, manifest  # same content, possibly compacted since
+        # Anything numbered below next_id existed when the handle was loaded, so a
+        # base older than that holds nothing the handle lacks.
+        seen_below = loaded_manifest["next_id"]
+        same_store = manifest.get("store_id") == loaded_manifest.get("store_id")
+        base_known = manifest["base"] is None or manifest["base"] == loaded_manifest["base"] \
+            or _name_id(manifest["base"]) < seen_below
+        if same_store and base_known and manifest["version"] > loaded_manifest["version"]:
+            new_segments = [name for name in manifest["segments"] if _name_id(name) >= seen_below]
+            try:
+                refreshed = vectorstore.clone()
+                if manifest.get("tombstones") != loaded_manifest.get("tombstones"):
+                    refreshed.set_deleted(read_tombstones(index_dir, manifest))
+                for name in new_segments:
+                    for ids, vectors in iter_segment(index_dir, name):
+                        refreshed.add_vectors(ids, vectors)
+                return refreshed, manifest
+            except FileNotFoundError:
+                manifest = read_manifest(index_dir)  # folded by a concurrent compaction
+    try:
+        return load_vectorstore(index_dir, embeddings, dimensions, manifest), manifest
+    except FileNotFoundError:
+        manifest = read_manifest(index_dir)
+        return load_vectorstore(index_dir, embeddings, dimensions, manifest), manifest
+
+def write_base(index_dir, index, folded_segments=None, reindexed=False, applied_tombstones=None,
+               expected_base=False):
+    """
+    Publish `index` (ID-mapped) as the new base.
+
+    `folded_segments` are the segments already contained in it; any segment
+    committed after them is kept. None means the index replaces all segments.
+    `reindexed` bumps the version so loaded handles pick up the new index type.
+    `applied_tombstones` are deleted ids already removed from `index`; ids
+    tombstoned since then stay tombstoned. When `expected_base` is given and
+    the manifest's base has changed since (a compaction elsewhere, or a clear),
+    nothing is published and None is returned.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_path = os.path.join(index_dir, f"base_{uuid.uuid4().hex}.faiss.tmp")
+    faiss.write_index(index, tmp_path)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    with index_lock(index_dir):
+        manifest = read_manifest(index_dir)
+        old_base = manifest["base"]
+        if expected_base is not False and (old_base != expected_base or not os.path.exists(tmp_path)):
+            _remove_paths(index_dir, [os.path.basename(tmp_path)])
+            return None
+        name = _next_name(manifest, "base") + ".faiss"
+        os.replace(tmp_path, os.path.join(index_dir, name))
+        _fsync_dir(index_dir)
+        if folded_segments is None:
+            dropped = manifest["segments"]
+            manifest["version"] += 1
+        else:
+            dropped = [segment for segment in manifest["segments"] if segment in folded_segments]
+            if reindexed:
+                manifest["version"] += 1
+        manifest["base"] = name
+        manifest["segments"] = [segment for segment in manifest["segments"] if segment not in dropped]
+        manifest["segment_sizes"] = {
+            segment: size for segment, size in manifest.get("segment_sizes", {}).items()
+            if segment in manifest["segments"]
+        }
+        manifest["base_size"] = index.ntotal
+        manifest["index_type"] = index_type_of(index)
+        manifest["format"] = STORE_FORMAT
+        if applied_tombstones is not None and len(applied_tombstones):
+            remaining = np.setdiff1d(read_tombstones(index_dir, manifest), applied_tombstones)
+            old_tombstones = _write_tombstones(index_dir, manifest, remaining)
+            if old_tombstones:
+                dropped = dropped + [old_tombstones]
+        write_manifest(index_dir, manifest)
+        # Readers still mapping the old base keep it alive until they drop it (POSIX);
+        # on Windows the removal fails while it is mapped and the file is left behind.
+        _remove_paths(index_dir, ([old_base] if old_base else []) + dropped)
+    return manifest
+
+def _remove_paths(index_dir, names):
+    for name in names:
+        path = os.path.join(index_dir, name)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+def compact(index_dir, embeddings, dimensions):
+    """
+    Fold every committed segment into a new base index and drop tombstoned ids.
+
+    This is also where the index gets (re)trained: once the corpus outgrows the
+    current index type (see ann_index.choose_index_type) it is rebuilt.
+    """
+    manifest = read_manifest(index_dir)
+    if manifest.get("format", 1) < STORE_FORMAT:
+        manifest = migrate_legacy_store(index_dir, embeddings, dimensions)
+    tombstones = read_tombstones(index_dir, manifest)
+    delta_ids, delta_vectors = [], []
+    for name in manifest["segments"]:
+        for ids, vectors in iter_segment(index_dir, name):
+            keep = ~np.isin(ids, tombstones)
+            delta_ids.append(ids[keep])
+            delta_vectors.append(vectors[keep])
+    delta_ids = np.concatenate(delta_ids) if delta_ids else np.zeros(0, dtype=np.int64)
+    delta_vectors = np.concatenate(delta_vectors) if delta_vectors else np.zeros((0, dimensions), dtype=np.float32)
+
+    if manifest["base"]:
+        index = read_base_index(os.path.join(index_dir, manifest["base"]), mmap=False)
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimensions))
+    index = remove_ids(index, tombstones)
+    total = index.ntotal + len(delta_ids)
+    reindexed = needs_rebuild(index, total)
+    if not len(delta_ids) and not reindexed and not len(tombstones):
+        return manifest
+    if reindexed:
+        index = rebuild_index(index, delta_vectors, delta_ids)
+    else:
+        index.add_with_ids(delta_vectors, delta_ids)
+    # The vectors were folded outside the lock; publish only if no other compaction won meanwhile
+    published = write_base(index_dir, index, folded_segments=set(manifest["segments"]), reindexed=reindexed,
+                           applied_tombstones=tombstones, expected_base=manifest["base"])
+    return published if published is not None else read_manifest(index_dir)
+
+def compact_in_background(index_dir, embeddings, dimensions, min_segments=COMPACT_AFTER_SEGMENTS):
+    """
+    Start a compaction thread (one per index dir) once enough segments pile up,
+    once the corpus has grown into a different index type, or once enough of
+    it is tombstoned.
+    """
+    manifest = read_manifest(index_dir)
+    outgrown = choose_index_type(vector_count(manifest)) != manifest.get("index_type", "flat")
+    deleted = manifest.get("tombstone_count", 0)
+    mostly_deleted = deleted and deleted >= COMPACT_DELETED_FRACTION * (vector_count(manifest) + deleted)
+    if len(manifest["segments"]) < min_segments and not outgrown and not mostly_deleted:
+        return None
+    with _manifest_lock:
+        running = _compaction_threads.get(index_dir)
+        if running and running.is_alive():
+            return running
+        thread = threading.Thread(target=compact, args=(index_dir, embeddings, dimensions), daemon=True)
+        _compaction_threads[index_dir] = thread
+        thread.start()
+        return thread
+
+def migrate_legacy_store(index_dir, embeddings, dimensions):
+    """
+    Convert a LangChain FAISS store (save_local directory plus any pickled
+    segments with text) into the docstore + ID-mapped base format, once.
+    """
+    from langchain.vectorstores import FAISS
+    from ann_index import reconstruct_all
+
+    with index_lock(index_dir):
+        manifest = read_manifest(index_dir)
+        if manifest.get("format", 1) >= STORE_FORMAT:
+            return manifest
+        docstore = get_docstore(index_dir)
+        all_ids, all_vectors = [], []
+        if manifest["base"]:
+            legacy = FAISS.load_local(os.path.join(index_dir, manifest["base"]), embeddings)
+            vectors = reconstruct_all(legacy.index)
+            documents = [legacy.docstore.search(legacy.index_to_docstore_id[i]) for i in range(len(vectors))]
+            all_ids.append(docstore.add_chunks(
+                [doc.page_content for doc in documents], [doc.metadata for doc in documents]
+            ))
+            all_vectors.append(vectors)
+        for name in manifest["segments"]:
+            for _, texts, metadatas, vectors in iter_segment(index_dir, name):
+                all_ids.append(docstore.add_chunks(texts, metadatas))
+                all_vectors.append(np.asarray(vectors, dtype=np.float32))
+        ids = np.concatenate([np.asarray(i, dtype=np.int64) for i in all_ids]) if all_ids else np.zeros(0, dtype=np.int64)
+        vectors = np.concatenate(all_vectors) if all_vectors else np.zeros((0, dimensions), dtype=np.float32)
+        index = build_index(vectors, choose_index_type(len(vectors)), dimensions, ids=ids)
+        # Replaces the legacy base and every legacy segment in one manifest swap
+        return write_base(index_dir, index)
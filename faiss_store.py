@@ -1,22 +1,40 @@
 import os
+import queue
 import pickle
+import threading
 import json
 import hashlib
+import time
+import logging
 from typing import List, Dict, Any, Optional
 import numpy as np
-from langchain.schema import Document
-from langchain.vectorstores import FAISS
-from local_models import get_local_embeddings
+from local_models import get_local_embeddings, get_embedding_cache
+from model_config import EMBEDDING_BATCH_SIZE, EMBEDDING_DIMENSIONS, QUERY_EMBEDDING_BATCH_SIZE, RETRIEVAL_MODE
+from lexical_index import code_terms
+from faiss_segments import (
+    SegmentWriter, read_manifest, manifest_key, refresh_vectorstore, new_vectorstore, compact,
+    compact_in_background, clear_index_dir, get_docstore, delete_chunks, index_lock
+)
 import streamlit as st
 
+logger = logging.getLogger(__name__)
+
 FAISS_INDEX_DIR = "faiss_index"
 FAISS_METADATA_FILE = "faiss_metadata.json"
 UPLOADED_PDFS_FILE = "uploaded_pdfs.json"
 
+# One loaded store per process, shared by every Streamlit session and rerun.
+# It is only reloaded (incrementally when possible) after the manifest version moves.
+_vectorstore_lock = threading.Lock()
+_vectorstore_handle = {"vectorstore": None, "manifest": None}
+
 def ensure_faiss_dir():
     if not os.path.exists(FAISS_INDEX_DIR):
         os.makedirs(FAISS_INDEX_DIR)
 
+def has_faiss_data(manifest):
+    return bool(manifest["base"] or manifest["segments"])
+
 def get_faiss_vectorstore():
     ensure_faiss_dir()
     embeddings = get_local_embeddings()
@@ -24,38 +42,113 @@ def get_faiss_vectorstore():
         st.error("Failed to load embedding model")
         return None
     
-    index_path = os.path.join(FAISS_INDEX_DIR, "index")
-    if os.path.exists(index_path):
+    manifest = read_manifest(FAISS_INDEX_DIR)
+    if not has_faiss_data(manifest):
+        return None
+    
+    with _vectorstore_lock:
+        handle = _vectorstore_handle
+        if handle["manifest"] is not None and manifest_key(handle["manifest"]) == manifest_key(manifest):
+            return handle["vectorstore"]
         try:
-            vectorstore = FAISS.load_local(index_path, embeddings)
-            return vectorstore
+            vectorstore, loaded_manifest = refresh_vectorstore(
+                FAISS_INDEX_DIR, embeddings, EMBEDDING_DIMENSIONS, handle["vectorstore"], handle["manifest"]
+            )
         except Exception as e:
             st.error(f"Error loading existing Faiss index: {e}")
             return None
-    else:
-        return None
+        handle["vectorstore"], handle["manifest"] = vectorstore, loaded_manifest
+        return vectorstore
+
+def get_faiss_version():
+    """Version stamp of the on-disk store; changes whenever documents are added or cleared"""
+    return manifest_key(read_manifest(FAISS_INDEX_DIR))
+
+def invalidate_faiss_vectorstore():
+    with _vectorstore_lock:
+        _vectorstore_handle["vectorstore"] = None
+        _vectorstore_handle["manifest"] = None
+
+def remove_faiss_dir():
+    invalidate_faiss_vectorstore()
+    clear_index_dir(FAISS_INDEX_DIR)
 
 def create_faiss_vectorstore():
-    ensure_faiss_dir()
+    vectorstore = get_faiss_vectorstore()
+    if vectorstore is not None:
+        return vectorstore
+    
     embeddings = get_local_embeddings()
     if not embeddings:
         st.error("Failed to load embedding model")
         return None
-    
-    index_path = os.path.join(FAISS_INDEX_DIR, "index")
-    if os.path.exists(index_path):
-        try:
-            vectorstore = FAISS.load_local(index_path, embeddings)
-            return vectorstore
-        except Exception:
-            pass
-    
-    return FAISS.from_texts([], embeddings)
+    return new_vectorstore(FAISS_INDEX_DIR, embeddings, EMBEDDING_DIMENSIONS)
 
-def save_faiss_vectorstore(vectorstore):
+def compact_faiss_vectorstore():
+    """Fold all delta segments into one base index now instead of in the background"""
+    embeddings = get_local_embeddings()
+    if not embeddings:
+        st.error("Failed to load embedding model")
+        return None
+    ensure_faiss_dir()
+    return compact(FAISS_INDEX_DIR, embeddings, EMBEDDING_DIMENSIONS)
+
+def find_faiss_document(name_or_hash):
+    """Return (document_id, name) of an indexed document by file name or PDF hash, or None"""
     ensure_faiss_dir()
-    index_path = os.path.join(FAISS_INDEX_DIR, "index")
-    vectorstore.save_local(index_path)
+    return get_docstore(FAISS_INDEX_DIR).find_document(name_or_hash)
+
+def get_document_chunk_ids(name_or_hash):
+    """Chunk ids (the ids stored in the index) of one document; empty if it is not indexed"""
+    document = find_faiss_document(name_or_hash)
+    if document is None:
+        return np.zeros(0, dtype=np.int64)
+    return get_docstore(FAISS_INDEX_DIR).document_chunk_ids(document[0])
+
+def get_document_scoped_vectorstore(document_names):
+    """
+    The shared store restricted to the chunks of `document_names` (file names or
+    hashes), so searches skip every other tender. Documents that are not
+    indexed are reported; when none of them is, this returns None rather than
+    searching other tenders' documents.
+    """
+    vectorstore = get_faiss_vectorstore()
+    if vectorstore is None or not document_names:
+        return vectorstore
+    chunk_ids = {name: get_document_chunk_ids(name) for name in document_names}
+    missing = [name for name, ids in chunk_ids.items() if not len(ids)]
+    if len(missing) == len(chunk_ids):
+        st.error(f"None of the documents is in the Faiss index: {', '.join(missing)}")
+        return None
+    if missing:
+        st.warning(f"Not in the Faiss index, so left out of the search: {', '.join(missing)}")
+    return vectorstore.restrict_to(np.concatenate(list(chunk_ids.values())))
+
+def list_faiss_documents():
+    """Name, hash, chunk count and chunk id range of every indexed document"""
+    ensure_faiss_dir()
+    return get_docstore(FAISS_INDEX_DIR).list_documents()
+
+def delete_faiss_chunks(chunk_ids):
+    """Remove chunks from the index and docstore; other documents are untouched"""
+    if not len(chunk_ids):
+        return 0
+    delete_chunks(FAISS_INDEX_DIR, chunk_ids)
+    embeddings = get_local_embeddings()
+    if embeddings:
+        compact_in_background(FAISS_INDEX_DIR, embeddings, EMBEDDING_DIMENSIONS)
+    return len(chunk_ids)
+
+def delete_document(name_or_hash):
+    """Delete one document's vectors and chunks by file name or PDF hash; returns chunks removed"""
+    with index_lock(FAISS_INDEX_DIR):
+        document = find_faiss_document(name_or_hash)
+        if document is None:
+            return 0
+        docstore = get_docstore(FAISS_INDEX_DIR)
+        removed = delete_faiss_chunks(docstore.document_chunk_ids(document[0]))
+        docstore.delete_document(document[0])
+    return removed
 
 def load_uploaded_pdfs():
     if os.path.exists(UPLOADED_PDFS_FILE):
@@ -88,62 +181,226 @@ def get_uploaded_pdfs_list():
 def clear_uploaded_pdfs():
     if os.path.exists(UPLOADED_PDFS_FILE):
         os.remove(UPLOADED_PDFS_FILE)
-    if os.path.exists(FAISS_INDEX_DIR):
-        import shutil
-        shutil.rmtree(FAISS_INDEX_DIR)
+    remove_faiss_dir()
 
-def upload_chunks_to_faiss(chunks, metadatas, pdf_filename=None):
+def embed_chunks(chunks, embeddings_model):
+    """Embed chunk texts, reusing cached vectors for chunks seen before"""
+    cache = get_embedding_cache()
+    if cache is None:
+        return embeddings_model.embed_documents(chunks), None
+    hits, misses = cache.hits, cache.misses
+    vectors = cache.embed_documents(embeddings_model, chunks)
+    return vectors, (cache.hits - hits, cache.misses - misses)
+
+def prefetch(iterable, depth=2):
+    """
+    Run `iterable` on a background thread, keeping at most `depth` items ready.
+
+    Lets extraction of the next batch overlap with embedding of the current one.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+    
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def iter_length_sorted_batches(chunk_stream, batch_size, window_batches=4):
+    """
+    Group (text, metadata) pairs into fixed-size batches of similar length.
+
+    Only `window_batches` batches are buffered and sorted at a time, so similar
+    lengths end up together (less padding in the embedding model) while memory
+    stays bounded.
+    """
+    window = []
+    for item in chunk_stream:
+        window.append(item)
+        if len(window) >= batch_size * window_batches:
+            window.sort(key=lambda pair: len(pair[0]))
+            for start in range(0, len(window), batch_size):
+                yield window[start:start + batch_size]
+            window = []
+    window.sort(key=lambda pair: len(pair[0]))
+    for start in range(0, len(window), batch_size):
+        yield window[start:start + batch_size]
+
+def upload_chunk_stream(chunk_stream, pdf_filename=None, batch_size=EMBEDDING_BATCH_SIZE, progress_fn=None,
+                        pdf_hash=None):
+    """
+    Embed and index a stream of (chunk_text, metadata) pairs batch by batch.
+
+    `progress_fn(added)` may return (fraction, text) for the progress bar; it
+    is polled after every batch with the number of chunks added so far. `pdf_hash` is recorded so the document can later
+    be deleted by hash. Returns the number of chunks added (0 on failure).
+    """
     embeddings_model = get_local_embeddings()
     if not embeddings_model:
         st.error("Failed to load embedding model")
-        return
-    
-    vectorstore = get_faiss_vectorstore()
-    if vectorstore is None:
-        vectorstore = create_faiss_vectorstore()
-    
-    if vectorstore is None:
-        st.error("Failed to create Faiss vector store")
-        return
+        return 0
     
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    documents = []
-    for i, chunk in enumerate(chunks):
-        progress = (i + 1) / len(chunks)
-        progress_bar.progress(progress)
-        status_text.text(f"Preparing embedding {i + 1}/{len(chunks)} for {pdf_filename or 'PDF'}")
-        
-        metadata = metadatas[i].copy()
-        if pdf_filename:
-            metadata["document_name"] = pdf_filename
-        
-        doc = Document(
-            page_content=chunk,
-            metadata=metadata
-        )
-        documents.append(doc)
-    
-    status_text.text(f"Adding {len(documents)} documents to Faiss index...")
-    
+    # Ingest only appends a segment; readers pick it up through get_faiss_vectorstore()
+    segment = SegmentWriter(FAISS_INDEX_DIR)
+    added = 0
+    hits = misses = 0
     try:
-        vectorstore.add_documents(documents)
-        save_faiss_vectorstore(vectorstore)
+        for batch in prefetch(iter_length_sorted_batches(chunk_stream, batch_size)):
+            texts = [text for text, _ in batch]
+            metadatas = []
+            for _, metadata in batch:
+                metadata = metadata.copy()
+                if pdf_filename:
+                    metadata["document_name"] = pdf_filename
+                metadatas.append(metadata)
+            
+            vectors, cache_counts = embed_chunks(texts, embeddings_model)
+            if cache_counts:
+                hits += cache_counts[0]
+                misses += cache_counts[1]
+            segment.append(texts, metadatas, vectors)
+            added += len(batch)
+            
+            if progress_fn:
+                fraction, text = progress_fn(added)
+                progress_bar.progress(min(fraction, 1.0))
+                status_text.text(f"{text} - {added} chunks embedded")
+        
+        status_text.text(f"Saving {added} new documents to the Faiss index...")
+        segment.commit()
+        if pdf_filename and pdf_hash and added:
+            segment.docstore.set_document_hash(pdf_filename, pdf_hash)
+        compact_in_background(FAISS_INDEX_DIR, embeddings_model, EMBEDDING_DIMENSIONS)
         progress_bar.empty()
         status_text.empty()
-        st.success(f"Successfully added {len(documents)} documents to Faiss index")
+        st.success(f"Successfully added {added} documents to Faiss index")
+        if hits or misses:
+            st.info(f"Embedding cache: {hits} hits, {misses} misses for {pdf_filename or 'PDF'}")
     except Exception as e:
+        segment.abort()
+        added = 0
         progress_bar.empty()
         status_text.empty()
         st.error(f"Error adding documents to Faiss: {e}")
+        logger.exception("Error adding %s to Faiss", pdf_filename or "documents")
+    return added
+
+def add_retrieval_stat(stats, source, milliseconds):
+    """Count a query under its hit source ("lexical", "hybrid" or "vector") with its latency"""
+    if stats is not None:
+        count, total = stats.get(source, (0, 0.0))
+        stats[source] = (count + 1, total + milliseconds)
+
+def lexical_hits(vectorstore, query, k):
+    """Chunks containing every exact code in the query (clause/item numbers), best BM25 first"""
+    codes = code_terms(query)
+    return [doc for doc, _ in vectorstore.lexical_search(codes, k)] if codes else []
+
+def merge_lexical_hits(lexical, vector_docs, k):
+    """Exact-code hits first, then vector hits not already among them, up to k"""
+    seen = {doc.metadata.get("chunk_id") for doc in lexical}
+    return (lexical + [doc for doc in vector_docs if doc.metadata.get("chunk_id") not in seen])[:k]
+
+def hybrid_search(vectorstore, query, k=4, embedding=None, mode=RETRIEVAL_MODE):
+    """
+    Top-k Documents for one query and their source. In "hybrid" mode a query
+    carrying exact codes ("Clause 14.2", "BOQ item 3.1.4") is answered from the
+    inverted index when it has k hits ("lexical"), without embedding anything;
+    fewer hits go first and the vector search fills the rest ("hybrid").
+    """
+    lexical = lexical_hits(vectorstore, query, k) if mode == "hybrid" else []
+    if len(lexical) >= k:
+        return lexical[:k], "lexical"
+    if embedding is None:
+        embedding = vectorstore.embeddings.embed_query(query)
+    vector_docs = vectorstore.similarity_search_by_vector(embedding, k)
+    return merge_lexical_hits(lexical, vector_docs, k), "hybrid" if lexical else "vector"
+
+def retrieve_for_queries(vectorstore, queries, k=4, batch_size=QUERY_EMBEDDING_BATCH_SIZE, progress_fn=None,
+                         mode=RETRIEVAL_MODE, stats=None):
+    """
+    Bulk retrieval: the top-k Documents for every query, in query order.
+
+    Identical queries are embedded once, in batches of `batch_size`, and all of
+    them go through a single matrix search and a single docstore read, instead
+    of one forward pass and one search per query. `progress_fn(done, total)` is
+    called after each embedding batch.
+
+    In "hybrid" mode queries with exact codes are looked up in the inverted
+    index first (see hybrid_search); those with k exact hits skip embedding.
+    `stats` (a dict) collects query counts and latency per hit source.
+    """
+    unique_queries = list(dict.fromkeys(queries))
+    lexical = {}
+    lexical_ms = {}
+    for query in unique_queries if mode == "hybrid" else []:
+        started = time.perf_counter()
+        lexical[query] = lexical_hits(vectorstore, query, k)
+        lexical_ms[query] = (time.perf_counter() - started) * 1000
+    vector_queries = [query for query in unique_queries if len(lexical.get(query, [])) < k]
+
+    started = time.perf_counter()
+    vectors = []
+    for start in range(0, len(vector_queries), batch_size):
+        vectors.extend(vectorstore.embeddings.embed_documents(vector_queries[start:start + batch_size]))
+        if progress_fn:
+            progress_fn(min(start + batch_size, len(vector_queries)), len(vector_queries))
+    hits_by_query = {}
+    if vectors:
+        hits = vectorstore.similarity_search_by_vectors(np.asarray(vectors, dtype=np.float32), k)
+        hits_by_query = {query: [doc for doc, _ in row] for query, row in zip(vector_queries, hits)}
+    vector_ms = (time.perf_counter() - started) * 1000 / max(len(vector_queries), 1)
+
+    results = {}
+    for query in unique_queries:
+        exact = lexical.get(query, [])
+        if len(exact) >= k:
+            results[query] = exact[:k]
+            add_retrieval_stat(stats, "lexical", lexical_ms[query])
+        else:
+            results[query] = merge_lexical_hits(exact, hits_by_query.get(query, []), k)
+            add_retrieval_stat(stats, "hybrid" if exact else "vector", lexical_ms.get(query, 0.0) + vector_ms)
+    return [results[query] for query in queries]
+
+def upload_chunks_to_faiss(chunks, metadatas, pdf_filename=None):
+    return upload_chunk_stream(zip(chunks, metadatas), pdf_filename)
 
 def clear_faiss_collection():
     try:
-        if os.path.exists(FAISS_INDEX_DIR):
-            import shutil
-            shutil.rmtree(FAISS_INDEX_DIR)
+        remove_faiss_dir()
         return True
     except Exception as e:
         st.error(f"Error clearing Faiss index: {e}")
+        logger.exception("Error clearing Faiss index")
         return False 
\ No newline at end of file
@@ -0,0 +1,71 @@
+import os
+import json
+
+FILL_JOBS_DIR = "fill_jobs"
+
+class FillCheckpoint:
+    """
+    Completed rows of one Excel fill job, one JSON line per row in row order,
+    so a rerun of the job regenerates only the rows after the last one written.
+
+    Rows are reused as they were written. Rows generated after a resume match
+    an uninterrupted run only with greedy decoding (LLM_DETERMINISTIC);
+    sampled rows come out differently each time they are generated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def load(self, row_count):
+        """
+        Read the completed rows, at most `row_count`. A torn last line (the
+        process died mid-write) or a row out of order ends the checkpoint and
+        is cut off, so later appends stay valid.
+        """
+        rows = []
+        if not os.path.exists(self.path):
+            return rows
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n") or row.get("row") != len(rows) or len(rows) == row_count:
+                    break
+                rows.append(row)
+                valid_bytes += len(line)
+        if valid_bytes != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return rows
+
+    def append(self, rows):
+        """Durably add completed rows; they must follow the rows already written"""
+        if not rows:
+            return
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write("".join(json.dumps(row) + "\n" for row in rows))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        """Drop the checkpoint once the job's workbook is saved"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,40 @@
+import torch
+from transformers import AutoModelForCausalLM
+
+# Kept free of streamlit so benchmark_inference.py can load models the same way the app does
+INFERENCE_MODES = ("gpu", "cpu_fp32", "cpu_bf16", "cpu_int8")
+
+def resolve_inference_mode(mode, use_cuda=True):
+    """"auto" -> "gpu" when CUDA is usable, else "cpu_bf16" """
+    if mode == "auto":
+        return "gpu" if use_cuda and torch.cuda.is_available() else "cpu_bf16"
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown LLM_INFERENCE_MODE {mode!r}; expected auto or one of {INFERENCE_MODES}")
+    return mode
+
+def configure_cpu_threads(threads):
+    """Set torch's intra-op thread count (0 keeps torch's default of one per physical core)"""
+    if threads:
+        torch.set_num_threads(threads)
+    return torch.get_num_threads()
+
+def load_causal_lm(model_path, mode, device_map="auto"):
+    """
+    Load a causal LM for an inference mode:
+    gpu      - float16 weights placed by `device_map`
+    cpu_fp32 - float32 on CPU (the reference for quality checks)
+    cpu_bf16 - bfloat16 on CPU; halves memory, fast on CPUs with AVX512-BF16/AMX
+    cpu_int8 - float32 with every nn.Linear dynamically quantized to int8 weights
+    """
+    if mode == "gpu":
+        return AutoModelForCausalLM.from_pretrained(
+            model_path, torch_dtype=torch.float16, device_map=device_map, trust_remote_code=True
+        )
+    dtype = torch.bfloat16 if mode == "cpu_bf16" else torch.float32
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, torch_dtype=dtype, low_cpu_mem_usage=True, trust_remote_code=True
+    )
+    model.eval()
+    if mode == "cpu_int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
@@ -0,0 +1,242 @@
+import os
+import time
+import shutil
+import sqlite3
+import threading
+
+INGEST_QUEUE_DIR = "ingest_queue"
+ACTIVE_STATUSES = ("queued", "running")
+
+class IngestQueue:
+    """
+    Persistent queue of PDF ingest jobs, shared by the app and the ingest worker.
+
+    Deleting a document and clearing the index are queued too (`action`
+    "delete" and "clear"), so the worker is the only process writing the index.
+    Each ingest job owns a copy of its PDF under `queue_dir`, so it can be processed
+    after the upload's temporary file is gone or the app restarted. Jobs move
+    queued -> running -> done | failed; finished jobs keep their page and chunk
+    counts and timings for throughput reporting. A single worker process is
+    registered at a time and proves it is alive with a heartbeat.
+    """
+
+    def __init__(self, queue_dir=INGEST_QUEUE_DIR):
+        self.queue_dir = queue_dir
+        self.pdf_dir = os.path.join(queue_dir, "pdfs")
+        os.makedirs(self.pdf_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(queue_dir, "jobs.sqlite"), check_same_thread=False, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, pdf_filename TEXT NOT NULL, pdf_hash TEXT NOT NULL, pdf_path TEXT NOT NULL, "
+            "status TEXT NOT NULL, action TEXT NOT NULL DEFAULT 'ingest', kind TEXT, pages_done INTEGER NOT NULL DEFAULT 0, "
+            "pages_total INTEGER NOT NULL DEFAULT 0, chunks INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, "
+            "error TEXT, created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(jobs)")]
+        if "action" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN action TEXT NOT NULL DEFAULT 'ingest'")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS worker (id INTEGER PRIMARY KEY CHECK (id = 0), pid INTEGER, heartbeat REAL)")
+        self.db.commit()
+
+    def enqueue(self, pdf_path, pdf_filename, pdf_hash):
+        """
+        Queue a PDF for ingestion and return the job id. An upload of the same
+        file that is still queued, running or failed returns that job instead.
+        """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT id FROM jobs WHERE action = 'ingest' AND pdf_filename = ? AND pdf_hash = ? "
+                "AND status IN ('queued', 'running', 'failed') ORDER BY id DESC LIMIT 1", (pdf_filename, pdf_hash)
+            ).fetchone()
+            if row:
+                return row["id"]
+            stored_path = os.path.join(self.pdf_dir, f"{pdf_hash}.pdf")
+            shutil.copy2(pdf_path, stored_path)
+            cursor = self.db.execute(
+                "INSERT INTO jobs (pdf_filename, pdf_hash, pdf_path, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                (pdf_filename, pdf_hash, stored_path, time.time())
+            )
+            self.db.commit()
+            return cursor.lastrowid
+
+    def enqueue_task(self, action, name=""):
+        """
+        Queue a "delete" of document `name` (file name or hash) or a "clear" of
+        the whole index and return the job id; the same task still queued is reused.
+        """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT id FROM jobs WHERE action = ? AND pdf_filename = ? AND status = 'queued'", (action, name)
+            ).fetchone()
+            if row:
+                return row["id"]
+            cursor = self.db.execute(
+                "INSERT INTO jobs (pdf_filename, pdf_hash, pdf_path, status, action, created) "
+                "VALUES (?, '', '', 'queued', ?, ?)", (name, action, time.time())
+            )
+            self.db.commit()
+            return cursor.lastrowid
+
+    def claim_next(self, actions=("ingest",)):
+        """
+        Mark the oldest queued job of `actions` running and return it, or None
+        when there is none. An upload of a file name that is still being ingested
+        waits for that job, so two versions of one PDF are never ingested at once.
+        """
+        placeholders = ",".join("?" * len(actions))
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                f"SELECT * FROM jobs WHERE status = 'queued' AND action IN ({placeholders}) AND NOT ("
+                "action = 'ingest' AND pdf_filename IN ("
+                "SELECT pdf_filename FROM jobs WHERE status = 'running' AND action = 'ingest')"
+                ") ORDER BY id LIMIT 1",
+                tuple(actions)
+            ).fetchone()
+            if row is None:
+                self.db.rollback()
+                return None
+            self.db.execute(
+                "UPDATE jobs SET status = 'running', started = ?, attempts = attempts + 1, pages_done = 0, "
+                "chunks = 0, error = NULL WHERE id = ?", (time.time(), row["id"])
+            )
+            self.db.commit()
+            return dict(row, status="running")
+
+    def update_progress(self, job_id, pages_done, pages_total, chunks, kind=None):
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET pages_done = ?, pages_total = ?, chunks = ?, kind = COALESCE(?, kind) WHERE id = ?",
+                (pages_done, pages_total, chunks, kind, job_id)
+            )
+            self.db.commit()
+
+    def finish(self, job_id, error=None):
+        """Mark a job done, or failed with `error`; a done job's PDF copy is removed"""
+        with self._lock:
+            row = self.db.execute("SELECT pdf_path, pdf_hash FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self.db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id)
+            )
+            self.db.commit()
+            if row and row["pdf_path"] and not error:
+                # another queued or failed job may still need the same copy
+                shared = self.db.execute(
+                    "SELECT 1 FROM jobs WHERE pdf_hash = ? AND status != 'done' LIMIT 1", (row["pdf_hash"],)
+                ).fetchone()
+                if not shared and os.path.exists(row["pdf_path"]):
+                    os.remove(row["pdf_path"])
+
+    def retry(self, job_id):
+        """Queue a failed job again"""
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET status = 'queued', error = NULL, started = NULL, finished = NULL "
+                "WHERE id = ? AND status = 'failed'", (job_id,)
+            )
+            self.db.commit()
+
+    def requeue_interrupted(self):
+        """Queue again the jobs a previous worker was running when it stopped; returns how many"""
+        with self._lock:
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, pages_done = 0, chunks = 0 WHERE status = 'running'"
+            )
+            self.db.commit()
+            return cursor.rowcount
+
+    def wait(self, job_id, timeout, poll_seconds):
+        """The job once it has finished, or None if it is still queued or running after `timeout` seconds"""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get_jobs([job_id])[job_id]
+            if job["status"] in ("done", "failed"):
+                return job
+            if time.time() >= deadline:
+                return None
+            time.sleep(poll_seconds)
+
+    def get_jobs(self, job_ids):
+        """{id: job dict} for the given ids"""
+        job_ids = [int(job_id) for job_id in job_ids]
+        if not job_ids:
+            return {}
+        placeholders = ",".join("?" * len(job_ids))
+        with self._lock:
+            rows = self.db.execute(f"SELECT * FROM jobs WHERE id IN ({placeholders})", job_ids).fetchall()
+        return {row["id"]: job_summary(row) for row in rows}
+
+    def recent_jobs(self, limit=20):
+        """Newest jobs first"""
+        with self._lock:
+            rows = self.db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [job_summary(row) for row in rows]
+
+    def stats(self):
+        """Job counts by status and the pages/chunks per second of all finished jobs"""
+        with self._lock:
+            counts = dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            pages, chunks, seconds = self.db.execute(
+                "SELECT COALESCE(SUM(pages_total), 0), COALESCE(SUM(chunks), 0), COALESCE(SUM(finished - started), 0) "
+                "FROM jobs WHERE status = 'done' AND action = 'ingest' AND started IS NOT NULL"
+            ).fetchone()
+        return {
+            "counts": {status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")},
+            "pages_per_second": pages / seconds if seconds else 0.0,
+            "chunks_per_second": chunks / seconds if seconds else 0.0,
+        }
+
+    def register_worker(self, pid, timeout):
+        """Become the queue's worker unless another one sent a heartbeat within `timeout` seconds"""
+        now = time.time()
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute("SELECT pid, heartbeat FROM worker WHERE id = 0").fetchone()
+            if row and row["pid"] != pid and now - row["heartbeat"] < timeout:
+                self.db.rollback()
+                return False
+            self.db.execute("INSERT OR REPLACE INTO worker (id, pid, heartbeat) VALUES (0, ?, ?)", (pid, now))
+            self.db.commit()
+            return True
+
+    def heartbeat(self, pid):
+        with self._lock:
+            self.db.execute("UPDATE worker SET heartbeat = ? WHERE id = 0 AND pid = ?", (time.time(), pid))
+            self.db.commit()
+
+    def unregister_worker(self, pid):
+        with self._lock:
+            self.db.execute("DELETE FROM worker WHERE id = 0 AND pid = ?", (pid,))
+            self.db.commit()
+
+    def worker_alive(self, timeout):
+        with self._lock:
+            row = self.db.execute("SELECT heartbeat FROM worker WHERE id = 0").fetchone()
+        return row is not None and time.time() - row["heartbeat"] < timeout
+
+def job_summary(row):
+    """Job dict with its progress fraction, elapsed seconds and throughput"""
+    job = dict(row)
+    end = job["finished"] or time.time()
+    job["elapsed"] = end - job["started"] if job["started"] else 0.0
+    job["fraction"] = 1.0 if job["status"] == "done" else (
+        job["pages_done"] / job["pages_total"] if job["pages_total"] else 0.0
+    )
+    job["pages_per_second"] = job["pages_done"] / job["elapsed"] if job["elapsed"] else 0.0
+    job["chunks_per_second"] = job["chunks"] / job["elapsed"] if job["elapsed"] else 0.0
+    return job
+
+# One connection per process, shared by every Streamlit session and rerun
+_queue_lock = threading.Lock()
+_queue_handle = {"queue": None}
+
+def get_ingest_queue():
+    with _queue_lock:
+        if _queue_handle["queue"] is None:
+            _queue_handle["queue"] = IngestQueue()
+        return _queue_handle["queue"]
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import subprocess
+
+from model_config import INGEST_WORKERS, INGEST_POLL_SECONDS, INGEST_WORKER_TIMEOUT_SECONDS
+from ingest_queue import IngestQueue, get_ingest_queue
+
+logger = logging.getLogger("ingest_worker")
+_spawned = {"at": 0.0}
+
+def process_job(queue, job, extraction_workers):
+    """Ingest one claimed job's PDF, or replace the indexed version of a changed one"""
+    from embedder import is_pdf_already_uploaded, is_pdf_indexed, ingest_pdf, replace_document, mark_pdf_as_uploaded
+
+    job_id, pdf_path, pdf_filename = job["id"], job["pdf_path"], job["pdf_filename"]
+
+    def on_batch(done_pages, total_pages, chunks):
+        queue.update_progress(job_id, done_pages, total_pages, chunks)
+
+    try:
+        if is_pdf_already_uploaded(pdf_path, pdf_filename):
+            queue.update_progress(job_id, 0, 0, 0, kind="skipped")
+            queue.finish(job_id)
+            return
+        # A job interrupted mid-ingest left uncommitted chunks under this name;
+        # the replace path deletes them together with any older version.
+        if is_pdf_indexed(pdf_filename):
+            queue.update_progress(job_id, 0, 0, 0, kind="replace")
+            added = replace_document(pdf_path, pdf_filename, extraction_workers, on_batch=on_batch)
+        else:
+            queue.update_progress(job_id, 0, 0, 0, kind="ingest")
+            added = ingest_pdf(pdf_path, pdf_filename, extraction_workers, pdf_hash=job["pdf_hash"], on_batch=on_batch)
+            if added:
+                mark_pdf_as_uploaded(pdf_path, pdf_filename)
+        queue.finish(job_id, None if added else "No chunks were added to the index (see the worker log)")
+    except Exception as e:
+        logger.exception("Ingest job %s (%s) failed", job_id, pdf_filename)
+        queue.finish(job_id, str(e))
+
+def process_task(queue, job):
+    """Run a queued delete or clear, the index changes the app hands to the worker"""
+    from embedder import delete_document, clear_faiss_collection, clear_uploaded_pdfs
+
+    try:
+        if job["action"] == "delete":
+            removed = delete_document(job["pdf_filename"])
+            queue.update_progress(job["id"], 0, 0, removed, kind="delete")
+            queue.finish(job["id"])
+        elif job["action"] == "clear":
+            cleared = clear_faiss_collection()
+            clear_uploaded_pdfs()
+            queue.update_progress(job["id"], 0, 0, 0, kind="clear")
+            queue.finish(job["id"], None if cleared else "The Faiss index could not be cleared (see the worker log)")
+        else:
+            queue.finish(job["id"], f"Unknown action {job['action']!r}")
+    except Exception as e:
+        logger.exception("Job %s (%s %s) failed", job["id"], job["action"], job["pdf_filename"])
+        queue.finish(job["id"], str(e))
+
+def run_worker(workers=INGEST_WORKERS, poll_seconds=INGEST_POLL_SECONDS, timeout=INGEST_WORKER_TIMEOUT_SECONDS):
+    """
+    Process queued ingest jobs on a fixed pool of `workers` threads until
+    interrupted, and deletes and clears on one more thread so they do not wait
+    behind long ingests. All threads share this process's embedding model; only
+    one worker process runs per queue. Returns 1 if another worker is already running.
+    """
+    queue = IngestQueue()
+    pid = os.getpid()
+    if not queue.register_worker(pid, timeout):
+        logger.info("Another ingest worker is running; exiting")
+        return 1
+    stopping = threading.Event()
+
+    def beat():
+        # from a thread of its own, so the heartbeat keeps going while the model loads
+        while not stopping.wait(min(poll_seconds, timeout / 3)):
+            queue.heartbeat(pid)
+
+    threading.Thread(target=beat, name="ingest-heartbeat", daemon=True).start()
+    from pdf_extraction import EXTRACTION_WORKERS
+    from local_models import get_local_embeddings
+
+    requeued = queue.requeue_interrupted()
+    if requeued:
+        logger.info("Re-queued %d job(s) interrupted by the previous worker", requeued)
+    if not get_local_embeddings():
+        logger.error("Failed to load embedding model")
+        stopping.set()
+        queue.unregister_worker(pid)
+        return 1
+    # the page extraction pool is split between the jobs running at once
+    extraction_workers = max(1, EXTRACTION_WORKERS // workers)
+
+    def work():
+        while not stopping.is_set():
+            job = queue.claim_next()
+            if job is None:
+                stopping.wait(poll_seconds)
+                continue
+            started = time.perf_counter()
+            logger.info("Ingesting %s (job %s)", job["pdf_filename"], job["id"])
+            process_job(queue, job, extraction_workers)
+            finished = queue.get_jobs([job["id"]])[job["id"]]
+            logger.info(
+                "Job %s %s in %.1f s: %d pages, %d chunks (%.1f pages/s, %.1f chunks/s)",
+                job["id"], finished["status"], time.perf_counter() - started, finished["pages_total"],
+                finished["chunks"], finished["pages_per_second"], finished["chunks_per_second"]
+            )
+
+    def maintain():
+        while not stopping.is_set():
+            job = queue.claim_next(("delete", "clear"))
+            if job is None:
+                stopping.wait(poll_seconds)
+                continue
+            logger.info("Running %s %s (job %s)", job["action"], job["pdf_filename"], job["id"])
+            process_task(queue, job)
+
+    threads = [threading.Thread(target=work, name=f"ingest-{i}", daemon=True) for i in range(workers)]
+    threads.append(threading.Thread(target=maintain, name="ingest-maintenance", daemon=True))
+    for thread in threads:
+        thread.start()
+    logger.info("Ingest worker %d started with %d thread(s)", pid, workers)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        # running jobs are re-queued by the next worker
+        pass
+    finally:
+        stopping.set()
+        queue.unregister_worker(pid)
+    return 0
+
+def ensure_worker_running(timeout=INGEST_WORKER_TIMEOUT_SECONDS):
+    """
+    Start the worker process in the background unless one is alive or was
+    started within `timeout` seconds; returns True if it was started. It runs in
+    this process's directory (the index and queue paths are relative) and keeps
+    running when the app stops.
+    """
+    if get_ingest_queue().worker_alive(timeout) or time.time() - _spawned["at"] < timeout:
+        return False
+    _spawned["at"] = time.time()
+    subprocess.Popen([sys.executable, os.path.abspath(__file__)], start_new_session=True)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Background worker that ingests the PDFs queued by the app")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--poll-seconds", type=float, default=INGEST_POLL_SECONDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(message)s")
+    return run_worker(args.workers, args.poll_seconds)
+
+if __name__ == "__main__":
+    sys.exit(main())
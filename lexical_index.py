@@ -0,0 +1,27 @@
+import re
+
+# Terms are lowercased words and codes; a code keeps its inner separators ("14.2", "3.1.4", "is-8329")
+TERM_PATTERN = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+FTS_TOKENIZER = "unicode61 tokenchars '.-/'"
+
+def lexical_terms(text):
+    """Index terms of a chunk or query, in order"""
+    return TERM_PATTERN.findall(text.lower())
+
+def code_terms(query):
+    """
+    Exact identifiers in a query: clause and item numbers ("14.2", "3.1.4")
+    and codes mixing letters with digits ("k9", "dn300", "is-8329"). Plain
+    numbers and words are left to the embedding search.
+    """
+    codes = []
+    for term in lexical_terms(query):
+        has_digit = any(ch.isdigit() for ch in term)
+        if has_digit and (any(ch in "./-" for ch in term) or any(ch.isalpha() for ch in term)):
+            if term not in codes:
+                codes.append(term)
+    return codes
+
+def match_expression(terms):
+    """FTS5 MATCH expression requiring every term"""
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
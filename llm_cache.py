@@ -0,0 +1,131 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, List, Optional
+from langchain.llms.base import LLM
+
+LLM_CACHE_DIR = "llm_cache"
+
+class LLMResponseCache:
+    """
+    Persistent LLM response cache keyed by sha256(model + generation settings + prompt).
+
+    Entries older than `max_age_seconds` are ignored and purged; beyond
+    `max_entries` the least recently used ones are evicted. Only greedy
+    decoding makes a cached answer the answer the model would give again;
+    with sampling it is simply the first sample.
+    """
+
+    def __init__(self, model_name, max_new_tokens, temperature, deterministic, max_entries, max_age_seconds,
+                 cache_dir=LLM_CACHE_DIR):
+        decoding = "greedy" if deterministic else f"sample:{temperature}"
+        self.settings = f"{model_name}\0{max_new_tokens}\0{decoding}"
+        self.capacity = max_entries
+        self.max_age = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "responses.sqlite"), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key BLOB PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created)")
+        self.db.commit()
+        self.evict()
+
+    def _key(self, prompt):
+        return hashlib.sha256(f"{self.settings}\0{prompt}".encode("utf-8")).digest()
+
+    def get_many(self, prompts):
+        """Return the cached response (str) or None for every prompt"""
+        keys = [self._key(prompt) for prompt in prompts]
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self.db.execute(
+                    f"SELECT key, response FROM responses WHERE key IN ({placeholders}) AND created >= ?",
+                    batch + [now - self.max_age]
+                ).fetchall())
+            if found:
+                self.db.executemany(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", ((now, key) for key in found)
+                )
+                self.db.commit()
+        results = [found.get(key) for key in keys]
+        hits = len([response for response in results if response is not None])
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def get(self, prompt):
+        return self.get_many([prompt])[0]
+
+    def put_many(self, prompts, responses):
+        now = time.time()
+        with self._lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                ((self._key(prompt), response, now, now) for prompt, response in zip(prompts, responses))
+            )
+            self.db.commit()
+            self._puts_since_evict += len(prompts)
+            due = self._puts_since_evict >= max(1, self.capacity // 100)
+        if due:
+            self.evict()
+
+    def put(self, prompt, response):
+        self.put_many([prompt], [response])
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above capacity"""
+        with self._lock:
+            self._puts_since_evict = 0
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+            (entries,) = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if entries > self.capacity:
+                self.db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)", (entries - self.capacity,)
+                )
+            self.db.commit()
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "capacity": self.capacity,
+        }
+
+class CachedLLM(LLM):
+    """LangChain LLM that answers from an LLMResponseCache before calling the wrapped LLM"""
+
+    llm: Any
+    response_cache: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.llm._llm_type}"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        cached = self.response_cache.get(prompt)
+        if cached is not None:
+            return cached
+        response = self.llm.predict(prompt, stop=stop, **kwargs)
+        self.response_cache.put(prompt, response)
+        return response
@@ -1,9 +1,5 @@
 import os
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from sentence_transformers import SentenceTransformer
-import torch
-from langchain.llms import HuggingFacePipeline
-from langchain.embeddings import HuggingFaceEmbeddings
+import threading
 import streamlit as st
 
 from model_config import (
@@ -12,31 +8,56 @@ from model_config import (
     MAX_NEW_TOKENS, 
     TEMPERATURE, 
     USE_CUDA, 
-    DEVICE_MAP
+    DEVICE_MAP,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    LLM_DETERMINISTIC,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_MAX_AGE_DAYS,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_MAX_AGE_HOURS,
+    ANSWER_CACHE_SIMILARITY,
+    PREFIX_KV_CACHE,
+    LLM_INFERENCE_MODE,
+    CPU_THREADS
 )
+from embedding_cache import EmbeddingCache
+from llm_cache import LLMResponseCache
+from answer_cache import SemanticAnswerCache
+
+# torch, transformers and the LangChain HF wrappers take seconds to import; they are
+# imported inside the loaders below so the app renders before any model is needed.
+
+def generation_kwargs(tokenizer):
+    """Decoding settings shared by the pipeline and the prefix-cached generate path"""
+    # Greedy decoding when deterministic; temperature only applies when sampling
+    sampling = {"do_sample": False} if LLM_DETERMINISTIC else {"do_sample": True, "temperature": TEMPERATURE}
+    return {"max_new_tokens": MAX_NEW_TOKENS, "pad_token_id": tokenizer.eos_token_id, **sampling}
 
 @st.cache_resource
 def load_gemma_model():
     """Load the Gemma model for text generation"""
     try:
+        from transformers import AutoTokenizer, pipeline
+        from langchain.llms import HuggingFacePipeline
+        from inference_profile import resolve_inference_mode, configure_cpu_threads, load_causal_lm
         # Load tokenizer and model
         tokenizer = AutoTokenizer.from_pretrained(GEMMA_MODEL_PATH)
-        model = AutoModelForCausalLM.from_pretrained(
-            GEMMA_MODEL_PATH,
-            torch_dtype=torch.float16,
-            device_map=DEVICE_MAP,
-            trust_remote_code=True
-        )
+        # Batched generation pads prompts; decoder-only models need the padding on the left
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        mode = resolve_inference_mode(LLM_INFERENCE_MODE, USE_CUDA)
+        if mode != "gpu":
+            configure_cpu_threads(CPU_THREADS)
+        model = load_causal_lm(GEMMA_MODEL_PATH, mode, DEVICE_MAP)
         
         # Create pipeline
         pipe = pipeline(
             "text-generation",
             model=model,
             tokenizer=tokenizer,
-            max_new_tokens=MAX_NEW_TOKENS,
-            temperature=TEMPERATURE,
-            do_sample=True,
-            pad_token_id=tokenizer.eos_token_id
+            **generation_kwargs(tokenizer)
         )
         
         return HuggingFacePipeline(pipeline=pipe)
@@ -49,6 +70,8 @@ def load_gemma_model():
 def load_embedding_model():
     """Load the embedding model"""
     try:
+        import torch
+        from langchain.embeddings import HuggingFaceEmbeddings
         return HuggingFaceEmbeddings(
             model_name=EMBEDDING_MODEL_PATH,
             model_kwargs={'device': 'cuda' if USE_CUDA and torch.cuda.is_available() else 'cpu'}
@@ -57,10 +80,101 @@ def load_embedding_model():
         st.error(f"Error loading embedding model: {e}")
         return None
 
+@st.cache_resource
+def load_embedding_cache():
+    """Open the on-disk chunk embedding cache shared by all sessions"""
+    try:
+        return EmbeddingCache(EMBEDDING_MODEL_PATH, EMBEDDING_DIMENSIONS, EMBEDDING_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        st.warning(f"Embedding cache unavailable, embedding without it: {e}")
+        return None
+
+@st.cache_resource
+def load_llm_cache():
+    """Open the on-disk LLM response cache shared by all sessions"""
+    try:
+        from inference_profile import resolve_inference_mode
+        # Quantized and bf16 modes answer slightly differently, so they get their own entries
+        model_name = f"{GEMMA_MODEL_PATH}:{resolve_inference_mode(LLM_INFERENCE_MODE, USE_CUDA)}"
+        return LLMResponseCache(
+            model_name, MAX_NEW_TOKENS, TEMPERATURE, LLM_DETERMINISTIC,
+            LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE_DAYS * 24 * 3600
+        )
+    except Exception as e:
+        st.warning(f"LLM response cache unavailable, generating without it: {e}")
+        return None
+
+@st.cache_resource
+def load_answer_cache():
+    """In-memory semantic cache of chat answers shared by all sessions (None when disabled)"""
+    if not ANSWER_CACHE_MAX_ENTRIES:
+        return None
+    return SemanticAnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_MAX_AGE_HOURS * 3600, ANSWER_CACHE_SIMILARITY)
+
+@st.cache_resource
+def load_prefix_cache(prefix):
+    """KV cache of a prompt prefix shared by many prompts, built once per prefix"""
+    llm = load_gemma_model()
+    if not PREFIX_KV_CACHE or llm is None:
+        return None
+    try:
+        from prefix_cache import PrefixKVCache
+        pipe = llm.pipeline
+        return PrefixKVCache(pipe.model, pipe.tokenizer, prefix, **generation_kwargs(pipe.tokenizer))
+    except Exception as e:
+        st.warning(f"Prefix KV cache unavailable, prefilling full prompts: {e}")
+        return None
+
 def get_local_llm():
     """Get the local LLM instance"""
     return load_gemma_model()
 
 def get_local_embeddings():
     """Get the local embeddings instance"""
-    return load_embedding_model() 
\ No newline at end of file
+    return load_embedding_model() 
+
+def get_embedding_cache():
+    """Get the shared embedding cache (None if it could not be opened)"""
+    return load_embedding_cache()
+
+def get_llm_cache():
+    """Get the shared LLM response cache (None if it could not be opened)"""
+    return load_llm_cache()
+
+def get_answer_cache():
+    """Get the shared semantic answer cache (None if disabled)"""
+    return load_answer_cache()
+
+def get_prefix_cache(prefix):
+    """Get the KV cache for `prefix` (None if disabled or it could not be built)"""
+    return load_prefix_cache(prefix)
+
+def stream_generate(llm, prompt):
+    """
+    Yield the answer to `prompt` piece by piece as the model generates it.
+    LLMs without an HF pipeline yield their whole answer at once.
+    """
+    pipe = getattr(llm, "pipeline", None)
+    if pipe is None:
+        yield llm.predict(prompt)
+        return
+    from transformers import TextIteratorStreamer
+    streamer = TextIteratorStreamer(pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    inputs = pipe.tokenizer(prompt, return_tensors="pt").to(pipe.model.device)
+    errors = []
+
+    def generate():
+        try:
+            pipe.model.generate(**inputs, streamer=streamer, **generation_kwargs(pipe.tokenizer))
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # unblock the consumer below
+
+    worker = threading.Thread(target=generate, daemon=True)
+    worker.start()
+    for piece in streamer:
+        if piece:
+            yield piece
+    worker.join()
+    if errors:
+        raise errors[0]
@@ -11,11 +11,54 @@ EMBEDDING_MODEL_PATH = "sentence-transformers/all-MiniLM-L6-v2"  # Lightweight e
 # Model settings
 MAX_NEW_TOKENS = 512
 TEMPERATURE = 0.7
+LLM_BATCH_SIZE = 8  # Excel row prompts generated together per padded batch (1 = unbatched)
+FILL_CONCURRENCY = 2  # generation batches in flight while upcoming Excel rows are retrieved
+PREFIX_KV_CACHE = True  # compute the Excel instruction prefix's KV cache once and prefill only row text
+CONTEXT_TOKEN_BUDGET = 2048  # Gemma tokens of retrieved context per Excel row prompt (0 = no limit)
+EXCEL_STREAMING_MIN_ROWS = 50_000  # templates this long are read/written in openpyxl streaming mode (0 = never)
 EMBEDDING_DIMENSIONS = 384  # all-MiniLM-L6-v2 dimensions
+EMBEDDING_BATCH_SIZE = 64  # chunks embedded and added to the index per batch
+QUERY_EMBEDDING_BATCH_SIZE = 256  # Excel row queries embedded per forward pass during bulk retrieval
+RETRIEVAL_MODE = "hybrid"  # "hybrid": exact clause/item codes are looked up in the BM25 index first; "vector": embeddings only
+
+# LLM response cache settings
+LLM_DETERMINISTIC = False  # greedy decoding: the same prompt always gets the same (cacheable) answer
+LLM_CACHE_MAX_ENTRIES = 200_000
+LLM_CACHE_MAX_AGE_DAYS = 30
+
+# Chat settings
+CHAT_CONDENSE = "auto"  # "auto": rewrite only follow-ups that refer back (one LLM call otherwise); "always": every follow-up
+ANSWER_CACHE_SIMILARITY = 0.95  # cosine similarity at which a question reuses a cached answer
+ANSWER_CACHE_MAX_ENTRIES = 1_000  # 0 disables the semantic answer cache
+ANSWER_CACHE_MAX_AGE_HOURS = 24
+
+# Ingest worker settings
+INGEST_WORKERS = 2  # PDFs the background ingest worker processes at once; they share one embedding model
+INGEST_POLL_SECONDS = 1.0  # how often the worker checks for queued jobs and the app refreshes their progress
+INGEST_WORKER_TIMEOUT_SECONDS = 15  # a worker without a heartbeat for this long is considered stopped
+INGEST_TASK_WAIT_SECONDS = 60  # how long a delete or clear button waits for the worker before returning
+
+# Embedding cache settings
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000  # ~730 MB of float32 vectors at 384 dimensions
+
+# Vector index settings
+FAISS_INDEX_TYPE = "auto"  # "flat", "hnsw", "ivf_flat", "ivf_pq", or "auto" to pick by corpus size
+FAISS_TRAIN_MIN_VECTORS = 20_000  # stay on an exact flat index until IVF can be trained
+FAISS_AUTO_IVF_PQ_AT = 1_000_000  # "auto" switches from ivf_flat to ivf_pq at this many vectors
+FAISS_IVF_NLIST = 0  # 0 = about 4*sqrt(vectors) inverted lists
+FAISS_IVF_NPROBE = 16  # lists scanned per query (higher = better recall, slower)
+FAISS_PQ_M = 48  # PQ sub-quantizers for ivf_pq; must divide EMBEDDING_DIMENSIONS
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 64  # candidate list size per query (higher = better recall, slower)
 
 # Device settings
 USE_CUDA = True  # Set to False if you don't have CUDA
 DEVICE_MAP = "auto"  # or "cpu" for CPU-only
+LLM_INFERENCE_MODE = "auto"  # "gpu" (float16), "cpu_fp32", "cpu_bf16", "cpu_int8", or "auto" (gpu if CUDA, else cpu_bf16)
+CPU_THREADS = 0  # torch threads for CPU inference (0 = torch default, one per physical core)
+STARTUP_IMPORT_BUDGET_SECONDS = 3.0  # `python startup.py` fails when importing the app modules takes longer
+LOG_LEVEL = "INFO"  # level of the app's own logs (chat time to first token, ingest and index errors)
 
 """
 Example paths:
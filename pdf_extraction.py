@@ -0,0 +1,198 @@
+import os
+import time
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import tiktoken
+
+# Keep this module free of streamlit/torch imports: pool workers import it on
+# spawn (Windows) and should start in milliseconds, not seconds.
+
+ENCODING_NAME = "cl100k_base"
+EXTRACTION_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+PARALLEL_MIN_PAGES = 32  # below this the pool start-up costs more than it saves
+RANGES_PER_WORKER = 4  # smaller ranges balance uneven pages and smooth progress
+MAX_PAGES_PER_RANGE = 16  # caps the pages one range (and so each in-flight result) holds
+
+def split_page_range(page_count, parts):
+    """Split pages [0, page_count) into at most `parts` contiguous (start, end) ranges"""
+    if page_count <= 0:
+        return []
+    parts = max(1, min(parts, page_count))
+    step, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = start + step + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    """Process-wide tiktoken encoder, built once per process"""
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+_token_byte_lengths = {}
+
+def token_byte_ends(tokens):
+    """Cumulative UTF-8 byte offset at the end of each token, without decoding text"""
+    enc = get_encoder()
+    lengths = _token_byte_lengths
+    ends = array("I")
+    offset = 0
+    for token in tokens:
+        length = lengths.get(token)
+        if length is None:
+            length = lengths[token] = len(enc.decode_single_token_bytes(token))
+        offset += length
+        ends.append(offset)
+    return ends
+
+def iter_page_range(pdf_path, start, end):
+    """
+    Open the PDF and yield (page_number, text, token_ends) for pages [start, end).
+
+    Page numbers are 1-based; token_ends are the byte offsets from token_byte_ends().
+    """
+    enc = get_encoder()
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, end):
+            text = doc[page_num].get_text()
+            if text and not text.endswith("\n"):
+                text += "\n"  # keep words on adjacent pages apart once chunks span pages
+            yield page_num + 1, text, token_byte_ends(enc.encode(text))
+
+def extract_page_range(pdf_path, start, end):
+    """Pool worker entry point: every call opens its own document handle"""
+    return list(iter_page_range(pdf_path, start, end))
+
+def _char_start(buf, offset):
+    # Move back off UTF-8 continuation bytes so the slice starts on a character
+    while 0 < offset < len(buf) and buf[offset] & 0xC0 == 0x80:
+        offset -= 1
+    return offset
+
+def _char_end(buf, offset):
+    while offset < len(buf) and buf[offset] & 0xC0 == 0x80:
+        offset += 1
+    return offset
+
+def chunk_pages(pages, chunk_size, chunk_overlap):
+    """
+    Yield (chunk_text, first_page, last_page) token windows over a whole document.
+
+    Windows are cut at token byte offsets in one pass over `pages` (as yielded by
+    iter_pdf_pages), so no token is decoded and chunks run across page
+    boundaries. Only the current window is buffered.
+    """
+    stride = chunk_size - chunk_overlap
+    buf = bytearray()
+    ends = []  # end offset of each buffered token, relative to buf
+    head = 0  # start offset of the first buffered token
+    page_starts = []  # buffer offsets where each buffered page begins
+    page_numbers = []
+    emitted = False
+
+    def window(count):
+        b0 = _char_start(buf, head)
+        b1 = _char_end(buf, ends[count - 1])
+        first = page_numbers[bisect_right(page_starts, head) - 1]
+        last = page_numbers[bisect_right(page_starts, ends[count - 1] - 1) - 1]
+        return buf[b0:b1].decode("utf-8", errors="replace"), first, last
+
+    for page_number, text, token_ends in pages:
+        base = len(buf)
+        page_starts.append(base)
+        page_numbers.append(page_number)
+        buf += text.encode("utf-8")
+        ends.extend(base + e for e in token_ends)
+
+        while len(ends) >= chunk_size:
+            yield window(chunk_size)
+            emitted = True
+            head = ends[stride - 1]
+            cut = _char_start(buf, head)
+            del buf[:cut]
+            head -= cut
+            ends = [e - cut for e in ends[stride:]]
+            keep = max(bisect_right(page_starts, cut) - 1, 0)
+            page_starts = [max(p - cut, 0) for p in page_starts[keep:]]
+            page_numbers = page_numbers[keep:]
+
+    # The first chunk_overlap tokens were already covered by the last full window
+    if len(ends) > (chunk_overlap if emitted else 0):
+        yield window(len(ends))
+
+def get_page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+def iter_pdf_pages(pdf_path, workers=None, on_progress=None):
+    """
+    Yield (page_number, text, token_ends) for every page of a PDF in page order.
+
+    With more than one worker, page ranges of at most MAX_PAGES_PER_RANGE pages
+    are extracted across a process pool. At most `workers * 2` ranges are in
+    flight or waiting to be consumed, so memory stays bounded however long the
+    document is.
+    `on_progress(done_pages, total_pages)` is called from the calling process only.
+    """
+    workers = workers or EXTRACTION_WORKERS
+    page_count = get_page_count(pdf_path)
+
+    if workers == 1 or page_count < PARALLEL_MIN_PAGES:
+        for page in iter_page_range(pdf_path, 0, page_count):
+            yield page
+            if on_progress:
+                on_progress(page[0], page_count)
+        return
+
+    parts = max(workers * RANGES_PER_WORKER, -(-page_count // MAX_PAGES_PER_RANGE))
+    ranges = split_page_range(page_count, parts)
+    pending = deque()
+    done_pages = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start, end in ranges:
+            pending.append(pool.submit(extract_page_range, pdf_path, start, end))
+            if len(pending) < workers * 2:
+                continue
+            pages = pending.popleft().result()
+            done_pages += len(pages)
+            if on_progress:
+                on_progress(done_pages, page_count)
+            yield from pages
+        while pending:
+            pages = pending.popleft().result()
+            done_pages += len(pages)
+            if on_progress:
+                on_progress(done_pages, page_count)
+            yield from pages
+
+def extract_pdf(pdf_path, workers=None, on_progress=None):
+    """
+    Extract and tokenize every page of a PDF, optionally across a process pool.
+
+    Returns a list of (page_number, text, token_ends) in page order, identical to
+    the single-process result.
+    """
+    return list(iter_pdf_pages(pdf_path, workers=workers, on_progress=on_progress))
+
+def measure_pages_per_second(pdf_path, chunk_size, chunk_overlap, workers):
+    """Time extraction plus chunking and return (pages, chunks, seconds, pages_per_second)"""
+    started = time.perf_counter()
+    page_count = 0
+    chunk_count = 0
+    def count_pages(pages):
+        nonlocal page_count
+        for page in pages:
+            page_count += 1
+            yield page
+    for _ in chunk_pages(count_pages(iter_pdf_pages(pdf_path, workers=workers)), chunk_size, chunk_overlap):
+        chunk_count += 1
+    elapsed = time.perf_counter() - started
+    return page_count, chunk_count, elapsed, (page_count / elapsed if elapsed else 0.0)
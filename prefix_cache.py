@@ -0,0 +1,57 @@
+import copy
+import torch
+from transformers import DynamicCache
+
+class PrefixKVCache:
+    """
+    Key/value cache of a fixed prompt prefix, computed once and reused.
+
+    Prompts that start with `prefix` only prefill their own suffix: each
+    generate call starts from a copy of the cached prefix. In a batch the
+    suffixes are left-padded after the shared prefix ([prefix][pad][suffix]),
+    and the attention mask hides the padding. `generate` returns None when a
+    prompt does not tokenize to the cached prefix, so the caller can fall back.
+    """
+
+    def __init__(self, model, tokenizer, prefix, **generation_kwargs):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.generation_kwargs = generation_kwargs
+        self.prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids[0].tolist()
+        with torch.no_grad():
+            inputs = torch.tensor([self.prefix_ids], device=model.device)
+            self.cache = model(inputs, past_key_values=DynamicCache(), use_cache=True).past_key_values
+
+    def _prefix_copy(self, batch_size):
+        # generate() extends the cache in place; every call (and thread) gets its own copy
+        cache = copy.deepcopy(self.cache)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
+
+    def generate(self, prompts, **overrides):
+        if not all(prompt.startswith(self.prefix) for prompt in prompts):
+            return None
+        prefix_length = len(self.prefix_ids)
+        suffixes = []
+        for ids in self.tokenizer(list(prompts)).input_ids:
+            if ids[:prefix_length] != self.prefix_ids:
+                return None  # the prefix/suffix boundary merged into one token
+            suffixes.append(ids[prefix_length:])
+
+        width = max(len(suffix) for suffix in suffixes)
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+        input_ids = [self.prefix_ids + [pad_id] * (width - len(suffix)) + suffix for suffix in suffixes]
+        attention_mask = [[1] * prefix_length + [0] * (width - len(suffix)) + [1] * len(suffix) for suffix in suffixes]
+        input_ids = torch.tensor(input_ids, device=self.model.device)
+        attention_mask = torch.tensor(attention_mask, device=self.model.device)
+
+        with torch.no_grad():
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=self._prefix_copy(len(prompts)),
+                **{**self.generation_kwargs, **overrides}
+            )
+        return self.tokenizer.batch_decode(output[:, input_ids.shape[1]:], skip_special_tokens=True)
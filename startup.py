@@ -0,0 +1,105 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+
+from model_config import STARTUP_IMPORT_BUDGET_SECONDS
+
+# Startup costs of this process, shared by every session: (stage, seconds) in the order they finished
+_timings = []
+_timings_lock = threading.Lock()
+_warm_up = {"thread": None, "status": "not started", "current": None}
+
+APP_MODULES = ("embedder", "excel_filler", "chat")
+
+def record(stage, seconds):
+    with _timings_lock:
+        if stage not in dict(_timings):
+            _timings.append((stage, seconds))
+
+@contextmanager
+def timed(stage):
+    """Record how long the block took, the first time `stage` runs in this process"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+def get_startup_report():
+    """[(stage, seconds)] recorded so far, plus the warm-up status"""
+    with _timings_lock:
+        timings = list(_timings)
+    status = _warm_up["status"]
+    if _warm_up["current"]:
+        status = f"{status} ({_warm_up['current']})"
+    return timings, status
+
+def start_warm_up(loaders):
+    """
+    Load models in a background thread once per process, after the first page
+    has rendered. `loaders` is [(stage, function)]; each result is cached by the
+    function itself (st.cache_resource), so a later real call returns at once,
+    or waits for the warm-up's load in progress instead of starting a second one.
+    """
+    if _warm_up["thread"] is not None:
+        return
+
+    def run():
+        _warm_up["status"] = "warming up"
+        for stage, load in loaders:
+            _warm_up["current"] = stage
+            try:
+                with timed(f"load {stage}"):
+                    load()
+            except Exception as e:
+                record(f"load {stage} failed: {e}", 0.0)
+        _warm_up["current"] = None
+        _warm_up["status"] = "ready"
+
+    _warm_up["thread"] = threading.Thread(target=run, name="model-warm-up", daemon=True)
+    _warm_up["thread"].start()
+
+def profile_imports(modules=APP_MODULES):
+    """
+    Import `modules` in a fresh interpreter with -X importtime. Returns
+    (total_seconds, [(module, cumulative_seconds)]) for the imports the app
+    modules pull in directly or one level down.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)", line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            entries.append((match.group(4), int(match.group(2)) / 1e6, depth))
+    total = sum(seconds for _, seconds, depth in entries if depth == 0)
+    top = [(name, seconds) for name, seconds, depth in entries if depth <= 1]
+    return total, sorted(top, key=lambda entry: entry[1], reverse=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import time of the app modules against the startup budget")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget", type=float, default=STARTUP_IMPORT_BUDGET_SECONDS)
+    args = parser.parse_args()
+
+    total, top = profile_imports()
+    print(f"Importing {', '.join(APP_MODULES)}: {total:.2f} s (budget {args.budget:.2f} s)")
+    for name, seconds in top[:args.top]:
+        print(f"   {seconds:7.3f} s  {name}")
+    if total > args.budget:
+        print("Over budget: move the slowest imports into the functions that need them")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
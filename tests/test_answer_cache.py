@@ -0,0 +1,40 @@
+import numpy as np
+
+from answer_cache import SemanticAnswerCache
+
+def near(vector, noise=1e-3, seed=0):
+    """A vector with cosine similarity ~0.9999 to `vector`"""
+    return vector + noise * np.random.default_rng(seed).standard_normal(len(vector)).astype(np.float32)
+
+def make_cache():
+    return SemanticAnswerCache(max_entries=10, max_age_seconds=3600, threshold=0.95)
+
+def test_close_question_hits():
+    cache = make_cache()
+    vector = np.random.default_rng(1).standard_normal(384).astype(np.float32)
+    cache.put("What is the warranty period?", vector, "v1", "Two years", [4])
+    hit = cache.get("What's the warranty period?", near(vector), "v1")
+    assert hit is not None and hit[:2] == ("Two years", [4])
+
+def test_clause_code_variants_do_not_collide():
+    cache = make_cache()
+    vector = np.random.default_rng(2).standard_normal(384).astype(np.float32)
+    cache.put("What does Clause 14.2 say about penalties?", vector, "v1", "Answer for 14.2", [7])
+    # the embeddings are practically identical; only the clause number differs
+    assert cache.get("What does Clause 14.3 say about penalties?", near(vector), "v1") is None
+    assert cache.get("What does Clause 14.2 say about penalties?", near(vector), "v1")[0] == "Answer for 14.2"
+
+def test_code_variant_picks_its_own_entry():
+    cache = make_cache()
+    vector = np.random.default_rng(3).standard_normal(384).astype(np.float32)
+    cache.put("Specification of BOQ item 3.1.4", vector, "v1", "item 3.1.4", [2])
+    cache.put("Specification of BOQ item 3.1.5", near(vector, seed=1), "v1", "item 3.1.5", [3])
+    assert cache.get("Specification of BOQ item 3.1.5", vector, "v1")[0] == "item 3.1.5"
+    assert cache.get("Specification of BOQ item 3.1.4", near(vector, seed=1), "v1")[0] == "item 3.1.4"
+
+def test_new_index_version_empties_the_cache():
+    cache = make_cache()
+    vector = np.ones(8, dtype=np.float32)
+    cache.put("What is the EMD amount?", vector, "v1", "Rs 50,000", [1])
+    assert cache.get("What is the EMD amount?", vector, "v2") is None
+    assert cache.get("What is the EMD amount?", vector, "v1") is None
@@ -0,0 +1,49 @@
+import re
+
+from pdf_extraction import chunk_pages, split_page_range
+
+def page(number, text):
+    """(page_number, text, token_ends) with one token per word and its trailing whitespace"""
+    ends, offset = [], 0
+    for token in re.findall(r"\S+\s*", text):
+        offset += len(token.encode("utf-8"))
+        ends.append(offset)
+    return number, text, ends
+
+def test_windows_run_across_pages_with_their_overlap():
+    pages = [page(1, "a1 a2 a3 a4 a5\n"), page(2, "b1 b2 b3\n"), page(3, "c1 c2 c3 c4\n")]
+    chunks = list(chunk_pages(pages, 5, 2))
+    assert chunks == [
+        ("a1 a2 a3 a4 a5\n", 1, 1),
+        ("a4 a5\nb1 b2 b3\n", 1, 2),
+        ("b2 b3\nc1 c2 c3 ", 2, 3),
+        ("c2 c3 c4\n", 3, 3),
+    ]
+    # every window starts with the last `chunk_overlap` tokens of the one before
+    for (left, _, _), (right, _, _) in zip(chunks, chunks[1:]):
+        assert left.split()[-2:] == right.split()[:2]
+
+def test_window_spans_an_empty_page():
+    pages = [page(1, "a1 a2\n"), page(2, ""), page(3, "c1 c2 c3 c4\n")]
+    assert list(chunk_pages(pages, 4, 1)) == [("a1 a2\nc1 c2 ", 1, 3), ("c2 c3 c4\n", 3, 3)]
+
+def test_tail_already_covered_by_the_overlap_is_not_repeated():
+    pages = [page(1, "w1 w2 w3 w4 w5 w6 w7 w8\n")]
+    assert [text for text, _, _ in chunk_pages(pages, 5, 2)] == ["w1 w2 w3 w4 w5 ", "w4 w5 w6 w7 w8\n"]
+
+def test_short_document_is_one_chunk():
+    assert list(chunk_pages([page(4, "only three words\n")], 10, 2)) == [("only three words\n", 4, 4)]
+    assert list(chunk_pages([], 10, 2)) == []
+
+def test_cuts_inside_a_character_keep_it_whole():
+    # byte-level tokens can split a multi-byte character; the windows never do
+    text = "é" * 6
+    ends = list(range(1, len(text.encode("utf-8")) + 1))  # one token per byte
+    chunks = list(chunk_pages([(1, text, ends)], 5, 2))
+    assert all("�" not in chunk for chunk, _, _ in chunks)
+    assert "".join(chunk for chunk, _, _ in chunks).replace("é", "") == ""
+
+def test_split_page_range():
+    assert split_page_range(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert split_page_range(2, 8) == [(0, 1), (1, 2)]
+    assert split_page_range(0, 4) == []
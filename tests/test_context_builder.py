@@ -0,0 +1,77 @@
+from langchain.schema import Document
+
+from context_builder import assemble_context, merge_chunks, overlap_length
+
+class WordTokenizer:
+    """The slice of an HF tokenizer context_builder uses, one token per word"""
+
+    def __call__(self, texts, add_special_tokens=False):
+        if isinstance(texts, str):
+            return {"input_ids": texts.split()}
+        return {"input_ids": [text.split() for text in texts]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(ids)
+
+TEXT = " ".join(f"word{i:03d}" for i in range(60))  # 8 characters per word and space
+
+def chunk(start, end, chunk_index=None, name="a.pdf", page=1, page_end=None):
+    """Words [start, end) of TEXT as a retrieved chunk"""
+    metadata = {"document_name": name, "page": page, "page_end": page_end or page}
+    if chunk_index is not None:
+        metadata["chunk_index"] = chunk_index
+    return Document(page_content=" ".join(TEXT.split()[start:end]) + " ", metadata=metadata)
+
+def test_overlap_length():
+    assert overlap_length("abc " + TEXT[:40], TEXT[:40] + " tail") == 40
+    assert overlap_length("the end", "end of it") == 0  # too short to be chunk overlap
+
+def test_consecutive_chunks_merge_in_document_order_with_overlap_once():
+    # retrieved out of order: chunk 1 ranked first
+    docs = [chunk(10, 25, chunk_index=1), chunk(0, 15, chunk_index=0), chunk(20, 35, chunk_index=2)]
+    [(text, rank, members)] = merge_chunks(docs)
+    assert text == " ".join(TEXT.split()[0:35]) + " "
+    assert rank == 0 and [doc.metadata["chunk_index"] for doc in members] == [0, 1, 2]
+
+def test_non_consecutive_chunks_and_other_documents_stay_apart():
+    docs = [chunk(0, 15, chunk_index=0), chunk(40, 55, chunk_index=3), chunk(10, 25, chunk_index=1, name="b.pdf")]
+    passages = merge_chunks(docs)
+    assert [(rank, len(members)) for _, rank, members in passages] == [(0, 1), (1, 1), (2, 1)]
+
+def test_repeated_text_is_written_once():
+    # the same chunk retrieved twice
+    docs = [chunk(0, 30, chunk_index=0), chunk(0, 30, chunk_index=0)]
+    [(text, _, members)] = merge_chunks(docs)
+    assert text == chunk(0, 30).page_content and len(members) == 2
+    # text contained in a lower-ranked passage, here of another document, is not written twice
+    docs = [chunk(5, 20, chunk_index=4, name="b.pdf"), chunk(0, 30, chunk_index=0)]
+    [(text, rank, members)] = merge_chunks(docs)
+    assert text == chunk(0, 30).page_content and rank == 0 and members == [docs[1], docs[0]]
+
+def test_chunks_without_positions_merge_only_when_pages_touch_and_text_overlaps():
+    touching = [chunk(0, 15, page=1, page_end=2), chunk(10, 25, page=2, page_end=3)]
+    [(text, _, _)] = merge_chunks(touching)
+    assert text == " ".join(TEXT.split()[0:25]) + " "
+    apart = [chunk(0, 15, page=1), chunk(10, 25, page=5)]
+    assert len(merge_chunks(apart)) == 2
+    no_overlap = [chunk(0, 15, page=1), chunk(15, 30, page=2)]
+    assert len(merge_chunks(no_overlap)) == 2
+
+def test_assemble_context_fills_the_budget_best_passage_first():
+    tokenizer = WordTokenizer()
+    docs = [
+        chunk(40, 50, chunk_index=4, name="b.pdf"),  # best hit, 10 words
+        chunk(0, 15, chunk_index=0), chunk(10, 25, chunk_index=1),  # merge into 25 words
+    ]
+    context, used = assemble_context(tokenizer, docs, budget=0)
+    assert context.split("\n\n") == [docs[0].page_content, " ".join(TEXT.split()[0:25]) + " "]
+    assert used == [docs[0], docs[1], docs[2]]
+
+    context, used = assemble_context(tokenizer, docs, budget=20)
+    best, trimmed = context.split("\n\n")
+    assert best == docs[0].page_content
+    assert trimmed == " ".join(TEXT.split()[0:10])  # the merged passage cut to the 10 tokens left
+    assert used == [docs[0], docs[1], docs[2]]
+
+    context, used = assemble_context(tokenizer, docs, budget=10)
+    assert context == docs[0].page_content and used == [docs[0]]
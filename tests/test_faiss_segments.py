@@ -0,0 +1,158 @@
+import os
+import pickle
+import zlib
+
+import numpy as np
+import pytest
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+
+from faiss_segments import (
+    SegmentWriter, LEGACY_BASE_DIR, MANIFEST_FILE, STORE_FORMAT, close_docstore, compact, delete_chunks,
+    get_docstore, load_vectorstore, read_manifest, read_tombstones, refresh_vectorstore, write_manifest
+)
+
+DIMENSIONS = 8
+
+class FakeEmbeddings(Embeddings):
+    """A fixed random vector per text, so tests can search by a chunk's own vector"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = zlib.crc32(text.encode())
+        return np.random.default_rng(seed).standard_normal(DIMENSIONS).astype(np.float32).tolist()
+
+EMBEDDINGS = FakeEmbeddings()
+
+def chunks(name, count):
+    texts = [f"{name} chunk {i}" for i in range(count)]
+    metadatas = [{"document_name": name, "page": i + 1, "page_end": i + 1} for i in range(count)]
+    return texts, metadatas, np.asarray(EMBEDDINGS.embed_documents(texts), dtype=np.float32)
+
+def ingest(index_dir, name, count=3):
+    texts, metadatas, vectors = chunks(name, count)
+    writer = SegmentWriter(index_dir)
+    ids = writer.append(texts, metadatas, vectors)
+    writer.commit()
+    return ids, vectors
+
+def top_hit(vectorstore, vector):
+    document, _ = vectorstore.similarity_search_with_score_by_vector(vector, k=1)[0]
+    return document
+
+@pytest.fixture
+def index_dir(tmp_path):
+    path = str(tmp_path / "index")
+    yield path
+    close_docstore(path)
+
+def test_ingest_delete_compact_search_round_trip(index_dir):
+    a_ids, a_vectors = ingest(index_dir, "A.pdf")
+    b_ids, b_vectors = ingest(index_dir, "B.pdf")
+    vectorstore, loaded = refresh_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert top_hit(vectorstore, a_vectors[1]).page_content == "A.pdf chunk 1"
+    assert top_hit(vectorstore, b_vectors[2]).metadata["chunk_id"] == b_ids[2]
+
+    delete_chunks(index_dir, a_ids)
+    vectorstore, loaded = refresh_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS, vectorstore, loaded)
+    assert loaded["tombstone_count"] == 3
+    hits = vectorstore.similarity_search_with_score_by_vector(a_vectors[1], k=6)
+    assert sorted(doc.metadata["chunk_id"] for doc, _ in hits) == sorted(b_ids)
+
+    tombstone_file = loaded["tombstones"]
+    manifest = compact(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert manifest["segments"] == [] and manifest["base_size"] == 3
+    assert manifest["tombstones"] is None and manifest["tombstone_count"] == 0
+    assert not os.path.exists(os.path.join(index_dir, tombstone_file))
+    assert not any(name.startswith("segment_") for name in os.listdir(index_dir))
+
+    # same content, so a loaded handle is kept; a fresh load reads the new base
+    assert refresh_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS, vectorstore, loaded)[0] is vectorstore
+    vectorstore, loaded = load_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS), manifest
+    assert vectorstore.base_index.ntotal == 3 and vectorstore.delta_index.ntotal == 0
+    assert top_hit(vectorstore, b_vectors[0]).page_content == "B.pdf chunk 0"
+    hits = vectorstore.similarity_search_with_score_by_vector(a_vectors[1], k=6)
+    assert sorted(doc.metadata["chunk_id"] for doc, _ in hits) == sorted(b_ids)
+
+    # ingests after a compaction land in a new segment on top of the base
+    c_ids, c_vectors = ingest(index_dir, "C.pdf", count=2)
+    vectorstore, loaded = refresh_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS, vectorstore, loaded)
+    assert top_hit(vectorstore, c_vectors[1]).metadata["chunk_id"] == c_ids[1]
+    assert get_docstore(index_dir).count() == 5
+
+def test_delete_after_compaction_hides_base_vectors(index_dir):
+    a_ids, a_vectors = ingest(index_dir, "A.pdf")
+    b_ids, _ = ingest(index_dir, "B.pdf")
+    compact(index_dir, EMBEDDINGS, DIMENSIONS)
+    delete_chunks(index_dir, a_ids[:1])
+    vectorstore = load_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert top_hit(vectorstore, a_vectors[0]).metadata["chunk_id"] != a_ids[0]
+    manifest = compact(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert manifest["base_size"] == 5 and len(read_tombstones(index_dir, manifest)) == 0
+    hits = load_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS).similarity_search_with_score_by_vector(a_vectors[0], k=6)
+    assert sorted(doc.metadata["chunk_id"] for doc, _ in hits) == sorted(a_ids[1:] + b_ids)
+
+def save_legacy_base(path, name, count):
+    texts, metadatas, vectors = chunks(name, count)
+    FAISS.from_embeddings(list(zip(texts, vectors.tolist())), EMBEDDINGS, metadatas=metadatas).save_local(path)
+    return vectors
+
+def test_migrate_legacy_save_local_directory(index_dir):
+    vectors = save_legacy_base(os.path.join(index_dir, LEGACY_BASE_DIR), "old.pdf", 4)
+    assert read_manifest(index_dir)["format"] < STORE_FORMAT
+
+    vectorstore = load_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS)
+    manifest = read_manifest(index_dir)
+    assert manifest["format"] == STORE_FORMAT and manifest["base"].startswith("base_")
+    assert manifest["base_size"] == 4 and manifest["segments"] == []
+    assert not os.path.exists(os.path.join(index_dir, LEGACY_BASE_DIR))
+
+    document = top_hit(vectorstore, vectors[2])
+    assert document.page_content == "old.pdf chunk 2"
+    assert document.metadata["document_name"] == "old.pdf" and document.metadata["page"] == 3
+    assert get_docstore(index_dir).find_document("old.pdf") is not None
+    # migrated chunks are indexed for exact lookups too
+    assert [doc.page_content for doc, _ in vectorstore.lexical_search(["chunk", "3"])] == ["old.pdf chunk 3"]
+
+    # a second load finds the migrated store and changes nothing
+    load_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert read_manifest(index_dir) == manifest and get_docstore(index_dir).count() == 4
+
+def test_migrate_legacy_manifest_with_segments(index_dir):
+    base_vectors = save_legacy_base(os.path.join(index_dir, "base_000001"), "old.pdf", 2)
+    texts, metadatas, segment_vectors = chunks("new.pdf", 3)
+    # segments written before the docstore carried their text: (ids, texts, metadatas, vectors)
+    with open(os.path.join(index_dir, "segment_000002.pkl"), "wb") as f:
+        pickle.dump((["a", "b"], texts[:2], metadatas[:2], segment_vectors[:2]), f)
+        pickle.dump((["c"], texts[2:], metadatas[2:], segment_vectors[2:]), f)
+    write_manifest(index_dir, {"version": 2, "next_id": 3, "base": "base_000001",
+                               "segments": ["segment_000002.pkl"]})
+
+    manifest = compact(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert manifest["format"] == STORE_FORMAT and manifest["base_size"] == 5 and manifest["segments"] == []
+    assert sorted(os.listdir(index_dir)) == sorted([".lock", "docstore.sqlite", "docstore.sqlite-shm",
+                                                    "docstore.sqlite-wal", MANIFEST_FILE, manifest["base"]])
+    vectorstore = load_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert top_hit(vectorstore, base_vectors[1]).page_content == "old.pdf chunk 1"
+    assert top_hit(vectorstore, segment_vectors[2]).page_content == "new.pdf chunk 2"
+    names = sorted(doc["name"] for doc in get_docstore(index_dir).list_documents())
+    assert names == ["new.pdf", "old.pdf"]
+
+def test_add_texts_commits_a_segment(index_dir):
+    ingest(index_dir, "A.pdf")
+    vectorstore, loaded = refresh_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS)
+    ids = vectorstore.add_texts(["added chunk 7"], [{"document_name": "added.pdf"}])
+    refreshed, manifest = refresh_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS, vectorstore, loaded)
+    assert len(manifest["segments"]) == 2 and vectorstore.ntotal == 3
+    document = top_hit(refreshed, EMBEDDINGS.embed_query("added chunk 7"))
+    assert str(document.metadata["chunk_id"]) == ids[0] and document.metadata["document_name"] == "added.pdf"
+    # a reload finds the texts' vectors as well as their rows
+    reloaded = load_vectorstore(index_dir, EMBEDDINGS, DIMENSIONS)
+    assert [doc.page_content for doc, _ in reloaded.lexical_search(["7"])] == ["added chunk 7"]
+    assert top_hit(reloaded, EMBEDDINGS.embed_query("added chunk 7")).page_content == "added chunk 7"
+    with pytest.raises(ValueError):
+        reloaded.restrict_to([int(ids[0])]).add_texts(["not added"])
+    with pytest.raises(ValueError, match="create_faiss_vectorstore"):
+        type(reloaded).from_texts(["not added"], EMBEDDINGS)
@@ -0,0 +1,45 @@
+import json
+
+from fill_checkpoint import FillCheckpoint
+
+def row(index):
+    return {"row": index, "doc_name": "a.pdf", "pages": [index + 1], "details": f"answer {index}",
+            "timing": [1.0, 0.0, 2.0, 1], "prompt_tokens": [100, 80]}
+
+def interrupted_checkpoint(tmp_path, tail):
+    """A checkpoint of rows 0-2 followed by `tail`, as left by a run that died"""
+    path = tmp_path / "fill_jobs" / "job.jsonl"
+    with FillCheckpoint(str(path)) as checkpoint:
+        checkpoint.append([row(0), row(1), row(2)])
+    with open(path, "ab") as f:
+        f.write(tail)
+    return str(path)
+
+def resume(path, row_count):
+    """What a rerun does: keep the completed rows and generate the rest"""
+    with FillCheckpoint(path) as checkpoint:
+        completed = checkpoint.load(row_count)
+        regenerated = list(range(len(completed), row_count))
+        checkpoint.append([row(index) for index in regenerated])
+    return completed, regenerated
+
+def test_torn_last_line_is_cut_and_only_missing_rows_are_regenerated(tmp_path):
+    torn = b'{"row": 3, "doc_name": "a.pdf", "det'
+    path = interrupted_checkpoint(tmp_path, torn)
+    completed, regenerated = resume(path, 5)
+    assert completed == [row(0), row(1), row(2)] and regenerated == [3, 4]
+    assert FillCheckpoint(path).load(5) == [row(i) for i in range(5)]
+
+def test_rows_after_a_mismatched_row_are_regenerated(tmp_path):
+    # row 3 is missing, so the row 4 line cannot be trusted either
+    path = interrupted_checkpoint(tmp_path, (json.dumps(row(4)) + "\n").encode())
+    completed, regenerated = resume(path, 5)
+    assert [r["row"] for r in completed] == [0, 1, 2] and regenerated == [3, 4]
+    assert [r["row"] for r in FillCheckpoint(path).load(5)] == [0, 1, 2, 3, 4]
+
+def test_complete_checkpoint_regenerates_nothing_and_is_removed(tmp_path):
+    path = interrupted_checkpoint(tmp_path, b"")
+    assert resume(path, 3) == ([row(0), row(1), row(2)], [])
+    checkpoint = FillCheckpoint(path)
+    checkpoint.remove()
+    assert checkpoint.load(3) == []
@@ -0,0 +1,92 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from faiss_segments import (
+    SegmentWriter, get_docstore, close_docstore, clear_index_dir, delete_chunks, read_manifest, read_tombstones
+)
+from vector_store import SqliteDocstore
+
+DIMENSIONS = 8
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIMENSIONS)).astype(np.float32)
+
+def ingest(index_dir, name, count=2, seed=0):
+    writer = SegmentWriter(index_dir)
+    ids = writer.append([f"{name} chunk {i}" for i in range(count)], [{"document_name": name}] * count,
+                        vectors(count, seed))
+    writer.commit()
+    return ids
+
+def commit_segments(index_dir, count, seed):
+    for i in range(count):
+        ingest(index_dir, f"doc_{seed}_{i}.pdf", seed=seed * 1000 + i)
+
+def delete_in_other_process(index_dir, ids):
+    delete_chunks(index_dir, ids)
+
+def run_in_process(target, *args):
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args)
+    process.start()
+    process.join(60)
+    assert process.exitcode == 0
+
+@pytest.fixture
+def index_dir(tmp_path):
+    path = str(tmp_path / "index")
+    yield path
+    close_docstore(path)
+
+def test_document_deleted_elsewhere_gets_a_fresh_row(tmp_path):
+    # two connections to one file, as in the app and the ingest worker
+    path = str(tmp_path / "docstore.sqlite")
+    worker, app = SqliteDocstore(path), SqliteDocstore(path)
+    worker.add_chunks(["first version"], [{"document_name": "A.pdf"}])
+    app.delete_document(app.find_document("A.pdf")[0])
+    ids = worker.add_chunks(["second version"], [{"document_name": "A.pdf"}])
+    worker.set_document_hash("A.pdf", "hash-a")
+    document = app.find_document("hash-a")
+    assert document is not None and document[1] == "A.pdf"
+    assert list(app.document_chunk_ids(document[0])) == ids
+    assert [doc["name"] for doc in app.list_documents()] == ["A.pdf"]
+
+def test_clear_in_another_process_fails_the_running_ingest(index_dir):
+    ingest(index_dir, "old.pdf")
+    stale = get_docstore(index_dir)
+    writer = SegmentWriter(index_dir)
+    writer.append(["half ingested"], [{"document_name": "B.pdf"}], vectors(1))
+    run_in_process(clear_index_dir, index_dir)
+    with pytest.raises(RuntimeError, match="cleared"):
+        writer.commit()
+    writer.abort()
+    fresh = get_docstore(index_dir)
+    assert fresh is not stale and fresh.count() == 0
+    assert read_manifest(index_dir)["segments"] == []
+    # the next ingest writes into the new store, not the removed file
+    ids = ingest(index_dir, "B.pdf")
+    assert sorted(fresh.get_documents(ids)) == sorted(ids)
+
+def test_concurrent_commits_from_two_processes_keep_every_segment(index_dir):
+    ingest(index_dir, "seed.pdf")  # create the store before the writers race
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=commit_segments, args=(index_dir, 10, seed)) for seed in (1, 2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+        assert process.exitcode == 0
+    manifest = read_manifest(index_dir)
+    assert len(manifest["segments"]) == 21
+    assert sum(manifest["segment_sizes"].values()) == 42
+    assert get_docstore(index_dir).count() == 42
+
+def test_delete_in_another_process_is_not_lost(index_dir):
+    kept = ingest(index_dir, "kept.pdf")
+    deleted = ingest(index_dir, "deleted.pdf", seed=1)
+    run_in_process(delete_in_other_process, index_dir, deleted)
+    ingest(index_dir, "later.pdf", seed=2)  # a commit after the delete must not drop its tombstones
+    manifest = read_manifest(index_dir)
+    assert sorted(read_tombstones(index_dir, manifest)) == sorted(deleted)
+    assert sorted(get_docstore(index_dir).get_documents(kept + deleted)) == sorted(kept)
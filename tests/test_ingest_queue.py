@@ -0,0 +1,48 @@
+from ingest_queue import IngestQueue
+
+def make_queue(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4 test")
+    return IngestQueue(str(tmp_path / "queue")), str(pdf)
+
+def test_ingest_and_index_tasks_are_claimed_separately(tmp_path):
+    queue, pdf = make_queue(tmp_path)
+    ingest_id = queue.enqueue(pdf, "a.pdf", "hash-a")
+    delete_id = queue.enqueue_task("delete", "b.pdf")
+    assert queue.enqueue_task("delete", "b.pdf") == delete_id
+    assert queue.claim_next(("delete", "clear"))["id"] == delete_id
+    assert queue.claim_next()["id"] == ingest_id
+    assert queue.claim_next() is None
+
+def test_a_file_still_ingesting_holds_back_only_its_own_uploads(tmp_path):
+    queue, pdf = make_queue(tmp_path)
+    queue.enqueue(pdf, "a.pdf", "hash-a")
+    queue.enqueue(pdf, "a.pdf", "hash-a2")
+    queue.enqueue(pdf, "b.pdf", "hash-b")
+    assert queue.claim_next()["pdf_hash"] == "hash-a"
+    assert queue.claim_next()["pdf_hash"] == "hash-b"
+    assert queue.claim_next() is None
+
+def test_running_jobs_survive_a_worker_restart(tmp_path):
+    queue, pdf = make_queue(tmp_path)
+    job_id = queue.enqueue(pdf, "a.pdf", "hash-a")
+    queue.claim_next()
+    queue.update_progress(job_id, 3, 10, 12, kind="ingest")
+    restarted = IngestQueue(str(tmp_path / "queue"))
+    assert restarted.requeue_interrupted() == 1
+    assert restarted.claim_next()["id"] == job_id
+    assert restarted.get_jobs([job_id])[job_id]["attempts"] == 2
+    restarted.update_progress(job_id, 10, 10, 40)
+    restarted.finish(job_id)
+    finished = restarted.get_jobs([job_id])[job_id]
+    assert finished["status"] == "done" and finished["fraction"] == 1.0
+    assert restarted.stats()["counts"]["done"] == 1
+
+def test_failed_upload_is_reused_until_retried(tmp_path):
+    queue, pdf = make_queue(tmp_path)
+    job_id = queue.enqueue(pdf, "a.pdf", "hash-a")
+    queue.claim_next()
+    queue.finish(job_id, "boom")
+    assert queue.enqueue(pdf, "a.pdf", "hash-a") == job_id
+    queue.retry(job_id)
+    assert queue.claim_next()["id"] == job_id
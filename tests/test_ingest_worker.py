@@ -0,0 +1,72 @@
+import sys
+import types
+import hashlib
+
+import numpy as np
+
+from faiss_segments import SegmentWriter, close_docstore, delete_chunks, get_docstore
+from ingest_queue import IngestQueue
+from ingest_worker import process_job
+
+DIMENSIONS = 8
+
+def index_embedder(index_dir):
+    """The embedder calls process_job makes, backed by a real segment index; chunk text names the PDF's hash"""
+    uploaded = set()
+
+    def file_hash(pdf_path):
+        with open(pdf_path, "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def ingest_pdf(pdf_path, pdf_filename, workers=None, pdf_hash=None, on_batch=None):
+        texts = [f"{file_hash(pdf_path)} chunk {i}" for i in range(3)]
+        writer = SegmentWriter(index_dir)
+        writer.append(texts, [{"document_name": pdf_filename}] * 3,
+                      np.ones((3, DIMENSIONS), dtype=np.float32))
+        writer.commit()
+        return len(texts)
+
+    def replace_document(pdf_path, pdf_filename, workers=None, on_batch=None):
+        docstore = get_docstore(index_dir)
+        old_ids = list(docstore.document_chunk_ids(docstore.find_document(pdf_filename)[0]))
+        added = ingest_pdf(pdf_path, pdf_filename)
+        delete_chunks(index_dir, old_ids)
+        uploaded.difference_update({pdf_id for pdf_id in uploaded if pdf_id[0] == pdf_filename})
+        uploaded.add((pdf_filename, file_hash(pdf_path)))
+        return added
+
+    return types.SimpleNamespace(
+        is_pdf_already_uploaded=lambda pdf_path, name: (name, file_hash(pdf_path)) in uploaded,
+        is_pdf_indexed=lambda name: get_docstore(index_dir).find_document(name) is not None,
+        mark_pdf_as_uploaded=lambda pdf_path, name: uploaded.add((name, file_hash(pdf_path))),
+        ingest_pdf=ingest_pdf, replace_document=replace_document, uploaded=uploaded,
+    )
+
+def test_two_versions_of_one_pdf_are_ingested_one_after_the_other(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "index")
+    embedder = index_embedder(index_dir)
+    monkeypatch.setitem(sys.modules, "embedder", embedder)
+    queue = IngestQueue(str(tmp_path / "queue"))
+    hashes = []
+    for version in (b"first version", b"second version"):
+        pdf = tmp_path / "upload.pdf"
+        pdf.write_bytes(version)
+        hashes.append(hashlib.md5(version).hexdigest())
+        queue.enqueue(str(pdf), "tender.pdf", hashes[-1])
+
+    first = queue.claim_next()
+    assert first["pdf_hash"] == hashes[0]
+    assert queue.claim_next() is None  # the second upload waits for the first
+    process_job(queue, first, 1)
+    second = queue.claim_next()
+    assert second["pdf_hash"] == hashes[1]
+    process_job(queue, second, 1)
+
+    jobs = queue.get_jobs([first["id"], second["id"]])
+    assert (jobs[first["id"]]["kind"], jobs[second["id"]]["kind"]) == ("ingest", "replace")
+    docstore = get_docstore(index_dir)
+    document_id = docstore.find_document("tender.pdf")[0]
+    texts = [doc.page_content for doc in docstore.get_documents(docstore.document_chunk_ids(document_id)).values()]
+    assert sorted(texts) == [f"{hashes[1]} chunk {i}" for i in range(3)]
+    assert embedder.uploaded == {("tender.pdf", hashes[1])}
+    close_docstore(index_dir)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from faiss_segments import SegmentWriter, get_docstore, close_docstore
+from lexical_index import code_terms
+
+DIMENSIONS = 8
+
+def vectors(count):
+    return np.random.default_rng(count).standard_normal((count, DIMENSIONS)).astype(np.float32)
+
+def test_code_terms():
+    assert code_terms("What does Clause 14.2 say about item K9 and DN300 pipes, qty 40?") == ["14.2", "k9", "dn300"]
+
+def test_terms_are_searchable_only_after_commit(tmp_path):
+    index_dir = str(tmp_path / "index")
+    writer = SegmentWriter(index_dir)
+    ids = writer.append(["Clause 14.2 liquidated damages"], [{"document_name": "a.pdf"}], vectors(1))
+    docstore = get_docstore(index_dir)
+    assert docstore.lexical_search(["14.2"], 5) == []  # still ingesting: no committed vectors yet
+    writer.commit()
+    assert [chunk_id for chunk_id, _ in docstore.lexical_search(["14.2"], 5)] == ids
+    close_docstore(index_dir)
+
+def test_aborted_ingest_leaves_no_terms(tmp_path):
+    index_dir = str(tmp_path / "index")
+    writer = SegmentWriter(index_dir)
+    writer.append(["BOQ item 3.1.4 cable trays"], [{"document_name": "a.pdf"}], vectors(1))
+    writer.abort()
+    assert get_docstore(index_dir).lexical_search(["3.1.4"], 5) == []
+    close_docstore(index_dir)
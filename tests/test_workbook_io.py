@@ -0,0 +1,59 @@
+import openpyxl
+import pytest
+
+from workbook_io import ExcelTemplate, build_merged_map
+
+def test_build_merged_map():
+    # (min_col, min_row, max_col, max_row), as openpyxl's CellRange.bounds
+    merged_map = build_merged_map([(2, 3, 3, 4), (5, 1, 5, 2)])
+    assert merged_map == {(3, 3): (3, 2), (4, 2): (3, 2), (4, 3): (3, 2), (2, 5): (1, 5)}
+
+def make_template(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "BOQ"
+    ws.append(["Sr", "Item Description", "Source", "Pages", "Details"])
+    ws.append([1, "Cable trays", None, None, None])
+    ws.append([2, None, None, None, None])
+    ws.append([3, "DN300 pipes", None, None, None])
+    ws.append([None, None, None, None, None])  # trailing empty row
+    ws.merge_cells("C3:E4")  # rows 3-4 share one Source..Details block
+    notes = wb.create_sheet("Notes")
+    notes.append(["kept as is"])
+    wb.save(path)
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_template_reads_queries_and_redirects_merged_writes(tmp_path, streaming):
+    path = str(tmp_path / "template.xlsx")
+    make_template(path)
+    book = ExcelTemplate(path, streaming=streaming)
+    assert book.streaming is streaming
+    assert book.queries == ["Cable trays", "nan", "DN300 pipes"]
+    assert book.merged_map[(4, 5)] == (3, 3) and (3, 3) not in book.merged_map
+
+    book.set_value(2, 5, "trays answer")
+    book.set_value(4, 5, "covered cell")  # inside C3:E4, lands on C3
+    book.set_value(7, 2, "past the last row")
+    book.add_sheet("Row Timings", [["Row", "ms"], [2, 1.5]])
+    book.add_sheet("Row Timings", [["Row", "ms"], [2, 2.5]])  # replaces the first one
+    out_path = book.save(str(tmp_path / "filled.xlsx"))
+    book.close()
+
+    out = openpyxl.load_workbook(out_path)
+    ws = out["BOQ"]
+    assert ws.cell(2, 5).value == "trays answer"
+    assert ws.cell(3, 3).value == "covered cell"
+    assert ws.cell(7, 2).value == "past the last row"
+    assert ws.cell(4, 2).value == "DN300 pipes"
+    assert [str(merged) for merged in ws.merged_cells.ranges] == ["C3:E4"]
+    assert out["Notes"]["A1"].value == "kept as is"
+    assert [list(row) for row in out["Row Timings"].iter_rows(values_only=True)] == [["Row", "ms"], [2, 2.5]]
+    assert out.sheetnames == ["BOQ", "Notes", "Row Timings"]
+
+def test_missing_query_column(tmp_path):
+    path = str(tmp_path / "template.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active.append(["Sr", "Description"])
+    wb.save(path)
+    with pytest.raises(KeyError):
+        ExcelTemplate(path, streaming=False)
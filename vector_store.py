@@ -0,0 +1,409 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import nullcontext
+from typing import List, Tuple, Optional
+import numpy as np
+import faiss
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+from ann_index import search_params, index_type_of, unwrap_ids
+from lexical_index import lexical_terms, match_expression, FTS_TOKENIZER
+
+COLUMN_METADATA = ("page", "page_end", "document_name")
+SQLITE_MAX_PARAMS = 900  # stay under SQLITE_MAX_VARIABLE_NUMBER on old SQLite builds
+
+class SqliteDocstore:
+    """
+    Chunk text and metadata stored column-wise in SQLite, keyed by the integer
+    ids held in the FAISS index. Nothing is loaded up front; rows are read only
+    for the hits a search returns.
+    """
+
+    def __init__(self, path, write_lock=None):
+        self.path = path
+        self._lock = threading.RLock()
+        # Another process may write the same file: every change runs under
+        # write_lock() (see faiss_segments.index_lock), taken before self._lock
+        self._write_lock = write_lock or nullcontext
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._write_lock():
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, pdf_hash TEXT)"
+            )
+            # AUTOINCREMENT: a deleted chunk id may still sit tombstoned in the index
+            # until the next compaction, so ids must never be handed out twice
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, document_id INTEGER, page INTEGER, page_end INTEGER, "
+                "text TEXT NOT NULL, extra TEXT)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS chunks_document ON chunks(document_id)")
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(documents)")]
+            if "pdf_hash" not in columns:
+                self.db.execute("ALTER TABLE documents ADD COLUMN pdf_hash TEXT")
+            # BM25 inverted index over the same chunks (rowid = chunk id), updated with them
+            has_terms = self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunk_terms'"
+            ).fetchone()
+            if not has_terms:
+                self.db.execute(f"CREATE VIRTUAL TABLE chunk_terms USING fts5(terms, tokenize=\"{FTS_TOKENIZER}\")")
+                self._index_terms(self.db.execute("SELECT id, text FROM chunks"))  # stores built before the index
+            self.db.commit()
+        self._file_id = self._stat_id()
+
+    def _stat_id(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def is_current(self):
+        """False once the file was removed or replaced (the index was cleared, possibly by another process)"""
+        return self._file_id is not None and self._stat_id() == self._file_id
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def _index_terms(self, rows):
+        self.db.executemany(
+            "INSERT INTO chunk_terms (rowid, terms) VALUES (?, ?)",
+            ((chunk_id, " ".join(lexical_terms(text))) for chunk_id, text in rows)
+        )
+
+    def document_id(self, name):
+        # Not cached: another process may delete the document and its id between calls
+        if name is None:
+            return None
+        with self._write_lock(), self._lock:
+            self.db.execute("INSERT OR IGNORE INTO documents (name) VALUES (?)", (name,))
+            return self.db.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()[0]
+
+    def set_document_hash(self, name, pdf_hash):
+        with self._write_lock(), self._lock:
+            self.db.execute("UPDATE documents SET pdf_hash = ? WHERE id = ?", (pdf_hash, self.document_id(name)))
+            self.db.commit()
+
+    def find_document(self, name_or_hash):
+        """Return (document_id, name) for a document name or PDF hash, or None"""
+        with self._lock:
+            return self.db.execute(
+                "SELECT id, name FROM documents WHERE name = ? OR pdf_hash = ? ORDER BY name = ? DESC LIMIT 1",
+                (name_or_hash, name_or_hash, name_or_hash)
+            ).fetchone()
+
+    def document_chunk_ids(self, document_id):
+        with self._lock:
+            rows = self.db.execute("SELECT id FROM chunks WHERE document_id = ? ORDER BY id", (document_id,)).fetchall()
+        return np.asarray([row[0] for row in rows], dtype=np.int64)
+
+    def list_documents(self):
+        """Document name, hash, chunk count and chunk id range for every indexed document"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT documents.name, documents.pdf_hash, COUNT(chunks.id), MIN(chunks.id), MAX(chunks.id) "
+                "FROM documents JOIN chunks ON chunks.document_id = documents.id "
+                "GROUP BY documents.id ORDER BY documents.name"
+            ).fetchall()
+        return [
+            {"name": name, "pdf_hash": pdf_hash, "chunks": chunks, "first_id": first_id, "last_id": last_id}
+            for name, pdf_hash, chunks, first_id, last_id in rows
+        ]
+
+    def delete_document(self, document_id):
+        """Remove a document and its chunk rows"""
+        with self._write_lock(), self._lock:
+            self.db.execute(
+                "DELETE FROM chunk_terms WHERE rowid IN (SELECT id FROM chunks WHERE document_id = ?)", (document_id,)
+            )
+            self.db.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+            self.db.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            self.db.commit()
+
+    def add_chunks(self, texts, metadatas, index_terms=True):
+        """
+        Insert chunks in one transaction and return their new integer ids.
+        With index_terms=False they stay out of the BM25 index until
+        index_chunk_terms() is called for them.
+        """
+        texts = list(texts)
+        ids = []
+        document_ids = {}  # per call only: ids stay valid while the write lock is held
+        with self._write_lock(), self._lock:
+            for text, metadata in zip(texts, metadatas):
+                metadata = dict(metadata or {})
+                page = metadata.pop("page", None)
+                page_end = metadata.pop("page_end", page)
+                name = metadata.pop("document_name", None)
+                if name not in document_ids:
+                    document_ids[name] = self.document_id(name)
+                document_id = document_ids[name]
+                cursor = self.db.execute(
+                    "INSERT INTO chunks (document_id, page, page_end, text, extra) VALUES (?, ?, ?, ?, ?)",
+                    (document_id, page, page_end, text, json.dumps(metadata) if metadata else None)
+                )
+                ids.append(cursor.lastrowid)
+            if index_terms:
+                self._index_terms(zip(ids, texts))
+            self.db.commit()
+        return ids
+
+    def index_chunk_terms(self, ids):
+        """Add stored chunks to the BM25 index"""
+        ids = [int(i) for i in ids]
+        with self._write_lock(), self._lock:
+            for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+                batch = ids[start:start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                self._index_terms(self.db.execute(f"SELECT id, text FROM chunks WHERE id IN ({placeholders})", batch))
+            self.db.commit()
+
+    def delete_chunks(self, ids):
+        with self._write_lock(), self._lock:
+            self.db.executemany("DELETE FROM chunks WHERE id = ?", ((int(i),) for i in ids))
+            self.db.executemany("DELETE FROM chunk_terms WHERE rowid = ?", ((int(i),) for i in ids))
+            self.db.commit()
+
+    def lexical_search(self, terms, limit, chunk_ids=None):
+        """
+        (chunk_id, bm25 score) of chunks containing every term, best first
+        (lower scores are better), optionally only among `chunk_ids`.
+        """
+        if not terms:
+            return []
+        sql = "SELECT rowid, bm25(chunk_terms) FROM chunk_terms WHERE chunk_terms MATCH ?"
+        params = [match_expression(terms)]
+        if chunk_ids is not None:
+            # one JSON parameter instead of an IN list, which would hit SQLITE_MAX_PARAMS
+            sql += " AND rowid IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps([int(i) for i in chunk_ids]))
+        with self._lock:
+            return self.db.execute(sql + " ORDER BY rank LIMIT ?", params + [limit]).fetchall()
+
+    def get_documents(self, ids):
+        """Materialize {id: Document} for the given chunk ids only"""
+        ids = list({int(i) for i in ids})
+        rows = []
+        with self._lock:
+            for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+                batch = ids[start:start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows += self.db.execute(
+                    "SELECT chunks.id, chunks.page, chunks.page_end, chunks.text, chunks.extra, documents.name "
+                    "FROM chunks LEFT JOIN documents ON documents.id = chunks.document_id "
+                    f"WHERE chunks.id IN ({placeholders})", batch
+                ).fetchall()
+        documents = {}
+        for chunk_id, page, page_end, text, extra, document_name in rows:
+            metadata = json.loads(extra) if extra else {}
+            if page is not None:
+                metadata["page"] = page
+                metadata["page_end"] = page_end
+            if document_name is not None:
+                metadata["document_name"] = document_name
+            metadata["chunk_id"] = chunk_id
+            documents[chunk_id] = Document(page_content=text, metadata=metadata)
+        return documents
+
+    def count(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+def new_delta_index(dimensions):
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dimensions))
+
+def merge_hits(hit_lists, k):
+    """Merge (distances, ids) rows from several indexes into one top-k by distance"""
+    distances = np.concatenate([d for d, _ in hit_lists], axis=1)
+    ids = np.concatenate([i for _, i in hit_lists], axis=1)
+    order = np.argsort(distances, axis=1, kind="stable")
+    merged_distances = np.full((len(ids), k), np.inf, dtype=np.float32)
+    merged_ids = np.full((len(ids), k), -1, dtype=np.int64)
+    for row in range(len(ids)):
+        taken = 0
+        for col in order[row]:
+            chunk_id = ids[row, col]
+            if chunk_id < 0:
+                continue
+            merged_distances[row, taken] = distances[row, col]
+            merged_ids[row, taken] = chunk_id
+            taken += 1
+            if taken == k:
+                break
+    return merged_distances, merged_ids
+
+class TenderVectorStore(VectorStore):
+    """
+    LangChain vector store over a read-only (usually memory-mapped) base index,
+    a small in-memory delta index for segments not yet compacted, and a
+    SqliteDocstore. Both indexes hold chunk ids, not positions.
+    """
+
+    def __init__(self, embedding, docstore, dimensions, base_index=None, delta_index=None):
+        self.embedding = embedding
+        self.docstore = docstore
+        self.dimensions = dimensions
+        self.base_index = base_index
+        self.delta_index = delta_index if delta_index is not None else new_delta_index(dimensions)
+        self.deleted_ids = np.zeros(0, dtype=np.int64)
+        self._base_selector = None
+        self.allowed_ids = None  # chunk ids a restrict_to() view searches; None = all
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @property
+    def ntotal(self):
+        return (self.base_index.ntotal if self.base_index is not None else 0) + self.delta_index.ntotal
+
+    def clone(self):
+        """Copy sharing the base index and docstore; only the small delta is duplicated"""
+        clone = TenderVectorStore(
+            self.embedding, self.docstore, self.dimensions, self.base_index, faiss.clone_index(self.delta_index)
+        )
+        clone.deleted_ids, clone._base_selector = self.deleted_ids, self._base_selector
+        clone.allowed_ids = self.allowed_ids
+        return clone
+
+    def add_vectors(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(self.deleted_ids):
+            keep = ~np.isin(ids, self.deleted_ids)
+            ids, vectors = ids[keep], vectors[keep]
+        self.delta_index.add_with_ids(vectors, ids)
+
+    def set_deleted(self, ids):
+        """
+        Hide deleted chunk ids: they are removed from the delta index and
+        filtered out of base searches until compaction drops them from disk.
+        """
+        self.deleted_ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if len(self.deleted_ids):
+            self.delta_index.remove_ids(self.deleted_ids)
+            batch = faiss.IDSelectorBatch(self.deleted_ids)
+            # keep the batch referenced; IDSelectorNot does not own it
+            self._base_selector = (faiss.IDSelectorNot(batch), batch)
+        else:
+            self._base_selector = None
+
+    def restrict_to(self, chunk_ids):
+        """
+        A read-only view of this store that only searches `chunk_ids`.
+
+        Flat and HNSW vectors are copied into a small exact index, so a search
+        costs O(len(chunk_ids)) however large the corpus grows. IVF bases cannot
+        reconstruct by id, so they keep the base and filter it with an IDSelector,
+        which still only scans `nprobe` lists.
+        """
+        ids = np.setdiff1d(np.asarray(chunk_ids, dtype=np.int64), self.deleted_ids)
+        view = TenderVectorStore(self.embedding, self.docstore, self.dimensions)
+        view.allowed_ids = ids
+        _, delta_ids = unwrap_ids(self.delta_index)
+        in_delta = ids[np.isin(ids, delta_ids)]
+        if len(in_delta):
+            view.add_vectors(in_delta, self.delta_index.reconstruct_batch(in_delta))
+        if self.base_index is not None and self.base_index.ntotal:
+            _, base_ids = unwrap_ids(self.base_index)
+            in_base = ids[np.isin(ids, base_ids)]
+            if not len(in_base):
+                return view
+            if index_type_of(self.base_index) in ("flat", "hnsw"):
+                view.add_vectors(in_base, self.base_index.reconstruct_batch(in_base))
+            else:
+                view.base_index = self.base_index
+                batch = faiss.IDSelectorBatch(in_base)
+                view._base_selector = (batch, batch)
+        return view
+
+    def search_ids(self, vectors, k):
+        """Return (distances, ids) arrays of shape (len(vectors), k); missing hits are -1"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        hit_lists = []
+        if self.base_index is not None and self.base_index.ntotal:
+            if self._base_selector is None:
+                hit_lists.append(self.base_index.search(vectors, k))
+            else:
+                params = search_params(self.base_index, self._base_selector[0])
+                hit_lists.append(self.base_index.search(vectors, k, params=params))
+        if self.delta_index.ntotal:
+            hit_lists.append(self.delta_index.search(vectors, k))
+        if not hit_lists:
+            return (np.full((len(vectors), k), np.inf, dtype=np.float32),
+                    np.full((len(vectors), k), -1, dtype=np.int64))
+        if len(hit_lists) == 1:
+            return hit_lists[0]
+        return merge_hits(hit_lists, k)
+
+    def documents_for_ids(self, ids_row, distances_row, documents=None):
+        if documents is None:
+            documents = self.docstore.get_documents([i for i in ids_row if i >= 0])
+        return [
+            (documents[int(i)], float(distance))
+            for i, distance in zip(ids_row, distances_row)
+            if i >= 0 and int(i) in documents
+        ]
+
+    def lexical_search(self, terms, k: int = 4) -> List[Tuple[Document, float]]:
+        """Top-k (Document, bm25 score) of chunks containing every term, within this store's scope"""
+        hits = self.docstore.lexical_search(terms, k, self.allowed_ids)
+        documents = self.docstore.get_documents([chunk_id for chunk_id, _ in hits])
+        return [(documents[chunk_id], score) for chunk_id, score in hits if chunk_id in documents]
+
+    def similarity_search_by_vectors(self, embeddings, k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """Top-k (Document, distance) lists for many query vectors: one search, one docstore read"""
+        distances, ids = self.search_ids(np.asarray(embeddings), k)
+        documents = self.docstore.get_documents(ids[ids >= 0])
+        return [self.documents_for_ids(ids[row], distances[row], documents) for row in range(len(ids))]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        distances, ids = self.search_ids(np.asarray([embedding]), k)
+        return self.documents_for_ids(ids[0], distances[0])
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def add_texts(self, texts, metadatas: Optional[List[dict]] = None, **kwargs) -> List[str]:
+        """
+        Embed texts and commit them to this store's index directory as one
+        segment, like an ingest. Loaded handles are shared and never modified:
+        the texts are searchable from handles loaded or refreshed afterwards
+        (faiss_store.get_faiss_vectorstore()), not from this one.
+        """
+        from faiss_segments import SegmentWriter
+
+        if self.allowed_ids is not None:
+            raise ValueError("Cannot add texts to a restrict_to() view; add them to the full store")
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        writer = SegmentWriter(os.path.dirname(self.docstore.path))
+        try:
+            ids = writer.append(texts, metadatas, vectors)
+            writer.commit()
+        except Exception:
+            writer.abort()
+            raise
+        return [str(i) for i in ids]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise ValueError(
+            "TenderVectorStore needs an index directory; open it with faiss_store.create_faiss_vectorstore() "
+            "and call add_texts()"
+        )
@@ -0,0 +1,160 @@
+import time
+from xml.etree.ElementTree import iterparse
+import openpyxl
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.worksheet.cell_range import CellRange
+
+from model_config import EXCEL_STREAMING_MIN_ROWS
+
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+def read_merged_ranges(wb, ws):
+    """
+    Merged ranges of a read-only worksheet, as (min_col, min_row, max_col, max_row).
+    Read-only sheets do not expose them, so the <mergeCell> tags are streamed
+    from the sheet XML.
+    """
+    ranges = []
+    with wb._archive.open(ws._worksheet_path) as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{SHEET_NS}mergeCell":
+                ranges.append(range_boundaries(element.get("ref")))
+            element.clear()
+    return ranges
+
+def build_merged_map(ranges):
+    """(row, col) of every covered cell -> (row, col) of its range's top-left cell"""
+    merged_map = {}
+    for min_col, min_row, max_col, max_row in ranges:
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                if (row, col) != (min_row, min_col):
+                    merged_map[(row, col)] = (min_row, min_col)
+    return merged_map
+
+def cell_text(value):
+    """Mirror pd.read_excel(...).astype(str): empty cells read as "nan" """
+    return "nan" if value is None else str(value)
+
+class ExcelTemplate:
+    """
+    A fill template parsed once: the active sheet's "Item Description" column
+    and a merged-cell lookup table for writes.
+
+    Sheets of at least EXCEL_STREAMING_MIN_ROWS rows (or streaming=True) are
+    read with openpyxl's read-only parser and written back row by row through
+    a write-only workbook. That keeps memory flat but saves values and merged
+    ranges only: cell styles and column widths are not copied. `timings` holds
+    milliseconds per stage.
+    """
+
+    def __init__(self, path, query_column="Item Description", streaming=None):
+        self.path = path
+        self.timings = {}
+        started = time.perf_counter()
+        if streaming is None:
+            probe = openpyxl.load_workbook(path, read_only=True)
+            streaming = bool(EXCEL_STREAMING_MIN_ROWS) and (probe.active.max_row or 0) >= EXCEL_STREAMING_MIN_ROWS
+            probe.close()
+        self.streaming = streaming
+        self.wb = openpyxl.load_workbook(path, read_only=streaming)
+        self.ws = self.wb.active
+        self.pending = {}
+        self.extra_sheets = []
+
+        rows = self.ws.iter_rows(values_only=True)
+        header = next(rows, ())
+        if query_column not in header:
+            raise KeyError(query_column)
+        column = header.index(query_column)
+        values = []
+        last_non_empty = -1
+        for row in rows:
+            if any(value is not None for value in row):
+                last_non_empty = len(values)
+            values.append(row[column] if column < len(row) else None)
+        # pandas drops trailing empty rows; keep the same row count it did
+        self.queries = [cell_text(value) for value in values[:last_non_empty + 1]]
+        self.timings["load"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        if streaming:
+            ranges = read_merged_ranges(self.wb, self.ws)
+        else:
+            ranges = [merged.bounds for merged in self.ws.merged_cells.ranges]
+        self.merged_ranges = ranges
+        self.merged_map = build_merged_map(ranges)
+        self.timings["merged_map"] = (time.perf_counter() - started) * 1000
+        self.timings["write"] = 0.0
+
+    def set_value(self, row, col, value):
+        """Write a cell; writes into a merged range go to its top-left cell"""
+        started = time.perf_counter()
+        row, col = self.merged_map.get((row, col), (row, col))
+        if self.streaming:
+            self.pending[(row, col)] = value
+        else:
+            self.ws.cell(row=row, column=col).value = value
+        self.timings["write"] += (time.perf_counter() - started) * 1000
+
+    def add_sheet(self, title, rows):
+        """Add (or replace) a sheet holding `rows`, e.g. per-row timings"""
+        if not self.streaming:
+            if title in self.wb.sheetnames:
+                del self.wb[title]
+            sheet = self.wb.create_sheet(title)
+            for row in rows:
+                sheet.append(row)
+        else:
+            self.extra_sheets = [(name, data) for name, data in self.extra_sheets if name != title]
+            self.extra_sheets.append((title, list(rows)))
+
+    def save(self, out_path):
+        started = time.perf_counter()
+        if not self.streaming:
+            self.wb.save(out_path)
+        else:
+            self._save_streaming(out_path)
+        self.timings["save"] = (time.perf_counter() - started) * 1000
+        return out_path
+
+    def _save_streaming(self, out_path):
+        by_row = {}
+        for (row, col), value in self.pending.items():
+            by_row.setdefault(row, {})[col] = value
+
+        def with_pending(row_number, row):
+            for col, value in by_row.get(row_number, {}).items():
+                row.extend([None] * (col - len(row)))
+                row[col - 1] = value
+            return row
+
+        out = openpyxl.Workbook(write_only=True)
+        extra_titles = {title for title, _ in self.extra_sheets}
+        for sheet in self.wb.worksheets:
+            if sheet.title in extra_titles:
+                continue
+            out_sheet = out.create_sheet(sheet.title)
+            if sheet.title != self.ws.title:
+                for row in sheet.iter_rows(values_only=True):
+                    out_sheet.append(list(row))
+                continue
+            row_number = 0
+            for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                out_sheet.append(with_pending(row_number, list(row)))
+            for row_number in range(row_number + 1, max(by_row, default=0) + 1):
+                out_sheet.append(with_pending(row_number, []))
+            # MultiCellRange.add checks overlap against every range (quadratic); these came from a valid sheet
+            out_sheet.merged_cells.ranges.update(
+                CellRange(min_col=min_col, min_row=min_row, max_col=max_col, max_row=max_row)
+                for min_col, min_row, max_col, max_row in self.merged_ranges
+            )
+        for title, rows in self.extra_sheets:
+            out_sheet = out.create_sheet(title)
+            for row in rows:
+                out_sheet.append(row)
+        out.save(out_path)
+
+    def close(self):
+        if self.streaming:
+            self.wb.close()